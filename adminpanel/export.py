@@ -0,0 +1,125 @@
+"""
+Streaming export of student profiles as CSV or JSONL.
+
+Rows come from a chunked .iterator() with the achievements prefetched per
+chunk, so memory stays flat however many students there are. JSONL records
+use the same keys as profiles' import_profiles command, and CSV cells use
+its "|" and "::" separators, so an export can be re-imported.
+"""
+import csv
+import json
+from datetime import datetime, time
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from profiles.management.commands.import_profiles import LIST_SEPARATOR, DETAIL_SEPARATOR
+from profiles.models import Student
+
+EXPORT_CHUNK_SIZE = 500
+
+CSV_COLUMNS = [
+    'id', 'username', 'email', 'first_name', 'last_name', 'bio', 'is_public', 'updated_at',
+    'skills', 'projects', 'awards', 'portfolio', 'total_endorsements',
+]
+
+
+def parse_since(value):
+    """ISO date or datetime, None if invalid; naive values are taken in the current time zone."""
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            if day is None:
+                return None
+            parsed = datetime.combine(day, time.min)
+    except ValueError:
+        return None
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def export_queryset(public_only=False, updated_since=None):
+    students = Student.objects.select_related('user', 'stats').prefetch_related(
+        'skills', 'projects', 'awards', 'portfolio',
+    ).order_by('pk')
+    if public_only:
+        students = students.filter(is_public=True)
+    if updated_since is not None:
+        students = students.filter(updated_at__gte=updated_since)
+    return students
+
+
+def student_record(student):
+    user = student.user
+    stats = getattr(student, 'stats', None)
+    skills = list(student.skills.all())
+    return {
+        'id': student.pk,
+        'username': user.username,
+        'email': user.email,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'bio': student.bio,
+        'is_public': student.is_public,
+        'updated_at': student.updated_at.isoformat(),
+        'skills': [skill.name for skill in skills],
+        'skill_endorsements': {skill.name: skill.endorsement_count for skill in skills},
+        'projects': [{'title': p.title, 'description': p.description} for p in student.projects.all()],
+        'awards': [{'title': a.title, 'description': a.description} for a in student.awards.all()],
+        'portfolio': [
+            {
+                'title': item.title,
+                'url': item.url or '',
+                'file': item.file.name if item.file else '',
+                'screenshot': item.screenshot.name if item.screenshot else '',
+            }
+            for item in student.portfolio.all()
+        ],
+        'total_endorsements': stats.total_endorsements if stats else 0,
+    }
+
+
+def iter_records(students):
+    for student in students.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield student_record(student)
+
+
+def iter_jsonl(students):
+    for record in iter_records(students):
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to the caller."""
+
+    def write(self, value):
+        return value
+
+
+def _joined(entries, detail_key):
+    return LIST_SEPARATOR.join(
+        f'{e["title"]}{DETAIL_SEPARATOR}{e[detail_key]}' if e[detail_key] else e['title'] for e in entries
+    )
+
+
+def iter_csv(students):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for record in iter_records(students):
+        yield writer.writerow([
+            record['id'], record['username'], record['email'], record['first_name'], record['last_name'],
+            record['bio'], record['is_public'], record['updated_at'],
+            LIST_SEPARATOR.join(record['skills']),
+            _joined(record['projects'], 'description'),
+            _joined(record['awards'], 'description'),
+            _joined(record['portfolio'], 'url'),
+            record['total_endorsements'],
+        ])
+
+
+FORMATS = {
+    'csv': (iter_csv, 'text/csv'),
+    'jsonl': (iter_jsonl, 'application/x-ndjson'),
+}
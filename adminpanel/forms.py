@@ -2,6 +2,8 @@ from django import forms
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.models import User
 
+from profiles.models import Student
+
 class AdminSignUpForm(UserCreationForm):
     email = forms.EmailField(required=True)
 
@@ -16,3 +18,15 @@ class AdminSignUpForm(UserCreationForm):
         if commit:
             user.save()
         return user
+
+
+class BulkActionForm(forms.Form):
+    ACTIONS = [
+        ('make_public', 'Make public'),
+        ('make_private', 'Make private'),
+        ('reset_endorsements', 'Reset endorsements'),
+        ('delete', 'Delete'),
+    ]
+    action = forms.ChoiceField(choices=ACTIONS)
+    # Validated in one query; only the ids are loaded.
+    students = forms.ModelMultipleChoiceField(queryset=Student.objects.only('pk'))
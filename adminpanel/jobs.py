@@ -0,0 +1,97 @@
+"""
+Background worker for bulk student deletions.
+
+A DeleteJob row holds the ids to delete and how far the deletion got.
+Each process runs at most one worker thread, started when a job is
+queued; it claims pending jobs one at a time and deletes their students
+PROFILES_BULK_DELETE_CHUNK at a time through profiles.bulk.delete_students,
+one transaction per chunk, saving its progress after each. A job left
+running by a process that died resumes from its last chunk with
+`manage.py run_delete_jobs`.
+
+With PROFILES_BULK_DELETE_WORKER off, jobs run inside the request that
+queued them.
+"""
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from profiles.bulk import delete_students
+
+from .models import DeleteJob
+
+logger = logging.getLogger(__name__)
+
+
+def chunk_size():
+    return getattr(settings, 'PROFILES_BULK_DELETE_CHUNK', 100)
+
+
+def claim(job_id, statuses=(DeleteJob.PENDING,)):
+    """Mark the job running if it is in one of `statuses`; True if this caller now owns it."""
+    return bool(DeleteJob.objects.filter(pk=job_id, status__in=statuses).update(status=DeleteJob.RUNNING))
+
+
+def run(job):
+    """Delete the rest of the job's students chunk by chunk, recording progress. The job must be claimed."""
+    try:
+        size = chunk_size()
+        while job.processed < job.total:
+            chunk = job.student_ids[job.processed:job.processed + size]
+            deleted, removed = delete_students(chunk)
+            job.processed += len(chunk)
+            job.deleted += deleted
+            job.files_removed += removed
+            job.save(update_fields=['processed', 'deleted', 'files_removed', 'updated_at'])
+        job.status = DeleteJob.DONE
+    except Exception as exc:
+        logger.exception('Delete job %s failed after %s of %s students.', job.pk, job.processed, job.total)
+        job.status = DeleteJob.FAILED
+        job.error = str(exc)
+    job.save(update_fields=['status', 'error', 'updated_at'])
+    return job
+
+
+class Worker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def wake(self):
+        """Start the worker thread unless it is already running."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='adminpanel-delete-worker', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        try:
+            while True:
+                with self._lock:
+                    job = DeleteJob.objects.filter(status=DeleteJob.PENDING).order_by('pk').first()
+                    if job is None:
+                        self._thread = None
+                        return
+                if claim(job.pk):
+                    run(job)
+        except Exception:
+            logger.exception('Delete worker stopped.')
+            with self._lock:
+                self._thread = None
+        finally:
+            connections.close_all()
+
+
+worker = Worker()
+
+
+def queue(student_ids, requested_by=None):
+    """Create a job deleting these students and start it once the current transaction commits."""
+    job = DeleteJob.objects.create(student_ids=list(student_ids), requested_by=requested_by)
+    if getattr(settings, 'PROFILES_BULK_DELETE_WORKER', True):
+        transaction.on_commit(worker.wake)
+    elif claim(job.pk):
+        run(job)
+    return job
@@ -0,0 +1,116 @@
+"""
+The staff student list: keyset pages, prefix search and stats sorts.
+
+Every row's counters come from its StudentStats row, joined into the page
+query, so a page is one SELECT however many students it shows.
+
+?q= matches the start of the username or email, ignoring ASCII case. The
+match is a range on lower(username) / lower(email), which SQLite answers
+from the expression indexes added by adminpanel's 0002 migration; LIKE
+'abc%' would scan auth_user, as its indexes use the BINARY collation.
+SQLite's lower() only folds A-Z, so the prefix is lowered the same way.
+
+The skills, endorsements and projects sorts read StudentStats' stats_all_*
+indexes, which unlike the leaderboard's partial ones include private
+students.
+
+The total is counted up to PROFILES_ADMIN_COUNT_LIMIT rows. Past that the
+unfiltered list shows the row count SQLite's ANALYZE recorded for the
+student table, and a search shows "more than" the limit.
+"""
+import string
+import sys
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F, Q
+from django.db.models.functions import Lower
+
+from profiles.models import Student
+
+ORDERINGS = {
+    'username': ('username',),
+    'skills': ('-num_skills', 'stats_id'),
+    'endorsements': ('-total_endorsements', 'stats_id'),
+    'projects': ('-num_projects', 'stats_id'),
+}
+
+
+# What SQLite's lower() does: A-Z only, other characters unchanged.
+ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def count_limit():
+    return getattr(settings, 'PROFILES_ADMIN_COUNT_LIMIT', 10000)
+
+
+def prefix_range(prefix):
+    """
+    (low, high) such that low <= s < high exactly when s starts with `prefix`.
+    high is None when no string bounds it, as for a prefix of U+10FFFF only.
+    """
+    # Trailing U+10FFFF has no successor; the next string up changes an earlier character.
+    stem = prefix.rstrip(chr(sys.maxunicode))
+    if not stem:
+        return prefix, None
+    successor = ord(stem[-1]) + 1
+    if 0xD800 <= successor <= 0xDFFF:
+        # Surrogates cannot be encoded for SQLite; nothing sorts between them and U+E000.
+        successor = 0xE000
+    return prefix, stem[:-1] + chr(successor)
+
+
+def prefix_filter(prefix):
+    low, high = prefix_range(prefix.translate(ASCII_LOWER))
+    username = Q(username_lower__gte=low)
+    email = Q(email_lower__gte=low)
+    if high is not None:
+        username &= Q(username_lower__lt=high)
+        email &= Q(email_lower__lt=high)
+    return username | email
+
+
+def students(sort='username', prefix=''):
+    """Students with their counters for one sort, matching `prefix` if given."""
+    queryset = Student.objects.select_related('user').annotate(
+        username=F('user__username'),
+        num_skills=F('stats__num_skills'),
+        num_projects=F('stats__num_projects'),
+        total_endorsements=F('stats__total_endorsements'),
+        stats_id=F('stats__pk'),
+    )
+    if sort != 'username':
+        # Inner join, so the StudentStats index can drive the scan.
+        queryset = queryset.filter(stats__isnull=False)
+    if prefix:
+        queryset = queryset.alias(
+            username_lower=Lower('user__username'),
+            email_lower=Lower('user__email'),
+        ).filter(prefix_filter(prefix))
+    return queryset.order_by(*ORDERINGS[sort])
+
+
+def _analyzed_rows(model, using):
+    # Rows per index recorded by ANALYZE; the largest is the table's row count.
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+        if cursor.fetchone() is None:
+            return None
+        cursor.execute('SELECT MAX(CAST(stat AS INTEGER)) FROM sqlite_stat1 WHERE tbl = %s', [model._meta.db_table])
+        return cursor.fetchone()[0]
+
+
+def count(queryset, filtered):
+    """(total, exact) for the list; total is None when only "more than the limit" is known."""
+    limit = count_limit()
+    total = queryset.order_by().values('pk')[:limit + 1].count()
+    if total <= limit:
+        return total, True
+    if not filtered:
+        estimate = _analyzed_rows(queryset.model, queryset.db)
+        if estimate and estimate > limit:
+            return estimate, False
+    return None, False
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from adminpanel.export import FORMATS, export_queryset, parse_since
+
+
+class Command(BaseCommand):
+    help = 'Stream every student with skills, projects, awards, portfolio and endorsement totals as CSV or JSONL.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(FORMATS), default='jsonl')
+        parser.add_argument('--public-only', action='store_true', help='Only export public profiles.')
+        parser.add_argument('--since', help='Only students updated at or after this ISO date/datetime.')
+        parser.add_argument('--output', '-o', help='Write to this file instead of stdout.')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = parse_since(options['since'])
+            if since is None:
+                raise CommandError(f'Invalid --since value: {options["since"]}')
+
+        render, _ = FORMATS[options['format']]
+        students = export_queryset(public_only=options['public_only'], updated_since=since)
+        if not options['output']:
+            for chunk in render(students):
+                self.stdout.write(chunk, ending='')
+            return
+        with open(options['output'], 'w', newline='', encoding='utf-8') as out:
+            for chunk in render(students):
+                out.write(chunk)
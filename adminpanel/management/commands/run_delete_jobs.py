@@ -0,0 +1,30 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from adminpanel.jobs import claim, run
+from adminpanel.models import DeleteJob
+
+
+class Command(BaseCommand):
+    help = (
+        'Run queued bulk student deletions in this process, and resume ones '
+        'whose worker stopped (running, but without progress for --stale seconds).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stale', type=int, default=300, help='Resume running jobs idle this many seconds (default: 300).')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(seconds=options['stale'])
+        jobs = DeleteJob.objects.filter(status=DeleteJob.PENDING) | DeleteJob.objects.filter(status=DeleteJob.RUNNING, updated_at__lt=cutoff)
+        ran = 0
+        for job in jobs.order_by('pk'):
+            statuses = (DeleteJob.PENDING,) if job.status == DeleteJob.PENDING else (DeleteJob.RUNNING,)
+            if not claim(job.pk, statuses):
+                continue  # Taken by a worker meanwhile.
+            job = run(job)
+            ran += 1
+            self.stdout.write(f'Job {job.pk}: {job.status}, {job.deleted} students and {job.files_removed} files deleted.')
+        self.stdout.write(self.style.SUCCESS(f'Ran {ran} delete jobs.'))
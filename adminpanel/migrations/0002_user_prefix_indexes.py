@@ -0,0 +1,26 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:02
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Expression indexes on auth_user for the staff list's prefix search
+    (adminpanel.listing). auth.User can't declare them, so they are SQL.
+    """
+
+    dependencies = [
+        ('adminpanel', '0001_initial'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX adminpanel_user_username_lower_idx ON auth_user (LOWER(username));',
+            'DROP INDEX adminpanel_user_username_lower_idx;',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX adminpanel_user_email_lower_idx ON auth_user (LOWER(email));',
+            'DROP INDEX adminpanel_user_email_lower_idx;',
+        ),
+    ]
@@ -1,3 +1,45 @@
+from django.conf import settings
 from django.db import models
 
-# Create your models here.
+
+class DeleteJob(models.Model):
+    """A bulk student deletion, run in chunks by adminpanel.jobs."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    student_ids = models.JSONField()
+    # Ids handled so far; the next chunk starts here, also after a restart.
+    processed = models.PositiveIntegerField(default=0)
+    deleted = models.PositiveIntegerField(default=0)
+    files_removed = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    error = models.TextField(blank=True)
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ('-pk',)
+
+    def __str__(self):
+        return f'Delete {len(self.student_ids)} students ({self.status})'
+
+    @property
+    def total(self):
+        return len(self.student_ids)
+
+    @property
+    def percent(self):
+        return 100 * self.processed // self.total if self.total else 100
+
+    @property
+    def finished(self):
+        return self.status in (self.DONE, self.FAILED)
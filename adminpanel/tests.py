@@ -1,3 +1,236 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from profiles import bulk
+from profiles.models import Endorsement, PortfolioItem, Project, Skill, SkillTag, Student, StudentStats
+from profiles.storage import portfolio_storage
+from profiles.synthetic import generate
+
+from . import listing
+from .models import DeleteJob
+
+# Most queries each staff page may run, session and user lookups included.
+QUERY_BUDGETS = {
+    'dashboard': 5,
+    'student_list': 4,
+    'student_list_search': 4,
+    'student_list_by_skills': 4,
+    'student_detail': 7,
+    'export_csv': 7,
+    'export_jsonl': 7,
+}
+
+
+class AdminQueryBudgetTests(TestCase):
+    """Staff pages must not run more queries as the number of students grows."""
+
+    def setUp(self):
+        staff = get_user_model().objects.create_user('staff', password='x', is_staff=True)
+        self.client.force_login(staff)
+
+    def requests(self):
+        student = Student.objects.order_by('pk').first()
+        export = reverse('adminpanel:export_students')
+        return {
+            'dashboard': lambda: self.client.get(reverse('adminpanel:dashboard')),
+            'student_list': lambda: self.client.get(reverse('adminpanel:student_list')),
+            'student_list_search': lambda: self.client.get(reverse('adminpanel:student_list'), {'q': 'S'}),
+            'student_list_by_skills': lambda: self.client.get(reverse('adminpanel:student_list'), {'sort': 'skills'}),
+            'student_detail': lambda: self.client.get(reverse('adminpanel:student_detail', args=[student.pk])),
+            # Streamed: the queries run while the body is consumed.
+            'export_csv': lambda: b''.join(self.client.get(export, {'format': 'csv'}).streaming_content),
+            'export_jsonl': lambda: b''.join(self.client.get(export, {'format': 'jsonl'}).streaming_content),
+        }
+
+    def test_query_budgets(self):
+        counts = {}
+        created = 0
+        for size in (20, 200):
+            generate(size - created, seed=size)
+            created = size
+            for name, request in self.requests().items():
+                with CaptureQueriesContext(connection) as queries:
+                    request()
+                with self.subTest(page=name, students=size):
+                    self.assertLessEqual(len(queries), QUERY_BUDGETS[name])
+                counts.setdefault(name, set()).add(len(queries))
+        for name, seen in counts.items():
+            with self.subTest(page=name):
+                self.assertEqual(len(seen), 1, f'{name} query count grows with the dataset: {sorted(seen)}')
+
+
+class ExportRoundTripTests(TestCase):
+    """What export_profiles writes, import_profiles reads back unchanged."""
+
+    def setUp(self):
+        generate(15, seed=4)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def export(self, fmt='jsonl', *args):
+        path = os.path.join(self.directory, f'export-{len(os.listdir(self.directory))}.{fmt}')
+        call_command('export_profiles', f'--format={fmt}', '-o', path, *args)
+        return path
+
+    def records(self, path):
+        with open(path, encoding='utf-8') as handle:
+            records = [json.loads(line) for line in handle]
+        # Ids, timestamps, endorsements and uploaded files are not imported.
+        return {
+            record['username']: {
+                'email': record['email'], 'bio': record['bio'], 'is_public': record['is_public'],
+                'skills': sorted(record['skills']),
+                'projects': sorted((project['title'], project['description']) for project in record['projects']),
+                'awards': sorted((award['title'], award['description']) for award in record['awards']),
+                'portfolio': sorted((item['title'], item['url']) for item in record['portfolio']),
+            }
+            for record in records
+        }
+
+    def reimport(self, path):
+        get_user_model().objects.filter(student_profile__isnull=False).delete()
+        call_command('import_profiles', path, stdout=StringIO())
+
+    def test_jsonl_round_trip(self):
+        path = self.export()
+        before = self.records(path)
+        self.reimport(path)
+        self.assertEqual(self.records(self.export()), before)
+
+    def test_csv_round_trip(self):
+        before = self.records(self.export())
+        self.reimport(self.export('csv'))
+        self.assertEqual(self.records(self.export()), before)
+
+    def test_since(self):
+        student = Student.objects.order_by('pk').first()
+        cutoff = Student.objects.order_by('-updated_at').values_list('updated_at', flat=True).first() + timedelta(seconds=1)
+        Student.objects.filter(pk=student.pk).update(updated_at=cutoff)
+        path = self.export('jsonl', f'--since={cutoff.isoformat()}')
+        self.assertEqual(list(self.records(path)), [student.user.username])
+
+
+@override_settings(PROFILES_BULK_DELETE_WORKER=False, PROFILES_BULK_DELETE_CHUNK=1)
+class BulkDeleteJobTests(TestCase):
+    """
+    A bulk deletion job removes the students, their tag counts and the blobs
+    only they used, with the default grace period for blobs in force.
+    """
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = override_settings(MEDIA_ROOT=media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        staff = get_user_model().objects.create_user('staff', password='x', is_staff=True)
+        self.client.force_login(staff)
+        self.students = {}
+        for username, content in (('ada', b'ada only'), ('bob', b'shared'), ('cy', b'shared')):
+            user = get_user_model().objects.create_user(username, password='x')
+            student = Student.objects.create(user=user, is_public=True)
+            Skill.objects.create(student=student, name='Python')
+            with self.captureOnCommitCallbacks(execute=True):
+                item = PortfolioItem.objects.create(student=student, title='Report', file=ContentFile(content, name='report.pdf'))
+            self.students[username] = (student, item.file.name)
+
+    def test_delete_job(self):
+        (ada, ada_blob), (bob, shared_blob), (cy, _) = self.students.values()
+        response = self.client.post(reverse('adminpanel:bulk_action'), {'action': 'delete', 'students': [ada.pk, bob.pk]})
+        job = DeleteJob.objects.get()
+        self.assertRedirects(response, reverse('adminpanel:delete_job', args=[job.pk]))
+        self.assertEqual((job.status, job.processed, job.deleted, job.files_removed), (DeleteJob.DONE, 2, 2, 1))
+        self.assertEqual(list(Student.objects.values_list('pk', flat=True)), [cy.pk])
+        self.assertEqual(SkillTag.objects.get(name='Python').student_count, 1)
+        self.assertFalse(portfolio_storage.exists(ada_blob))
+        self.assertTrue(portfolio_storage.exists(shared_blob))
+
+        progress = self.client.get(reverse('adminpanel:delete_job', args=[job.pk]), {'format': 'json'}).json()
+        self.assertEqual((progress['status'], progress['percent']), (DeleteJob.DONE, 100))
+
+    def test_blob_reused_meanwhile_stays(self):
+        ada, ada_blob = self.students['ada']
+        # As if an upload of the same file reused the blob while the deletion ran.
+        later = time.time() + 60
+        os.utime(portfolio_storage.path(ada_blob), (later, later))
+        self.assertEqual(bulk.delete_students([ada.pk]), (1, 0))
+        self.assertTrue(portfolio_storage.exists(ada_blob))
+
+    def test_queries_do_not_grow_with_rows(self):
+        ada, _ = self.students['ada']
+        bob, _ = self.students['bob']
+        for i in range(20):
+            skill = Skill.objects.create(student=bob, name=f'Skill {i}')
+            Endorsement.objects.create(skill=skill, session_key=f's{i}')
+            Project.objects.create(student=bob, title=f'Project {i}')
+        counts = []
+        for student in (ada, bob):
+            with CaptureQueriesContext(connection) as queries:
+                bulk.delete_students([student.pk])
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertFalse(Skill.objects.filter(student__in=[ada, bob]).exists())
+        self.assertFalse(Endorsement.objects.exists())
+
+
+class StudentListTests(TestCase):
+    """The staff list's prefix search and stats sorts."""
+
+    def setUp(self):
+        staff = get_user_model().objects.create_user('staff', password='x', is_staff=True)
+        self.client.force_login(staff)
+
+    def make(self, username, email=''):
+        user = get_user_model().objects.create_user(username, email=email, password='x')
+        return Student.objects.create(user=user)
+
+    def usernames(self, prefix):
+        return sorted(student.username for student in listing.students(prefix=prefix))
+
+    def test_prefix_range(self):
+        self.assertEqual(listing.prefix_range('ab'), ('ab', 'ac'))
+        self.assertEqual(listing.prefix_range('a\U0010ffff'), ('a\U0010ffff', 'b'))
+        self.assertEqual(listing.prefix_range('\U0010ffff\U0010ffff'), ('\U0010ffff\U0010ffff', None))
+        self.assertEqual(listing.prefix_range('\ud7ff'), ('\ud7ff', '\ue000'))
+
+    def test_prefix_search(self):
+        for username, email in (('Ada', ''), ('adam', ''), ('bob', 'ADA.B@example.com'), ('Émile', ''), ('émilie', ''), ('z\U0010ffff', '')):
+            self.make(username, email)
+        self.assertEqual(self.usernames('AD'), ['Ada', 'adam', 'bob'])
+        # SQLite's lower() folds ASCII only, so É and é stay distinct.
+        self.assertEqual(self.usernames('É'), ['Émile'])
+        self.assertEqual(self.usernames('é'), ['émilie'])
+        self.assertEqual(self.usernames('z\U0010ffff'), ['z\U0010ffff'])
+        self.assertEqual(self.usernames('\U0010ffff'), [])
+
+    def test_search_view_at_top_of_unicode(self):
+        self.make('z\U0010ffff')
+        response = self.client.get(reverse('adminpanel:student_list'), {'q': 'Z\U0010ffff'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([student.username for student in response.context['students']], ['z\U0010ffff'])
+
+    def test_stats_sorts(self):
+        generate(30, seed=7)
+        fields = {'skills': 'num_skills', 'endorsements': 'total_endorsements', 'projects': 'num_projects'}
+        for sort, field in fields.items():
+            rows = [(getattr(student, field), student.pk) for student in listing.students(sort)]
+            with self.subTest(sort=sort):
+                self.assertEqual(rows, sorted(rows, key=lambda row: (-row[0], row[1])))
+                expected = StudentStats.objects.order_by(f'-{field}', 'pk').values_list(field, 'pk')
+                self.assertEqual(rows, list(expected))
+            response = self.client.get(reverse('adminpanel:student_list'), {'sort': sort})
+            page = [student.pk for student in response.context['students']]
+            self.assertEqual(page, [pk for _, pk in rows[:len(page)]])
@@ -12,6 +12,10 @@ urlpatterns = [
 
     # Admin dashboard
     path('', views.dashboard, name='dashboard'),  # /adminpanel/
-    path('students/', views.student_list, name='student_list'),
+    path('students/', views.StudentListView.as_view(), name='student_list'),
     path('student/<int:pk>/', views.student_detail, name='student_detail'),
+    path('students/bulk/', views.bulk_action, name='bulk_action'),
+    path('jobs/<int:pk>/', views.delete_job, name='delete_job'),
+    path('students/export/', views.export_students, name='export_students'),
+    path('metrics/', views.request_metrics, name='request_metrics'),
 ]
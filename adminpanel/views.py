@@ -1,10 +1,23 @@
+from django.http import HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template.defaultfilters import pluralize
+from django.utils.decorators import method_decorator
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.views.generic import ListView
+from django.views.decorators.http import require_POST
 from django.contrib import messages
 from django.contrib.auth import login
 from django.contrib.auth.decorators import user_passes_test, login_required
 from django.contrib.auth.forms import AuthenticationForm
-from .forms import AdminSignUpForm
+from .export import FORMATS, export_queryset, parse_since
+from . import jobs, listing
+from .forms import AdminSignUpForm, BulkActionForm
+from .models import DeleteJob
 from profiles.models import Student  # import Student model from profiles
+from profiles.cache import render_cache
+from profiles import bulk, instrumentation
+from profiles.pagination import KeysetPaginationMixin
+from profiles.routers import replica_reads
 
 def is_staff_user(user):
     return user.is_authenticated and user.is_staff
@@ -23,22 +36,131 @@ def admin_signup(request):
     return render(request, 'adminpanel/admin_signup.html', {'form': form})
 
 @user_passes_test(is_staff_user, login_url='adminpanel:admin_login')
+@replica_reads
 def dashboard(request):
     """Simple admin dashboard landing"""
     total_students = Student.objects.count()
     total_public = Student.objects.filter(is_public=True).count()
     context = {
         'total_students': total_students,
-        'total_public': total_public
+        'total_public': total_public,
+        'render_cache': render_cache.stats(),
+        'delete_jobs': DeleteJob.objects.select_related('requested_by')[:5],
     }
     return render(request, 'adminpanel/dashboard.html', context)
 
+@method_decorator(user_passes_test(is_staff_user, login_url='adminpanel:admin_login'), name='dispatch')
+class StudentListView(KeysetPaginationMixin, ListView):
+    """
+    Every student, a page at a time, sorted by ?sort=username (the default),
+    skills, endorsements or projects and narrowed by a ?q= username or email
+    prefix (adminpanel.listing).
+    """
+    model = Student
+    template_name = 'adminpanel/student_list.html'
+    context_object_name = 'students'
+    replica_reads = True
+
+    def get_sort(self):
+        sort = self.request.GET.get('sort', 'username')
+        return sort if sort in listing.ORDERINGS else 'username'
+
+    def get_search(self):
+        return self.request.GET.get('q', '').strip()
+
+    def get_ordering(self):
+        return listing.ORDERINGS[self.get_sort()]
+
+    def get_queryset(self):
+        return listing.students(self.get_sort(), self.get_search())
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        search = self.get_search()
+        total, exact = listing.count(self.object_list, filtered=bool(search))
+        context.update({
+            'sort': self.get_sort(),
+            'search': search,
+            'total': total,
+            'total_exact': exact,
+            'count_limit': listing.count_limit(),
+        })
+        return context
+
+@user_passes_test(is_staff_user, login_url='adminpanel:admin_login')
+@require_POST
+def bulk_action(request):
+    """Apply one action to the students ticked on the list; deletions are queued as a DeleteJob."""
+    back = request.POST.get('next', '')
+    if not url_has_allowed_host_and_scheme(back, allowed_hosts={request.get_host()}):
+        back = ''
+    form = BulkActionForm(request.POST)
+    if not form.is_valid():
+        messages.error(request, 'Pick an action and at least one student.')
+        return redirect(back or 'adminpanel:student_list')
+
+    student_ids = [student.pk for student in form.cleaned_data['students']]
+    action = form.cleaned_data['action']
+    if action == 'delete':
+        job = jobs.queue(student_ids, requested_by=request.user)
+        messages.success(request, f'Deleting {len(student_ids)} student{pluralize(len(student_ids))}.')
+        return redirect('adminpanel:delete_job', pk=job.pk)
+    if action in ('make_public', 'make_private'):
+        changed = bulk.set_visibility(student_ids, is_public=action == 'make_public')
+        messages.success(request, f'{changed} profile{pluralize(changed)} made {action.removeprefix("make_")}.')
+    else:
+        deleted = bulk.reset_endorsements(student_ids)
+        messages.success(request, f'Removed {deleted} endorsement{pluralize(deleted)} from {len(student_ids)} student{pluralize(len(student_ids))}.')
+    return redirect(back or 'adminpanel:student_list')
+
 @user_passes_test(is_staff_user, login_url='adminpanel:admin_login')
-def student_list(request):
-    students = Student.objects.select_related('user').all().order_by('user__username')
-    return render(request, 'adminpanel/student_list.html', {'students': students})
+def delete_job(request, pk):
+    """Progress of a bulk deletion; ?format=json for polling."""
+    job = get_object_or_404(DeleteJob, pk=pk)
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'status': job.status,
+            'total': job.total,
+            'processed': job.processed,
+            'deleted': job.deleted,
+            'files_removed': job.files_removed,
+            'percent': job.percent,
+            'error': job.error,
+        })
+    return render(request, 'adminpanel/delete_job.html', {'job': job})
 
 @user_passes_test(is_staff_user, login_url='adminpanel:admin_login')
 def student_detail(request, pk):
     student = get_object_or_404(Student.objects.select_related('user').prefetch_related('skills', 'projects', 'awards', 'portfolio'), pk=pk)
     return render(request, 'adminpanel/student_detail.html', {'student': student})
+
+@user_passes_test(is_staff_user, login_url='adminpanel:admin_login')
+def export_students(request):
+    """Stream all students as ?format=csv|jsonl, optionally ?public=1 and ?since=<ISO date>."""
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in FORMATS:
+        return HttpResponseBadRequest('Unknown export format.')
+    since = None
+    if request.GET.get('since'):
+        since = parse_since(request.GET['since'])
+        if since is None:
+            return HttpResponseBadRequest('Invalid since date.')
+
+    render_rows, content_type = FORMATS[fmt]
+    students = export_queryset(public_only=request.GET.get('public') == '1', updated_since=since)
+    response = StreamingHttpResponse(render_rows(students), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="students.{fmt}"'
+    return response
+
+@user_passes_test(is_staff_user, login_url='adminpanel:admin_login')
+def request_metrics(request):
+    """Per-URL request timing percentiles collected by RequestTimingMiddleware in this process."""
+    if request.method == 'POST':
+        instrumentation.timings.reset()
+        messages.success(request, 'Request metrics reset.')
+        return redirect('adminpanel:request_metrics')
+    context = {
+        'enabled': instrumentation.instrumentation_enabled(),
+        'rows': instrumentation.timings.summary(),
+    }
+    return render(request, 'adminpanel/request_metrics.html', context)
@@ -1,13 +1,28 @@
 from django.contrib import admin
 
-from .models import Student, Skill, Project, Award, PortfolioItem, Endorsement
+from .models import Student, Skill, SkillTag, Project, Award, PortfolioItem, Endorsement, StudentStats
 
 @admin.register(Student)
 class StudentAdmin(admin.ModelAdmin):
     list_display = ('user', 'is_public')
 
 admin.site.register(Skill)
+
+@admin.register(SkillTag)
+class SkillTagAdmin(admin.ModelAdmin):
+    list_display = ('name', 'key', 'student_count')
+    search_fields = ('key',)
+    # Tags come from skill names; only the display spelling is editable.
+    readonly_fields = ('key', 'student_count')
+
+    def has_add_permission(self, request):
+        return False
+
 admin.site.register(Project)
 admin.site.register(Award)
 admin.site.register(PortfolioItem)
-admin.site.register(Endorsement)
\ No newline at end of file
+admin.site.register(Endorsement)
+
+@admin.register(StudentStats)
+class StudentStatsAdmin(admin.ModelAdmin):
+    list_display = ('student', 'is_public', 'num_skills', 'num_projects', 'num_awards', 'total_endorsements', 'overall_score')
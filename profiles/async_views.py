@@ -0,0 +1,122 @@
+"""
+Native async versions of the read-heavy views and of endorse_skill.
+
+These are served instead of the sync views in profiles.views when
+PROFILES_ASYNC_VIEWS is on (see profiles/urls.py). They are meant for ASGI
+deployments (stud/asgi.py), where sync views each hold a thread-pool
+thread. Queries use the async ORM: aget, async iteration and
+aprefetch_related_objects. The user and session are read with
+request.auser() and the session's async API. Pages, JSON responses and
+conditional GET handling are the same as in the sync views.
+"""
+from django.contrib.auth.decorators import login_required
+from django.db import IntegrityError
+from django.db.models import aprefetch_related_objects
+from django.http import Http404, JsonResponse
+from django.template.loader import render_to_string
+from django.template.response import TemplateResponse
+from django.utils.safestring import mark_safe
+
+from .cache import render_cache
+from .conditional import ConditionalGet, aleaderboard_version
+from .endorsements import arecord_endorsement
+from .models import Skill, Student
+from . import rankings, views
+
+
+class AsyncKeysetListMixin:
+    """Async get() for the keyset-paginated ListViews."""
+
+    async def get(self, request, *args, **kwargs):
+        request.user = await request.auser()  # Shared with the templates, which read request.user.
+        conditional = ConditionalGet(request.user, *await aleaderboard_version(), dated=False)
+        response = conditional.response(request)
+        if response is not None:
+            return conditional.apply(response)
+        queryset = self.get_queryset()
+        _, page, rows, is_paginated = await self.apaginate_queryset(queryset, self.get_paginate_by(queryset))
+        self.object_list = rows
+        context = {
+            'view': self,
+            'paginator': None,
+            'page_obj': page,
+            'is_paginated': is_paginated,
+            'object_list': rows,
+            self.context_object_name: rows,
+            **await self.aget_extra_context(),
+        }
+        return conditional.apply(TemplateResponse(request, self.get_template_names(), context))
+
+    async def aget_extra_context(self):
+        return {}
+
+
+class PublicStudentListView(AsyncKeysetListMixin, views.PublicStudentListView):
+    async def aget_extra_context(self):
+        tags = [tag async for tag in self.facet_queryset()]
+        tags += [tag async for tag in self.missing_facet_queryset(tags)]
+        return self.facet_context(tags)
+
+
+class LeaderboardView(AsyncKeysetListMixin, views.LeaderboardView):
+    pass
+
+
+class StudentDetailView(views.StudentDetailView):
+    async def get(self, request, *args, **kwargs):
+        try:
+            student = await self.get_queryset().aget(pk=kwargs['pk'])
+        except Student.DoesNotExist:
+            raise Http404('No student found matching the query.')
+        user = request.user = await request.auser()
+        if not student.is_public and (not user.is_authenticated or student.user_id != user.pk):
+            raise Http404("This profile is private.")
+        conditional = self.conditional(user, student)
+        response = conditional.response(request)
+        if response is not None:
+            return conditional.apply(response)
+        if not student.is_public:
+            body = await self.arender_body(student)
+        else:
+            body = await render_cache.aget_or_render(
+                student.pk, lambda: self.arender_body(student), stamp=self.body_stamp(student),
+            )
+        self.object = student
+        context = {
+            'view': self,
+            'object': student,
+            self.context_object_name: student,
+            'profile_body': mark_safe(body),
+        }
+        return conditional.apply(TemplateResponse(request, self.get_template_names(), context))
+
+    async def arender_body(self, student):
+        await aprefetch_related_objects([student], 'skills', 'projects', 'awards', 'portfolio')
+        history = await rankings.arank_history(student.pk) if student.is_public else []
+        return render_to_string(self.body_template_name, {'student_obj': student, 'rank_history': history})
+
+
+@login_required
+async def endorse_skill(request, skill_id):
+    if request.method != 'POST':
+        return JsonResponse({'ok': False, 'error': 'POST required'}, status=405)
+
+    if not request.session.session_key:
+        await request.session.acreate()
+    session_key = request.session.session_key
+
+    try:
+        skill = await Skill.objects.select_related('student').aget(id=skill_id)
+    except Skill.DoesNotExist:
+        raise Http404('No skill found matching the query.')
+
+    user = await request.auser()
+    # Private profile restriction
+    if not skill.student.is_public and not (skill.student.user_id == user.pk or user.is_staff):
+        return JsonResponse({'ok': False, 'error': 'Profile is private.'}, status=403)
+
+    try:
+        count = await arecord_endorsement(skill, session_key, endorser=user)
+        return JsonResponse({'ok': True, 'count': count})
+    except IntegrityError:
+        return JsonResponse({'ok': False, 'error': 'Already endorsed from this browser.'}, status=400)
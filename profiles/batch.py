@@ -0,0 +1,176 @@
+"""
+Batch editing for profile_edit.
+
+The page posts a formset per achievement type (profiles.forms): the
+student's existing rows, which can be edited or deleted, plus any number
+of new ones. save_formsets() writes a submission in one transaction with
+one DELETE, one bulk_update and one bulk_create per type, however many
+rows it touches.
+
+Bulk writes send no post_save signals, and the per-row post_delete
+receivers are switched off meanwhile (signals.batch_edit), so the derived
+state is reconciled once at the end: the StudentStats row is rebuilt,
+SkillTag counts move by the tags the student gained or lost, and the
+search document, the profile version and the affected skill leaderboards
+are refreshed. Uploads are stored before the rows that reference them;
+blobs no row references any more are collected after commit.
+"""
+from django.db import models, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import rankings, renditions, search, signals
+from .forms import AwardFormSet, PortfolioItemFormSet, ProjectFormSet, SkillFormSet
+from .models import PortfolioItem, Skill, SkillTag, StudentStats, skill_key
+
+# Form prefix -> formset class, in page order.
+FORMSETS = {
+    'skills': SkillFormSet,
+    'projects': ProjectFormSet,
+    'awards': AwardFormSet,
+    'portfolio': PortfolioItemFormSet,
+}
+
+
+def formsets(student, data=None, files=None):
+    """{prefix: formset} for the page, bound to `data` only where its management form was posted."""
+    result = {}
+    for prefix, formset_class in FORMSETS.items():
+        if data is not None and f'{prefix}-TOTAL_FORMS' in data:
+            result[prefix] = formset_class(data, files, prefix=prefix, student=student)
+        else:
+            result[prefix] = formset_class(prefix=prefix, student=student)
+    return result
+
+
+class _Changes:
+    """What one formset's save did, for the reconciliation step."""
+
+    def __init__(self, formset):
+        self.model = formset.model
+        # Field values as loaded; the forms have already applied the posted ones to their instances.
+        self.before = {form.instance.pk: form.initial for form in formset.initial_forms}
+        formset.save(commit=False)
+        self.deleted = formset.deleted_objects
+        self.changed = formset.changed_objects
+        self.created = formset.new_objects
+
+    def __bool__(self):
+        return bool(self.deleted or self.changed or self.created)
+
+
+def save_formsets(student, bound):
+    """Save valid, bound formsets for `student` in one transaction. Returns the number of rows written."""
+    written = 0
+    with transaction.atomic(), signals.batch_edit():
+        changes = [change for change in map(_Changes, bound) if change]
+        tags_before = _tag_ids(student) if any(change.model is Skill for change in changes) else None
+        for change in changes:
+            if change.model is Skill:
+                _assign_tags(change)
+            _write(student, change)
+            written += len(change.deleted) + len(change.changed) + len(change.created)
+        _reconcile(student, changes, tags_before)
+    return written
+
+
+def _tag_ids(student):
+    return set(Skill.objects.filter(student=student).values_list('tag_id', flat=True))
+
+
+def _assign_tags(change):
+    # The catalog's spelling, as for a single add: "python " joins an existing "Python".
+    skills = change.created + [skill for skill, fields in change.changed if 'name' in fields]
+    tags = SkillTag.objects.for_names([skill.name for skill in skills]) if skills else {}
+    # Rows renamed away from a tag leave its leaderboard.
+    change.previous_tags = {skill.tag_id for skill in skills if skill.tag_id}
+    for skill in skills:
+        skill.tag = tags[skill_key(skill.name)]
+        skill.name = skill.tag.name
+
+
+def _write(student, change):
+    model = change.model
+    if change.deleted:
+        # Cascades to endorsements; the receivers that would query per row are off.
+        model.objects.filter(pk__in=[obj.pk for obj in change.deleted]).delete()
+    if change.changed:
+        now = timezone.now()
+        fields = {'updated_at'}
+        for obj, changed_fields in change.changed:
+            fields.update(changed_fields)
+            obj.updated_at = now
+        if model is Skill and 'name' in fields:
+            fields.add('tag')
+            _park_renamed_tags(change)
+        objs = [obj for obj, _ in change.changed]
+        for field in model._meta.concrete_fields:
+            # bulk_update() does not call pre_save(), which stores new uploads.
+            if field.name in fields and isinstance(field, models.FileField):
+                for obj in objs:
+                    field.pre_save(obj, add=False)
+        model.objects.bulk_update(objs, sorted(fields))
+    if change.created:
+        for obj in change.created:
+            obj.student = student
+        model.objects.bulk_create(change.created)
+    if model is PortfolioItem:
+        _portfolio_files(student, change)
+
+
+def _park_renamed_tags(change):
+    # A rename onto a tag another renamed row is leaving (a swap, or A -> B -> C)
+    # trips the unique (student, tag) constraint, which SQLite checks row by row
+    # within one UPDATE. Move those rows to placeholder ids first: foreign keys
+    # are only checked at commit, by which time bulk_update has set the real tags.
+    renamed = [skill for skill, fields in change.changed if 'name' in fields]
+    if {skill.tag_id for skill in renamed} & change.previous_tags:
+        Skill.objects.filter(pk__in=[skill.pk for skill in renamed]).update(tag_id=-F('pk'))
+
+
+def _blobs(item):
+    return {f.name for f in (item.file, item.screenshot) if f}
+
+
+def _initial_blobs(change, pk):
+    initial = change.before[pk]
+    return {f.name for f in (initial.get('file'), initial.get('screenshot')) if f}
+
+
+def _portfolio_files(student, change):
+    unreferenced = set()
+    for item in change.deleted:
+        unreferenced |= _initial_blobs(change, item.pk)
+    for item, _ in change.changed:
+        unreferenced |= _initial_blobs(change, item.pk) - _blobs(item)
+    # Blobs shared with other rows survive: collect_blob() checks for references.
+    signals.collect_blobs_on_commit(unreferenced)
+    screenshots = [item.screenshot for item in change.created if item.screenshot]
+    screenshots += [item.screenshot for item, fields in change.changed if 'screenshot' in fields and item.screenshot]
+    for screenshot in screenshots:
+        name, storage = screenshot.name, screenshot.storage
+        transaction.on_commit(lambda name=name, storage=storage: renditions.schedule(name, student.pk, storage))
+
+
+def _reconcile(student, changes, tags_before):
+    if not changes:
+        return
+    models_changed = {change.model for change in changes}
+    if models_changed & set(signals.COUNTED_MODELS):
+        StudentStats.objects.rebuild([student.pk])
+        search.index_students([student.pk])
+    for change in changes:
+        if change.model is Skill:
+            _reconcile_tags(student, change, tags_before)
+    signals.touch_students([student.pk])
+
+
+def _reconcile_tags(student, change, before):
+    after = _tag_ids(student)
+    if student.is_public:
+        SkillTag.objects.bump_counts({tag_id: 1 for tag_id in after - before})
+        SkillTag.objects.filter(pk__in=before - after, student_count__gt=0).update(student_count=F('student_count') - 1)
+    # Skill leaderboards that gained, lost or renamed a row.
+    touched = change.previous_tags | {skill.tag_id for skill in change.deleted}
+    touched |= {skill.tag_id for skill in change.created} | {skill.tag_id for skill, _ in change.changed}
+    rankings.invalidate_top(touched)
@@ -0,0 +1,108 @@
+"""
+Queryset-level operations on many students, for the staff tools.
+
+Each operation issues a fixed number of statements for the whole id list
+instead of saving or deleting students one by one. The per-row receivers
+in profiles.signals are switched off (signals.batch_edit) while rows are
+deleted, and the derived state is brought up to date once afterwards:
+StudentStats rows, SkillTag counts, the search index, profile versions
+and skill leaderboard caches.
+
+delete_students() deletes the students' endorsements, skills, projects,
+awards, portfolio items, stats and rank rows with one DELETE per table,
+then the students and their users. Django would load every row of a model
+with post_delete receivers as an instance to cascade through it, so those
+tables are not left to the user's cascade. The portfolio blobs no
+remaining row references are deleted afterwards. adminpanel runs large
+deletions through it in chunks on a background worker.
+"""
+import time
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from . import rankings, search, signals, storage
+from .endorsements import endorsement_buffer, recount_endorsements
+from .models import (
+    Award, Endorsement, PortfolioItem, Project, RankEntry, Skill, SkillTag, Student, StudentRank, StudentStats,
+)
+
+
+def _tag_ids(student_ids):
+    return set(Skill.objects.filter(student__in=student_ids).values_list('tag_id', flat=True))
+
+
+def set_visibility(student_ids, is_public):
+    """Make the students public or private. Returns how many changed."""
+    with transaction.atomic():
+        changed = list(Student.objects.filter(pk__in=student_ids).exclude(is_public=is_public).values_list('pk', flat=True))
+        if not changed:
+            return 0
+        Student.objects.filter(pk__in=changed).update(is_public=is_public)
+        StudentStats.objects.filter(pk__in=changed).update(is_public=is_public)
+        tag_ids = _tag_ids(changed)
+        # Search applies visibility at query time, so the documents stay as they are.
+        SkillTag.objects.recount(tag_ids)
+        rankings.invalidate_top(tag_ids)
+        signals.touch_students(changed)
+    return len(changed)
+
+
+def reset_endorsements(student_ids):
+    """Delete every endorsement of the students' skills and zero the counters. Returns endorsements deleted."""
+    with transaction.atomic(), signals.batch_edit():
+        skills = list(Skill.objects.filter(student__in=student_ids).values_list('pk', 'tag_id'))
+        skill_ids = [pk for pk, _ in skills]
+        deleted, _ = Endorsement.objects.filter(skill__in=skill_ids).delete()
+        # Increments buffered by other processes are corrected by reconcile_endorsements.
+        endorsement_buffer.discard(skill_ids)
+        recount_endorsements(skill_ids)
+        StudentStats.objects.rebuild(student_ids)
+        rankings.invalidate_top(tag_id for _, tag_id in skills)
+        signals.touch_students(list(student_ids))
+    return deleted
+
+
+def delete_students(student_ids):
+    """
+    Delete the students and their users. Returns (students deleted,
+    portfolio files removed). Call it outside a transaction: the files go
+    once the deletion has committed.
+    """
+    student_ids = list(student_ids)
+    # Blobs not re-uploaded since this point were only referenced by rows deleted here.
+    started = time.time()
+    with transaction.atomic(), signals.batch_edit():
+        existing = list(Student.objects.filter(pk__in=student_ids).values_list('pk', flat=True))
+        if not existing:
+            return 0, 0
+        tag_ids = _tag_ids(existing)
+        blobs = {
+            name
+            for pair in PortfolioItem.objects.filter(student__in=existing).values_list('file', 'screenshot')
+            for name in pair if name
+        }
+        user_ids = list(Student.objects.filter(pk__in=existing).values_list('user_id', flat=True))
+        for queryset in (
+            Endorsement.objects.filter(skill__student__in=existing),
+            Skill.objects.filter(student__in=existing),
+            Project.objects.filter(student__in=existing),
+            Award.objects.filter(student__in=existing),
+            PortfolioItem.objects.filter(student__in=existing),
+            StudentStats.objects.filter(student__in=existing),
+            RankEntry.objects.filter(student__in=existing),
+            StudentRank.objects.filter(student__in=existing),
+            Student.objects.filter(pk__in=existing),
+        ):
+            # No signals and no cascade: the derived state is reconciled below.
+            queryset._raw_delete(queryset.db)
+        # What still points at the users (endorsements they gave, admin log entries) cascades normally.
+        get_user_model().objects.filter(pk__in=user_ids).delete()
+        search.remove_students(existing)
+        SkillTag.objects.recount(tag_ids)
+        rankings.invalidate_top(tag_ids)
+        for student_id in existing:
+            signals.invalidate_profile(student_id)
+    # After commit; blobs deduplicated with other students' uploads are still referenced and stay.
+    removed = sum(storage.collect_blob(name, unused_since=started) for name in blobs)
+    return len(existing), removed
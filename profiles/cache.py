@@ -0,0 +1,140 @@
+"""
+Versioned cache for rendered public profile bodies.
+
+Each student has a version number in the cache; the body is stored under a
+key that includes it, so a write only has to bump the version and stale
+bodies simply age out of the size-bounded backend. The backend is the
+CACHES alias named by PROFILES_RENDER_CACHE (see stud/settings.py).
+"""
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+
+_MISSING = object()
+
+
+class RenderCache:
+    def __init__(self, alias):
+        self.alias = alias
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _version_key(self, student_id):
+        return f'student:{student_id}:v'
+
+    def version(self, student_id):
+        version = self.cache.get(self._version_key(student_id))
+        if version is None:
+            # A fresh, time-based version so bodies cached under an evicted
+            # version number can never be served again.
+            version = time.time_ns()
+            if not self.cache.add(self._version_key(student_id), version, timeout=None):
+                version = self.cache.get(self._version_key(student_id), version)
+        return version
+
+    def bump(self, student_id):
+        try:
+            self.cache.incr(self._version_key(student_id))
+        except ValueError:
+            self.cache.set(self._version_key(student_id), time.time_ns(), timeout=None)
+
+    def get_or_render(self, student_id, render, stamp=None):
+        """
+        Cached body for the student's current version, calling render() on a
+        miss. A `stamp` (e.g. the row's updated_at) is part of the key, so a
+        body rendered from a lagging replica is not served once it caught up.
+        """
+        key = f'student:{student_id}:body:{self.version(student_id)}'
+        if stamp is not None:
+            key = f'{key}:{stamp}'
+        body = self.cache.get(key, _MISSING)
+        if body is not _MISSING:
+            self._count(hit=True)
+            return body
+        self._count(hit=False)
+        body = render()
+        self.cache.set(key, body)
+        return body
+
+    async def aversion(self, student_id):
+        version = await self.cache.aget(self._version_key(student_id))
+        if version is None:
+            version = time.time_ns()
+            if not await self.cache.aadd(self._version_key(student_id), version, timeout=None):
+                version = await self.cache.aget(self._version_key(student_id), version)
+        return version
+
+    async def aget_or_render(self, student_id, render, stamp=None):
+        """get_or_render() for async views; `render` is a coroutine function."""
+        key = f'student:{student_id}:body:{await self.aversion(student_id)}'
+        if stamp is not None:
+            key = f'{key}:{stamp}'
+        body = await self.cache.aget(key, _MISSING)
+        if body is not _MISSING:
+            self._count(hit=True)
+            return body
+        self._count(hit=False)
+        body = await render()
+        await self.cache.aset(key, body)
+        return body
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {'hits': hits, 'misses': misses, 'hit_ratio': hits / total if total else 0.0}
+
+
+render_cache = RenderCache(getattr(settings, 'PROFILES_RENDER_CACHE', 'default'))
+
+
+class LRUFileBasedCache(FileBasedCache):
+    """
+    FileBasedCache that evicts least recently used entries instead of a
+    random sample: reads refresh the file's mtime and culling removes the
+    oldest files first.
+    """
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        if value is _MISSING:
+            return default
+        try:
+            os.utime(self._key_to_file(key, version))
+        except FileNotFoundError:
+            pass
+        return value
+
+    def _cull(self):
+        filelist = self._list_cache_files()
+        num_entries = len(filelist)
+        if num_entries < self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            return self.clear()
+
+        def mtime(fname):
+            try:
+                return os.stat(fname).st_mtime_ns
+            except FileNotFoundError:
+                return 0
+
+        filelist.sort(key=mtime)
+        for fname in filelist[:num_entries // self._cull_frequency]:
+            self._delete(fname)
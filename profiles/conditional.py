@@ -0,0 +1,87 @@
+"""
+Conditional GET for the public profile pages.
+
+A profile's version is Student.updated_at, which profiles.signals moves
+whenever the student or one of its skills, projects, awards, portfolio
+items or endorsements changes, plus the latest rank snapshot, which
+redraws its sparklines. The leaderboard and public list share one
+global version: the latest updated_at over all students plus the number
+of students (so deletions count too), read in a single aggregate query.
+
+From a version and the viewer, whose login changes the navigation bar, the
+views build an ETag and, for a profile, a Last-Modified date. A request
+whose If-None-Match or If-Modified-Since still matches gets a 304 before
+any stats, pagination or template work happens. The list pages send no
+Last-Modified: deleting a student changes their count but not the latest
+updated_at, so a date alone would validate a page still listing them.
+Their version query counts every student (COUNT over the primary key) on
+each conditional request.
+"""
+import hashlib
+
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .models import Student
+
+
+def _aggregate():
+    return Student.objects.order_by().aggregate(latest=Max('updated_at'), total=Count('pk'))
+
+
+def leaderboard_version():
+    """(latest updated_at, student count) for the leaderboard and public list."""
+    row = _aggregate()
+    return row['latest'], row['total']
+
+
+async def aleaderboard_version():
+    row = await Student.objects.order_by().aaggregate(latest=Max('updated_at'), total=Count('pk'))
+    return row['latest'], row['total']
+
+
+class ConditionalGet:
+    """
+    Validators for one page: `updated_at` plus any `parts` that also select
+    its content. With dated=False there is no Last-Modified, for pages whose
+    `parts` can change while updated_at does not.
+    """
+
+    def __init__(self, user, updated_at, *parts, dated=True):
+        raw = ':'.join(str(part) for part in (updated_at.timestamp() if updated_at else '', *parts, user.pk or 0))
+        self.etag = '"%s"' % hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest()
+        self.last_modified = int(updated_at.timestamp()) if updated_at and dated else None
+        self.anonymous = not user.is_authenticated
+
+    def response(self, request):
+        """A 304 (or 412) response if the client's copy is current, else None."""
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        # A flash message waiting to be shown means the page differs from any cached copy.
+        if request.COOKIES.get(CookieStorage.cookie_name):
+            return None
+        return get_conditional_response(request, etag=self.etag, last_modified=self.last_modified)
+
+    def apply(self, response):
+        """Add ETag, Last-Modified and Cache-Control to `response` (200 or 304)."""
+        response.headers.setdefault('ETag', self.etag)
+        if self.last_modified:
+            response.headers.setdefault('Last-Modified', http_date(self.last_modified))
+        if self.anonymous:
+            patch_cache_control(response, public=True, max_age=getattr(settings, 'PROFILES_PUBLIC_MAX_AGE', 0))
+        else:
+            # Pages showing the viewer's name stay out of shared caches.
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+class ConditionalListMixin:
+    """304s for the leaderboard and public list, keyed on leaderboard_version()."""
+
+    def get(self, request, *args, **kwargs):
+        conditional = ConditionalGet(request.user, *leaderboard_version(), dated=False)
+        response = conditional.response(request) or super().get(request, *args, **kwargs)
+        return conditional.apply(response)
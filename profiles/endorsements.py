@@ -0,0 +1,193 @@
+"""
+Recording endorsements and maintaining Skill.endorsement_count.
+
+With PROFILES_ENDORSEMENT_WRITE_BEHIND on, an endorsement only inserts its
+Endorsement row. The skill's counter increment, the student's
+StudentStats.total_endorsements and the updated_at touch are held in a
+process-local buffer and applied for many skills in one UPDATE each,
+either every PROFILES_ENDORSEMENT_FLUSH_INTERVAL seconds or once
+PROFILES_ENDORSEMENT_FLUSH_SIZE increments are pending.
+
+The Endorsement rows stay the source of truth: recount_endorsements()
+rebuilds counters from them after a crash lost a buffer, or when a flush
+fails. It flushes this process's buffer first, but increments still
+buffered by other processes are already in the rows and get applied
+again when those processes flush. Run `manage.py reconcile_endorsements`
+when no other process has deltas pending (write-behind off, or
+FLUSH_INTERVAL after the last click) to get exact counts.
+"""
+import atexit
+import logging
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Case, Count, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce, Now
+
+from . import live, rankings
+from .models import Endorsement, Skill, StudentStats
+from .signals import touch_students
+
+logger = logging.getLogger(__name__)
+
+
+def recount_endorsements(skill_ids=None):
+    """Set endorsement_count from the Endorsement rows, for all skills or the given ones."""
+    # The rows include this process's pending increments; apply them first so they aren't counted twice.
+    endorsement_buffer.flush()
+    counted = Endorsement.objects.filter(skill=OuterRef('pk')).order_by().values('skill').annotate(n=Count('pk')).values('n')
+    skills = Skill.objects.all()
+    if skill_ids is not None:
+        skills = skills.filter(pk__in=skill_ids)
+    return skills.update(endorsement_count=Coalesce(Subquery(counted), 0))
+
+
+class EndorsementBuffer:
+    def __init__(self, interval, max_pending):
+        self.interval = interval
+        self.max_pending = max_pending
+        # Held across the flush UPDATE, so a count read can tell whether a
+        # flush moved deltas from the buffer into the database meanwhile.
+        self._lock = threading.RLock()
+        self._deltas = {}
+        self._skills = {}  # skill id -> (student id, tag id)
+        self._pending = 0
+        self._flushes = 0
+        self._timer = None
+
+    def add(self, skill, delta=1):
+        with self._lock:
+            self._deltas[skill.pk] = self._deltas.get(skill.pk, 0) + delta
+            self._skills[skill.pk] = (skill.student_id, skill.tag_id)
+            self._pending += abs(delta)
+            if self._pending >= self.max_pending:
+                self.flush()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.interval, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def pending(self, skill_id):
+        with self._lock:
+            return self._deltas.get(skill_id, 0)
+
+    def discard(self, skill_ids):
+        """Drop pending increments for skills whose endorsements were deleted."""
+        with self._lock:
+            for skill_id in skill_ids:
+                self._pending -= abs(self._deltas.pop(skill_id, 0))
+                self._skills.pop(skill_id, None)
+
+    def read_with_pending(self, read):
+        """(read(), {skill_id: pending delta}) as of one moment, so the deltas are not also in read()'s counts."""
+        while True:
+            with self._lock:
+                flushes, deltas = self._flushes, dict(self._deltas)
+            # Queried outside the lock; a flush in between means the deltas may be in the result too.
+            result = read()
+            with self._lock:
+                if self._flushes == flushes:
+                    return result, deltas
+
+    def current_count(self, skill_id):
+        """Committed counter plus this process's pending delta."""
+        committed, deltas = self.read_with_pending(
+            lambda: Skill.objects.filter(pk=skill_id).values_list('endorsement_count', flat=True).first() or 0
+        )
+        return committed + deltas.get(skill_id, 0)
+
+    def flush(self):
+        """Apply every pending delta, one UPDATE per table. Returns the number of skills updated."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            deltas, skills = self._deltas, self._skills
+            self._deltas, self._skills, self._pending = {}, {}, 0
+            if not deltas:
+                return 0
+            self._flushes += 1
+            students = {}
+            for skill_id, delta in deltas.items():
+                student_id = skills[skill_id][0]
+                students[student_id] = students.get(student_id, 0) + delta
+            try:
+                with transaction.atomic():
+                    Skill.objects.filter(pk__in=deltas).update(
+                        endorsement_count=F('endorsement_count') + Case(
+                            *[When(pk=skill_id, then=Value(delta)) for skill_id, delta in deltas.items()],
+                            default=Value(0),
+                        ),
+                        updated_at=Now(),
+                    )
+                    if StudentStats.objects.bump_many('total_endorsements', students) < len(students):
+                        # Some student has no stats row yet: compute them from scratch.
+                        StudentStats.objects.rebuild(list(students))
+            except Exception:
+                logger.exception('Endorsement flush failed; recounting %d skills from Endorsement rows.', len(deltas))
+                try:
+                    with transaction.atomic():
+                        recount_endorsements(list(deltas))
+                        StudentStats.objects.rebuild(list(students))
+                except Exception:
+                    # Database unavailable: keep the deltas for the next flush.
+                    for skill_id, delta in deltas.items():
+                        self._deltas[skill_id] = self._deltas.get(skill_id, 0) + delta
+                        self._skills[skill_id] = skills[skill_id]
+                        self._pending += abs(delta)
+                    raise
+        touch_students(list(students))
+        rankings.invalidate_top(tag_id for _, tag_id in skills.values())
+        return len(deltas)
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Scheduled endorsement flush failed.')
+        finally:
+            connections.close_all()
+
+
+endorsement_buffer = EndorsementBuffer(
+    interval=getattr(settings, 'PROFILES_ENDORSEMENT_FLUSH_INTERVAL', 2.0),
+    max_pending=getattr(settings, 'PROFILES_ENDORSEMENT_FLUSH_SIZE', 100),
+)
+atexit.register(endorsement_buffer.flush)
+
+
+def write_behind_enabled():
+    return getattr(settings, 'PROFILES_ENDORSEMENT_WRITE_BEHIND', False)
+
+
+def record_endorsement(skill, session_key, endorser=None):
+    """
+    Insert the endorsement and move the skill's counter; returns the count to
+    show. Raises IntegrityError if this session already endorsed the skill.
+    """
+    if write_behind_enabled():
+        endorsement = Endorsement(skill=skill, session_key=session_key, endorser=endorser)
+        # The buffer applies the stats counter and the touch at flush time (profiles.signals).
+        endorsement._write_behind = True
+        with transaction.atomic():
+            endorsement.save()
+        endorsement_buffer.add(skill)
+        count = endorsement_buffer.current_count(skill.pk)
+    else:
+        with transaction.atomic():
+            Endorsement.objects.create(skill=skill, session_key=session_key, endorser=endorser)
+            Skill.objects.filter(pk=skill.pk).update(endorsement_count=F('endorsement_count') + 1, updated_at=Now())
+        count = Skill.objects.filter(pk=skill.pk).values_list('endorsement_count', flat=True).get()
+    live.publish_count(skill, count)
+    rankings.invalidate_top([skill.tag_id])
+    return count
+
+
+async def arecord_endorsement(skill, session_key, endorser=None):
+    """
+    record_endorsement() for async views. Django has no async transactions,
+    so the insert and counter update run together in the sync thread.
+    """
+    return await sync_to_async(record_endorsement)(skill, session_key, endorser)
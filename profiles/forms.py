@@ -1,5 +1,7 @@
 from django import forms
-from .models import Student, Skill, Project, Award, PortfolioItem
+from django.template.defaultfilters import filesizeformat
+from .models import Student, Skill, Project, Award, PortfolioItem, skill_key
+from .storage import max_upload_size
 
 class StudentForm(forms.ModelForm):
     class Meta:
@@ -14,6 +16,9 @@ class SkillForm(forms.ModelForm):
         model = Skill
         fields = ['name']
 
+    def clean_name(self):
+        return ' '.join(self.cleaned_data['name'].split())
+
 class ProjectForm(forms.ModelForm):
     class Meta:
         model = Project
@@ -28,3 +33,61 @@ class PortfolioItemForm(forms.ModelForm):
     class Meta:
         model = PortfolioItem
         fields = ['title', 'file', 'url', 'screenshot']
+
+    def _check_size(self, upload):
+        limit = max_upload_size()
+        if upload and limit and getattr(upload, 'size', 0) > limit:
+            raise forms.ValidationError(f'Files are limited to {filesizeformat(limit)}.')
+        return upload
+
+    def clean_file(self):
+        return self._check_size(self.cleaned_data.get('file'))
+
+    def clean_screenshot(self):
+        return self._check_size(self.cleaned_data.get('screenshot'))
+
+
+class AchievementFormSet(forms.BaseModelFormSet):
+    """A student's existing rows of one kind plus blank ones for new rows; profiles.batch saves them."""
+
+    def __init__(self, *args, student, **kwargs):
+        self.student = student
+        kwargs.setdefault('queryset', self.model.objects.filter(student=student).order_by('pk'))
+        super().__init__(*args, **kwargs)
+
+
+class BaseSkillFormSet(AchievementFormSet):
+    def clean(self):
+        """Reject new and renamed skills the student already has, in one query for the whole formset."""
+        super().clean()
+        if any(self.errors):
+            return
+        edited, releasing = [], []
+        for form in self.forms:
+            if form.instance.pk and (self._should_delete_form(form) or 'name' in form.changed_data):
+                releasing.append(form.instance.pk)  # Its current name is free after this save.
+            if not self._should_delete_form(form) and form.has_changed() and 'name' in form.changed_data:
+                edited.append(form)
+        if not edited:
+            return
+        keys = {skill_key(form.cleaned_data['name']) for form in edited}
+        # The unique (student, tag) constraint: names equal up to the case and spacing the catalog folds.
+        taken = set(
+            Skill.objects.filter(student=self.student, tag__key__in=keys)
+            .exclude(pk__in=releasing).values_list('tag__key', flat=True)
+        )
+        for form in edited:
+            key = skill_key(form.cleaned_data['name'])
+            if key in taken:
+                form.add_error('name', 'You already have this skill.')
+            taken.add(key)
+
+
+def _formset(model, form, formset=AchievementFormSet):
+    return forms.modelformset_factory(model, form=form, formset=formset, extra=1, can_delete=True, can_delete_extra=False)
+
+
+SkillFormSet = _formset(Skill, SkillForm, BaseSkillFormSet)
+ProjectFormSet = _formset(Project, ProjectForm)
+AwardFormSet = _formset(Award, AwardForm)
+PortfolioItemFormSet = _formset(PortfolioItem, PortfolioItemForm)
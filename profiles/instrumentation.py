@@ -0,0 +1,239 @@
+"""
+Per-request SQL and timing instrumentation.
+
+RequestTimingMiddleware is listed first in MIDDLEWARE and only active when
+PROFILES_INSTRUMENTATION is on. For every request it records the number of
+queries and their total time (on every database alias), the time spent
+rendering templates and the rest of the time spent in Python ("app"). The
+numbers go out in a Server-Timing header. Requests over
+PROFILES_SLOW_REQUEST_MS or PROFILES_SLOW_REQUEST_QUERIES are logged with
+their slowest statements, and SQL that runs PROFILES_REPEATED_QUERY_THRESHOLD
+times or more in one request is logged as a likely N+1. Timings are also kept
+per URL name for the percentiles on the adminpanel metrics page.
+
+The middleware is sync and async capable, so under ASGI it does not push
+the async views (profiles.async_views) onto a thread. Queries are timed by
+an execute_wrapper on every connection of the thread the request's ORM
+calls run in: the request thread for a sync request, and the
+thread-sensitive sync_to_async thread for an async one. Templates are
+timed by wrapping Template.render while at least one instrumented request
+is in flight; each render reports to the request whose context it runs in.
+Both are removed when the request ends.
+"""
+import logging
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import Template as DjangoTemplate
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('profiles_request_metrics', default=None)
+
+
+def instrumentation_enabled():
+    return getattr(settings, 'PROFILES_INSTRUMENTATION', False)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = []  # (sql, seconds)
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.template_sql_time = 0.0  # Queries run by lazy querysets while rendering.
+        self.rendering = 0
+
+    def record_query(self, sql, duration):
+        self.queries.append((sql, duration))
+        self.sql_time += duration
+        if self.rendering:
+            self.template_sql_time += duration
+
+    def slowest(self, n=5):
+        return sorted(self.queries, key=lambda q: q[1], reverse=True)[:n]
+
+    def repeated(self, threshold):
+        """(sql, count) for statements run at least `threshold` times, most repeated first."""
+        counts = Counter(sql for sql, _ in self.queries)
+        return [(sql, n) for sql, n in counts.most_common() if n >= threshold]
+
+
+@contextmanager
+def _query_timing(metrics):
+    """Time every statement run on this thread's connections, for `metrics`."""
+    def timed(execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            metrics.record_query(sql, time.perf_counter() - started)
+
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(timed))
+        yield
+
+
+_render_lock = threading.Lock()
+_render_users = 0
+_original_render = DjangoTemplate.render
+
+
+def _timed_render(self, context=None, request=None):
+    metrics = _current.get()
+    if metrics is None or metrics.rendering:
+        return _original_render(self, context, request)
+    metrics.rendering += 1
+    started = time.perf_counter()
+    try:
+        return _original_render(self, context, request)
+    finally:
+        metrics.template_time += time.perf_counter() - started
+        metrics.rendering -= 1
+
+
+@contextmanager
+def _template_timing():
+    """Wrap Template.render while any instrumented request is in flight."""
+    global _render_users, _original_render
+    with _render_lock:
+        if _render_users == 0:
+            _original_render = DjangoTemplate.render
+            DjangoTemplate.render = _timed_render
+        _render_users += 1
+    try:
+        yield
+    finally:
+        with _render_lock:
+            _render_users -= 1
+            if _render_users == 0:
+                DjangoTemplate.render = _original_render
+
+
+class TimingAggregate:
+    """Recent request timings per URL name, for percentiles. Process-local."""
+
+    def __init__(self, samples=1000):
+        self.samples = samples
+        self._lock = threading.Lock()
+        self._by_name = {}
+
+    def add(self, name, total_ms, sql_ms, queries):
+        with self._lock:
+            if name not in self._by_name:
+                self._by_name[name] = deque(maxlen=self.samples)
+            self._by_name[name].append((total_ms, sql_ms, queries))
+
+    def reset(self):
+        with self._lock:
+            self._by_name.clear()
+
+    def summary(self):
+        """One row per URL name, slowest p95 first."""
+        with self._lock:
+            snapshot = {name: list(samples) for name, samples in self._by_name.items()}
+        rows = []
+        for name, samples in snapshot.items():
+            totals = sorted(s[0] for s in samples)
+            rows.append({
+                'name': name,
+                'count': len(samples),
+                'p50': _percentile(totals, 50),
+                'p95': _percentile(totals, 95),
+                'p99': _percentile(totals, 99),
+                'max': totals[-1],
+                'sql_ms': sum(s[1] for s in samples) / len(samples),
+                'queries': sum(s[2] for s in samples) / len(samples),
+                'max_queries': max(s[2] for s in samples),
+            })
+        rows.sort(key=lambda row: row['p95'], reverse=True)
+        return rows
+
+
+def _percentile(sorted_values, pct):
+    index = round(pct / 100 * (len(sorted_values) - 1))
+    return sorted_values[index]
+
+
+timings = TimingAggregate(getattr(settings, 'PROFILES_INSTRUMENTATION_SAMPLES', 1000))
+
+
+class RequestTimingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not instrumentation_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        self.slow_ms = getattr(settings, 'PROFILES_SLOW_REQUEST_MS', 500)
+        self.slow_queries = getattr(settings, 'PROFILES_SLOW_REQUEST_QUERIES', 20)
+        self.repeat_threshold = getattr(settings, 'PROFILES_REPEATED_QUERY_THRESHOLD', 5)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            with _query_timing(metrics), _template_timing():
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, metrics, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        # Entered and left on the thread the request's sync_to_async ORM calls use.
+        queries = _query_timing(metrics)
+        await sync_to_async(queries.__enter__)()
+        try:
+            with _template_timing():
+                response = await self.get_response(request)
+        finally:
+            await sync_to_async(queries.__exit__)(None, None, None)
+            _current.reset(token)
+        return self._finish(request, response, metrics, time.perf_counter() - started)
+
+    def _finish(self, request, response, metrics, total):
+        sql_ms = metrics.sql_time * 1000
+        template_ms = metrics.template_time * 1000
+        # Queries run while rendering are counted under db, not under tpl or app.
+        app_ms = max(total * 1000 - sql_ms - (template_ms - metrics.template_sql_time * 1000), 0)
+        response['Server-Timing'] = ', '.join([
+            f'db;desc="SQL ({len(metrics.queries)} queries)";dur={sql_ms:.1f}',
+            f'tpl;desc="Templates";dur={template_ms:.1f}',
+            f'app;desc="View and middleware";dur={app_ms:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+
+        match = getattr(request, 'resolver_match', None)
+        name = match.view_name if match and match.view_name else '<unresolved>'
+        timings.add(name, total * 1000, sql_ms, len(metrics.queries))
+        self._log(request, name, metrics, total * 1000)
+        return response
+
+    def _log(self, request, name, metrics, total_ms):
+        repeated = metrics.repeated(self.repeat_threshold)
+        for sql, count in repeated:
+            logger.warning('Likely N+1 in %s %s (%s): %d x %s', request.method, request.path, name, count, sql)
+        if total_ms < self.slow_ms and len(metrics.queries) < self.slow_queries:
+            return
+        slowest = '\n'.join(f'  {seconds * 1000:.1f} ms  {sql}' for sql, seconds in metrics.slowest())
+        logger.warning(
+            'Slow request %s %s (%s): %.0f ms, %d queries in %.0f ms, templates %.0f ms. Slowest statements:\n%s',
+            request.method, request.path, name, total_ms, len(metrics.queries),
+            metrics.sql_time * 1000, metrics.template_time * 1000, slowest,
+        )
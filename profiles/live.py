@@ -0,0 +1,237 @@
+"""
+Live endorsement counts over Server-Sent Events.
+
+Each worker process has one Broadcaster. A browser viewing a profile opens
+an EventSource on /profiles/profile/<pk>/live/ and subscribes to that
+student; record_endorsement() publishes the new count once its transaction
+commits. Endorsements recorded by other workers, flushed write-behind
+counters and recounts are picked up by a single poller thread per process,
+which reads the counters of every subscribed student in one query every
+PROFILES_LIVE_POLL_INTERVAL seconds and publishes the ones that changed.
+It adds this process's write-behind deltas, as record_endorsement() does,
+so a count does not drop back to the committed value until the flush.
+
+A subscriber holds only the latest count per skill: updates published
+while a client is slow to read are merged, not queued, so a stalled
+connection costs at most one entry per skill. Idle streams get a comment
+line every PROFILES_LIVE_KEEPALIVE seconds so proxies keep them open.
+
+Under ASGI (stud/asgi.py) a stream is an async generator waiting on an
+asyncio.Event, so open connections hold no threads. Under WSGI each stream
+occupies a server thread, so it ends after PROFILES_LIVE_WSGI_MAX_AGE
+seconds and the browser reconnects.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import Skill
+
+logger = logging.getLogger(__name__)
+
+# Milliseconds the browser waits before reconnecting a dropped stream.
+RECONNECT_MS = 3000
+
+
+class Subscriber(ABC):
+    """Latest count per skill not yet sent to one client."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def push(self, counts):
+        with self._lock:
+            self._pending.update(counts)
+        self._wake()
+
+    def take(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    @abstractmethod
+    def _wake(self):
+        """Let the stream waiting on this subscriber know there is something to take()."""
+
+
+class AsyncSubscriber(Subscriber):
+    def __init__(self, loop):
+        super().__init__()
+        self._loop = loop
+        self._event = asyncio.Event()
+
+    def _wake(self):
+        # push() runs on request threads and the poller thread.
+        try:
+            self._loop.call_soon_threadsafe(self._event.set)
+        except RuntimeError:
+            pass  # Loop closed; the stream is gone.
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._event.clear()
+
+
+class ThreadSubscriber(Subscriber):
+    def __init__(self):
+        super().__init__()
+        self._event = threading.Event()
+
+    def _wake(self):
+        self._event.set()
+
+    def wait(self, timeout):
+        self._event.wait(timeout)
+        self._event.clear()
+
+
+class Full(Exception):
+    """Raised when the process already serves PROFILES_LIVE_MAX_SUBSCRIBERS streams."""
+
+
+class Broadcaster:
+    def __init__(self, poll_interval, max_subscribers):
+        self.poll_interval = poll_interval
+        self.max_subscribers = max_subscribers
+        self._lock = threading.Lock()
+        self._subscribers = {}  # student_id -> set of Subscriber
+        self._count = 0
+        self._known = {}  # skill_id -> last published count
+        self._poller = None
+
+    def subscribe(self, student_id, subscriber):
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                raise Full
+            self._subscribers.setdefault(student_id, set()).add(subscriber)
+            self._count += 1
+            if self.poll_interval and self._poller is None:
+                self._poller = threading.Thread(target=self._poll, name='profiles-live-poller', daemon=True)
+                self._poller.start()
+
+    def unsubscribe(self, student_id, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(student_id)
+            if not subscribers or subscriber not in subscribers:
+                return
+            subscribers.discard(subscriber)
+            self._count -= 1
+            if not subscribers:
+                del self._subscribers[student_id]
+
+    def subscriber_count(self):
+        with self._lock:
+            return self._count
+
+    def publish(self, student_id, counts):
+        """Send {skill_id: count} to the student's subscribers, skipping unchanged counts."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(student_id, ()))
+            if not subscribers:
+                return
+            changed = {skill_id: count for skill_id, count in counts.items() if self._known.get(skill_id) != count}
+            self._known.update(changed)
+        if changed:
+            for subscriber in subscribers:
+                subscriber.push(changed)
+
+    def _poll(self):
+        try:
+            while True:
+                time.sleep(self.poll_interval)
+                with self._lock:
+                    student_ids = list(self._subscribers)
+                    if not student_ids:
+                        self._poller = None
+                        self._known.clear()
+                        return
+                try:
+                    self.poll(student_ids)
+                except Exception:
+                    logger.exception('Polling endorsement counts failed.')
+        finally:
+            connection.close()
+
+    def poll(self, student_ids):
+        """Publish the counts of these students' skills, in one query."""
+        rows, pending = _endorsement_buffer().read_with_pending(lambda: list(
+            Skill.objects.filter(student_id__in=student_ids).values_list('student_id', 'pk', 'endorsement_count')
+        ))
+        by_student = {}
+        for student_id, skill_id, count in rows:
+            by_student.setdefault(student_id, {})[skill_id] = count + pending.get(skill_id, 0)
+        for student_id, counts in by_student.items():
+            self.publish(student_id, counts)
+
+
+def _endorsement_buffer():
+    # profiles.endorsements publishes through this module.
+    from .endorsements import endorsement_buffer
+    return endorsement_buffer
+
+
+broadcaster = Broadcaster(
+    poll_interval=getattr(settings, 'PROFILES_LIVE_POLL_INTERVAL', 2.0),
+    max_subscribers=getattr(settings, 'PROFILES_LIVE_MAX_SUBSCRIBERS', 1000),
+)
+
+
+def publish_count(skill, count):
+    """Publish a skill's new count after the current transaction commits."""
+    transaction.on_commit(lambda: broadcaster.publish(skill.student_id, {skill.pk: count}))
+
+
+def format_event(counts):
+    data = json.dumps({str(skill_id): count for skill_id, count in counts.items()}, separators=(',', ':'))
+    return f'event: counts\ndata: {data}\n\n'
+
+
+def _keepalive():
+    return getattr(settings, 'PROFILES_LIVE_KEEPALIVE', 15)
+
+
+async def astream(student_id, snapshot):
+    """Event stream for ASGI: sends `snapshot`, then changes as they are published."""
+    subscriber = AsyncSubscriber(asyncio.get_running_loop())
+    try:
+        broadcaster.subscribe(student_id, subscriber)
+    except Full:
+        return
+    keepalive = _keepalive()
+    try:
+        yield f'retry: {RECONNECT_MS}\n' + format_event(snapshot)
+        while True:
+            await subscriber.wait(keepalive)
+            counts = subscriber.take()
+            yield format_event(counts) if counts else ': keepalive\n\n'
+    finally:
+        broadcaster.unsubscribe(student_id, subscriber)
+
+
+def stream(student_id, snapshot):
+    """Event stream for WSGI; ends after PROFILES_LIVE_WSGI_MAX_AGE seconds to free the thread."""
+    subscriber = ThreadSubscriber()
+    try:
+        broadcaster.subscribe(student_id, subscriber)
+    except Full:
+        return
+    keepalive = _keepalive()
+    deadline = time.monotonic() + getattr(settings, 'PROFILES_LIVE_WSGI_MAX_AGE', 60)
+    try:
+        yield f'retry: {RECONNECT_MS}\n' + format_event(snapshot)
+        while (remaining := deadline - time.monotonic()) > 0:
+            subscriber.wait(min(keepalive, remaining))
+            counts = subscriber.take()
+            yield format_event(counts) if counts else ': keepalive\n\n'
+    finally:
+        broadcaster.unsubscribe(student_id, subscriber)
@@ -0,0 +1,65 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from profiles import storage
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete content-addressed portfolio blobs (and their renditions) that no '
+        'PortfolioItem references and that were last saved more than '
+        'PROFILES_BLOB_GRACE_SECONDS ago, plus upload temp files left by '
+        'interrupted saves.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be deleted.')
+        parser.add_argument(
+            '--incoming-age', type=int, default=3600,
+            help='Delete upload temp files older than this many seconds (default: 3600).',
+        )
+
+    def handle(self, *args, **options):
+        root = storage.portfolio_storage.path(storage.CAS_PREFIX)
+        if not os.path.isdir(root):
+            self.stdout.write('No content-addressed uploads yet.')
+            return
+
+        blobs = kept = recent = collected = stale = 0
+        grace_cutoff = time.time() - storage.grace_seconds()
+        for dirpath, dirnames, filenames in os.walk(root):
+            if os.path.basename(dirpath) == '.incoming':
+                cutoff = time.time() - options['incoming_age']
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    if os.path.getmtime(path) < cutoff:
+                        stale += 1
+                        if not options['dry_run']:
+                            os.remove(path)
+                continue
+            for filename in filenames:
+                if filename.startswith('.') or '__' in filename or filename.endswith('.tmp'):
+                    continue  # The lock file; renditions go with their blob.
+                blobs += 1
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, storage.portfolio_storage.location).replace(os.sep, '/')
+                if storage.is_referenced(name):
+                    kept += 1
+                elif options['dry_run']:
+                    if os.path.getmtime(path) >= grace_cutoff:
+                        recent += 1
+                        continue
+                    collected += 1
+                    self.stdout.write(f'Would delete {name}')
+                elif storage.collect_blob(name):
+                    collected += 1
+                else:
+                    recent += 1
+
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{blobs} blobs: {kept} referenced, {recent} saved within the grace period, '
+            f'{verb.lower()} {collected} unreferenced and {stale} stale upload temp files.'
+        ))
@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from profiles.synthetic import Profile, Spread, generate
+
+
+def _spread(value):
+    try:
+        return Spread.parse(value)
+    except ValueError as exc:
+        raise CommandError(str(exc))
+
+
+class Command(BaseCommand):
+    help = (
+        'Create N synthetic students with skills, projects, awards, portfolio links '
+        'and endorsements, for benchmarks and load tests. Per-student counts are '
+        'given as LOW:HIGH[:SKEW]; a SKEW above 1 makes most students small.'
+    )
+
+    def add_arguments(self, parser):
+        defaults = Profile()
+        parser.add_argument('count', type=int, help='Number of students to create.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0).')
+        parser.add_argument('--prefix', default='synthetic', help='Username prefix (default: synthetic).')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Students per transaction.')
+        for name in ('skills', 'projects', 'awards', 'portfolio', 'endorsements'):
+            spread = getattr(defaults, name)
+            parser.add_argument(
+                f'--{name}', type=str, default=f'{spread.low}:{spread.high}:{spread.skew:g}',
+                help=f'{name.capitalize()} per {"skill" if name == "endorsements" else "student"} (default: %(default)s).',
+            )
+        parser.add_argument('--public-ratio', type=float, default=defaults.public_ratio, help='Share of public profiles.')
+
+    def handle(self, *args, **options):
+        profile = Profile(
+            skills=_spread(options['skills']),
+            projects=_spread(options['projects']),
+            awards=_spread(options['awards']),
+            portfolio=_spread(options['portfolio']),
+            endorsements=_spread(options['endorsements']),
+            public_ratio=options['public_ratio'],
+        )
+        started = time.monotonic()
+        ids = generate(options['count'], seed=options['seed'], profile=profile,
+                       prefix=options['prefix'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Created {len(ids)} students in {time.monotonic() - started:.1f}s.'))
@@ -0,0 +1,49 @@
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from profiles import renditions
+from profiles.models import PortfolioItem
+from profiles.signals import touch_students
+
+
+class Command(BaseCommand):
+    help = 'Generate missing thumbnail, medium and WebP renditions for every portfolio screenshot.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate renditions that already exist.')
+
+    def handle(self, *args, **options):
+        storage = PortfolioItem._meta.get_field('screenshot').storage
+        items = (
+            PortfolioItem.objects.exclude(screenshot__isnull=True).exclude(screenshot='')
+            .order_by('pk').values_list('student_id', 'screenshot').iterator(chunk_size=500)
+        )
+        executor = renditions.get_executor()
+        window = getattr(settings, 'PROFILES_RENDITION_WORKERS', 2) * 4
+        pending = {}
+        written = failed = 0
+
+        def collect(done):
+            nonlocal written, failed
+            for future in done:
+                name, student_id = pending.pop(future)
+                try:
+                    written += future.result()
+                    touch_students([student_id])
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f'{name}: {exc}')
+
+        for student_id, name in items:
+            targets = renditions.missing_targets(name, storage, force=options['force'])
+            if not targets:
+                continue
+            if len(pending) >= window:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending[executor.submit(renditions.render_file, storage.path(name), targets)] = (name, student_id)
+        collect(wait(pending).done)
+
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} renditions ({failed} screenshots failed).'))
@@ -0,0 +1,206 @@
+import csv
+import json
+import os
+import time
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from profiles import search
+from profiles.models import Student, Skill, SkillTag, Project, Award, PortfolioItem, StudentStats, skill_key
+
+# CSV cells holding several entries separate them with "|"; project and award
+# entries may carry a description and portfolio entries a URL after "::".
+LIST_SEPARATOR = '|'
+DETAIL_SEPARATOR = '::'
+
+
+def _truthy(value, default=True):
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y', 't')
+
+
+def _split_csv_list(cell):
+    return [part.strip() for part in (cell or '').split(LIST_SEPARATOR) if part.strip()]
+
+
+def _titled(entries, detail_key):
+    """Normalize strings, "title::detail" strings and dicts to dicts with title/detail_key."""
+    for entry in entries or ():
+        if isinstance(entry, dict):
+            title = (entry.get('title') or '').strip()
+            detail = (entry.get(detail_key) or '').strip()
+        else:
+            title, _, detail = str(entry).partition(DETAIL_SEPARATOR)
+            title, detail = title.strip(), detail.strip()
+        if title:
+            yield {'title': title, detail_key: detail}
+
+
+def read_jsonl(handle):
+    for line_no, line in enumerate(handle, 1):
+        line = line.strip()
+        if not line:
+            yield None
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            raise CommandError(f'Line {line_no}: invalid JSON ({exc}).')
+        if not isinstance(record, dict):
+            raise CommandError(f'Line {line_no}: expected a JSON object.')
+        yield record
+
+
+def read_csv(handle):
+    for row in csv.DictReader(handle):
+        row['skills'] = _split_csv_list(row.get('skills'))
+        row['projects'] = _split_csv_list(row.get('projects'))
+        row['awards'] = _split_csv_list(row.get('awards'))
+        row['portfolio'] = _split_csv_list(row.get('portfolio'))
+        yield row
+
+
+class Command(BaseCommand):
+    help = (
+        'Bulk-import students with their skills, projects, awards and portfolio '
+        'links from a CSV or JSONL file. JSONL records look like {"username": ..., '
+        '"email": ..., "bio": ..., "is_public": true, "skills": ["Python"], '
+        '"projects": [{"title": ..., "description": ...}], "awards": [...], '
+        '"portfolio": [{"title": ..., "url": ...}]}. CSV files use the same keys as '
+        'columns, with list entries separated by "|" and "title::detail" for '
+        'descriptions and URLs. Existing usernames are skipped; imported users get '
+        'unusable passwords.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file to import.')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Input format (default: from the file extension).')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Students per transaction.')
+        parser.add_argument('--checkpoint', help='Checkpoint file (default: <path>.checkpoint).')
+        parser.add_argument('--resume', action='store_true', help='Skip the records a previous run already committed.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+        batch_size = options['batch_size']
+        checkpoint = options['checkpoint'] or f'{path}.checkpoint'
+
+        done = self._load_checkpoint(checkpoint, path) if options['resume'] else 0
+        if done:
+            self.stdout.write(f'Resuming after record {done}.')
+
+        totals = {'students': 0, 'skipped': 0, 'achievements': 0}
+        started = time.monotonic()
+        with open(path, newline='', encoding='utf-8') as handle:
+            records = read_csv(handle) if fmt == 'csv' else read_jsonl(handle)
+            records = islice(records, done, None)
+            while True:
+                batch = list(islice(records, batch_size))
+                if not batch:
+                    break
+                with transaction.atomic():
+                    created, skipped, achievements = self._import_batch([r for r in batch if r])
+                done += len(batch)
+                self._save_checkpoint(checkpoint, path, done)
+
+                totals['students'] += created
+                totals['skipped'] += skipped
+                totals['achievements'] += achievements
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'{done} records: {totals["students"]} students, {totals["achievements"]} achievements, '
+                    f'{totals["skipped"]} skipped ({totals["students"] / elapsed:.0f} students/s)'
+                )
+
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {totals["students"]} students and {totals["achievements"]} achievements '
+            f'in {time.monotonic() - started:.1f}s ({totals["skipped"]} skipped).'
+        ))
+
+    def _import_batch(self, records):
+        User = get_user_model()
+        by_username = {}
+        for record in records:
+            username = (record.get('username') or '').strip()
+            if username and username not in by_username:
+                by_username[username] = record
+        existing = set(User.objects.filter(username__in=by_username).values_list('username', flat=True))
+        skipped = len(records) - len(by_username) + len(existing)
+        records = [record for username, record in by_username.items() if username not in existing]
+        if not records:
+            return 0, skipped, 0
+
+        # One unusable-password hash shared by the batch; hashing per user would dominate the run.
+        unusable = make_password(None)
+        users = User.objects.bulk_create([
+            User(
+                username=record['username'].strip(),
+                email=(record.get('email') or '').strip(),
+                first_name=(record.get('first_name') or '').strip(),
+                last_name=(record.get('last_name') or '').strip(),
+                password=unusable,
+            )
+            for record in records
+        ])
+        students = Student.objects.bulk_create([
+            Student(user=user, bio=record.get('bio') or '', is_public=_truthy(record.get('is_public')))
+            for user, record in zip(users, records)
+        ])
+
+        # Skills take the catalog spelling; one per tag per student.
+        skill_names = {
+            student.pk: [' '.join(str(name).split())[:100] for name in record.get('skills') or ()]
+            for student, record in zip(students, records)
+        }
+        tags = SkillTag.objects.for_names(name for names in skill_names.values() for name in names if name)
+        tag_counts = {}
+        skills, projects, awards, portfolio = [], [], [], []
+        for student, record in zip(students, records):
+            student_tags = {tags[skill_key(name)] for name in skill_names[student.pk] if name}
+            skills += [Skill(student=student, name=tag.name, tag=tag) for tag in student_tags]
+            if student.is_public:
+                for tag in student_tags:
+                    tag_counts[tag.pk] = tag_counts.get(tag.pk, 0) + 1
+            for entry in _titled(record.get('projects'), 'description'):
+                projects.append(Project(student=student, **entry))
+            for entry in _titled(record.get('awards'), 'description'):
+                awards.append(Award(student=student, **entry))
+            for entry in _titled(record.get('portfolio'), 'url'):
+                portfolio.append(PortfolioItem(student=student, title=entry['title'], url=entry['url'] or None))
+
+        Skill.objects.bulk_create(skills, batch_size=500)
+        Project.objects.bulk_create(projects, batch_size=500)
+        Award.objects.bulk_create(awards, batch_size=500)
+        PortfolioItem.objects.bulk_create(portfolio, batch_size=500)
+
+        # bulk_create sends no signals: refresh the derived tables for the batch.
+        student_ids = [student.pk for student in students]
+        StudentStats.objects.rebuild(student_ids)
+        SkillTag.objects.bump_counts(tag_counts)
+        search.index_students(student_ids)
+        return len(students), skipped, len(skills) + len(projects) + len(awards) + len(portfolio)
+
+    def _load_checkpoint(self, checkpoint, path):
+        try:
+            with open(checkpoint) as handle:
+                state = json.load(handle)
+        except FileNotFoundError:
+            return 0
+        if state.get('source') != os.path.abspath(path):
+            raise CommandError(f'{checkpoint} belongs to {state.get("source")}, not {path}.')
+        return int(state.get('records', 0))
+
+    def _save_checkpoint(self, checkpoint, path, records):
+        tmp = f'{checkpoint}.tmp'
+        with open(tmp, 'w') as handle:
+            json.dump({'source': os.path.abspath(path), 'records': records}, handle)
+        os.replace(tmp, checkpoint)
@@ -0,0 +1,409 @@
+"""
+HTTP load test against the app.
+
+The command starts stud.wsgi.application in Django's threaded WSGI server in
+a separate process, or stud.asgi.application under uvicorn with --interface
+asgi (uvicorn is optional and only needed for that). --url points it at a
+server that is already running instead. It then drives the server from
+--workers client processes with --connections keep-alive connections each.
+Each connection logs in as its worker's loadtest_<n> user and sends a
+weighted mix of
+leaderboard reads, profile views, endorsement POSTs (session plus CSRF) and
+profile edits. Arrivals are Poisson at --rate requests per second overall,
+or back to back with --rate 0. With a rate, latency is measured from each
+request's scheduled time, so queueing behind a slow server is counted.
+
+Workers stop the run if a login does not answer with a redirect and a
+session cookie, and redirects from the endorse and edit POSTs (other than
+edit's own post/redirect/get) count as errors, so lost sessions are not
+reported as successes.
+
+Requests that failed because SQLite reported "database is locked" are
+counted separately from other server errors. The local server marks them
+with an X-Loadtest-Error header, and error pages are also checked for the
+message.
+
+--db-profile production starts the local server with STUD_DB_PROFILE set
+(see stud/settings.py), and --async-views with PROFILES_ASYNC_VIEWS, so one
+run per setting compares them.
+
+This writes to the configured database: endorsements, profile edits and
+the loadtest_<n> users. Run it against a copy seeded with
+`manage.py generate_profiles`.
+"""
+import http.client
+import json
+import math
+import multiprocessing
+import os
+import random
+import secrets
+import threading
+import time
+import urllib.parse
+from http.cookies import SimpleCookie
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+ENDPOINTS = ('leaderboard', 'profile', 'endorse', 'edit')
+DEFAULT_MIX = 'leaderboard=45,profile=35,endorse=15,edit=5'
+LEADERBOARD_MODES = ('overall', 'projects', 'skills', 'awards', 'endorsements')
+PASSWORD = 'loadtest-password'
+LOCKED_HEADER = 'X-Loadtest-Error'
+LOCKED_MESSAGE = b'database is locked'
+
+
+def serve(ready, interface='wsgi'):
+    """Server process: run the app on a free port and report the port through `ready`."""
+    import logging
+    import sys
+    import threading
+
+    import django
+    django.setup()
+
+    if interface == 'asgi':
+        serve_asgi(ready)
+        return
+
+    from django.core.servers.basehttp import WSGIServer, run
+    from django.core.signals import got_request_exception
+    from django.db import OperationalError
+
+    from stud.wsgi import application
+
+    logging.getLogger('django.server').setLevel(logging.ERROR)
+    state = threading.local()
+
+    def record_exception(sender, **kwargs):
+        exc = sys.exc_info()[1]
+        state.locked = isinstance(exc, OperationalError) and 'database is locked' in str(exc)
+
+    got_request_exception.connect(record_exception)
+
+    def flagged(environ, start_response):
+        state.locked = False
+
+        def _start_response(status, headers, exc_info=None):
+            if state.locked:
+                headers = list(headers) + [(LOCKED_HEADER, 'database-locked')]
+            return start_response(status, headers, exc_info)
+
+        return application(environ, _start_response)
+
+    class Server(WSGIServer):
+        request_queue_size = 256
+
+    run('127.0.0.1', 0, flagged, threading=True, server_cls=Server,
+        on_bind=lambda port: ready.put(port))
+
+
+def serve_asgi(ready):
+    """Serve stud.asgi.application with uvicorn. Locked errors are only detected from error pages here."""
+    import socket
+
+    try:
+        import uvicorn
+    except ImportError:
+        ready.put('uvicorn is not installed; `pip install uvicorn` to load-test the ASGI app.')
+        return
+    from stud.asgi import application
+
+    sock = socket.socket()
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('127.0.0.1', 0))
+    ready.put(sock.getsockname()[1])
+    config = uvicorn.Config(application, log_level='warning', access_log=False, backlog=2048)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class Client:
+    """One keep-alive connection with a cookie jar and the double-submit CSRF cookie."""
+
+    def __init__(self, base_url, timeout=30):
+        url = urllib.parse.urlsplit(base_url)
+        self.host, self.port = url.hostname, url.port or 80
+        self.prefix = url.path.rstrip('/')
+        self.timeout = timeout
+        self.cookies = {'csrftoken': secrets.token_hex(16)}
+        self.conn = None
+
+    def request(self, method, path, form=None):
+        """Returns (status, locked, redirect path or None)."""
+        body, headers = None, {'Cookie': '; '.join(f'{k}={v}' for k, v in self.cookies.items())}
+        if method == 'POST':
+            # Django rotates the token at login; always echo the current cookie.
+            headers['X-CSRFToken'] = self.cookies['csrftoken']
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            body = urllib.parse.urlencode(form or {})
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            self.conn.request(method, self.prefix + path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            content = response.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.conn = None
+            raise
+        for header in response.headers.get_all('Set-Cookie') or ():
+            for name, morsel in SimpleCookie(header).items():
+                self.cookies[name] = morsel.value
+        if response.headers.get('Connection', '').lower() == 'close':
+            self.conn.close()
+            self.conn = None
+        locked = response.headers.get(LOCKED_HEADER) == 'database-locked' or (
+            response.status >= 500 and LOCKED_MESSAGE in content
+        )
+        location = response.headers.get('Location')
+        return response.status, locked, location and urllib.parse.urlsplit(location).path
+
+
+# Redirects the POST endpoints answer with on success (post/redirect/get).
+POST_REDIRECTS = {
+    'edit': '/profiles/profile/edit/',
+}
+
+
+def classify(endpoint, status, locked, redirect=None):
+    if locked:
+        return 'locked'
+    if status >= 500:
+        return 'server_error'
+    if 300 <= status < 400 and endpoint in ('endorse', 'edit'):
+        expected = POST_REDIRECTS.get(endpoint)
+        if not (expected and redirect and redirect.endswith(expected)):
+            return 'redirected'  # Usually to the login page: the session was lost.
+    if endpoint == 'endorse' and status == 400:
+        return 'duplicate'  # Already endorsed from this session; expected now and then.
+    if status >= 400:
+        return 'client_error'
+    return 'ok'
+
+
+def work(index, plan, ready, start, results):
+    """
+    Worker process: open plan['connections'] logged-in clients, report on
+    `ready`, then send plan['mix'] traffic from each, in its own thread, from
+    the monotonic time in `start` for plan['duration'] seconds. Puts the
+    (endpoint, kind, ms) rows of all of them on `results`.
+    """
+    clients = []
+    for n in range(plan['connections']):
+        client = Client(plan['url'])
+        username = f'loadtest_{index}'
+        status, _, _ = client.request('POST', '/accounts/login/', {'username': username, 'password': PASSWORD})
+        if status != 302 or plan['session_cookie'] not in client.cookies:
+            ready.put(f'{username} could not log in (HTTP {status}); every authenticated request would be redirected.')
+            return
+        clients.append(client)
+    ready.put(index)
+    while not start.value:
+        time.sleep(0.01)
+
+    rows = []
+    threads = [
+        threading.Thread(target=drive, args=(client, random.Random(f'{plan["seed"]}-{index}-{n}'), plan, start.value, rows))
+        for n, client in enumerate(clients)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put(rows)
+
+
+def drive(client, rng, plan, scheduled, rows):
+    names, weights = zip(*plan['mix'].items())
+    rate = plan['rate'] / (plan['workers'] * plan['connections'])
+    deadline = scheduled + plan['duration']
+    time.sleep(max(0, scheduled - time.monotonic()))
+    while True:
+        if rate:
+            scheduled += rng.expovariate(rate)
+            delay = scheduled - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        else:
+            scheduled = time.monotonic()
+        if scheduled >= deadline:
+            break
+        endpoint = rng.choices(names, weights)[0]
+        if endpoint == 'leaderboard':
+            args = ('GET', f'/profiles/leaderboard/?by={rng.choice(LEADERBOARD_MODES)}')
+        elif endpoint == 'profile':
+            args = ('GET', f'/profiles/profile/{rng.choice(plan["students"])}/')
+        elif endpoint == 'endorse':
+            args = ('POST', f'/profiles/endorse/{rng.choice(plan["skills"])}/')
+        else:
+            args = ('POST', '/profiles/profile/edit/', {'bio': f'Load test edit {rng.random():.6f}', 'is_public': 'on'})
+        try:
+            kind = classify(endpoint, *client.request(*args))
+        except (OSError, http.client.HTTPException):
+            kind = 'connection_error'
+        rows.append((endpoint, kind, (time.monotonic() - scheduled) * 1000))
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    # Nearest rank.
+    return sorted_values[max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)]
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise CommandError(f'Unknown endpoint {name!r} in --mix; choose from {", ".join(ENDPOINTS)}.')
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise CommandError(f'Invalid weight in --mix: {part!r}.')
+    mix = {name: weight for name, weight in mix.items() if weight > 0}
+    if not mix:
+        raise CommandError('--mix has no endpoint with a positive weight.')
+    return mix
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive the app with concurrent mixed traffic (leaderboard, profile views, '
+        'endorsements, profile edits) from several processes and report throughput, '
+        'p50/p95/p99 latency and error rates per endpoint, including SQLite '
+        '"database is locked" failures. Writes to the configured database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Base URL of a running server (default: start one locally).')
+        parser.add_argument('--workers', type=int, default=4, help='Client processes (default: 4).')
+        parser.add_argument('--connections', type=int, default=1, help='Concurrent connections per worker (default: 1).')
+        parser.add_argument(
+            '--interface', choices=['wsgi', 'asgi'], default='wsgi',
+            help='Serve stud.wsgi with Django\'s threaded server, or stud.asgi with uvicorn (default: wsgi).',
+        )
+        parser.add_argument('--duration', type=float, default=30, help='Seconds of traffic (default: 30).')
+        parser.add_argument('--rate', type=float, default=50, help='Requests per second over all workers; 0 sends back to back (default: 50).')
+        parser.add_argument('--mix', default=DEFAULT_MIX, help=f'Endpoint weights (default: {DEFAULT_MIX}).')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0).')
+        parser.add_argument(
+            '--db-profile', choices=['default', 'production'],
+            help='STUD_DB_PROFILE for the local server (default: inherited from the environment).',
+        )
+        parser.add_argument('--async-views', action='store_true', help='Start the local server with PROFILES_ASYNC_VIEWS=1.')
+        parser.add_argument('--json', dest='json_path', help='Also write the report to this JSON file.')
+
+    def handle(self, *args, **options):
+        from django.contrib.auth import get_user_model
+        from django.db import connections
+        from profiles.models import Skill, Student
+
+        mix = parse_mix(options['mix'])
+        if options['url'] and (options['db_profile'] or options['async_views'] or options['interface'] != 'wsgi'):
+            raise CommandError('--db-profile, --async-views and --interface only apply to the local server; drop --url.')
+        workers = options['workers']
+        students = list(Student.objects.filter(is_public=True).values_list('pk', flat=True)[:10000])
+        skills = list(Skill.objects.filter(student__is_public=True).values_list('pk', flat=True)[:50000])
+        if not students or not skills:
+            raise CommandError('No public students with skills; seed the database with generate_profiles first.')
+        User = get_user_model()
+        for index in range(workers):
+            if not User.objects.filter(username=f'loadtest_{index}').exists():
+                User.objects.create_user(f'loadtest_{index}', password=PASSWORD)
+        connections.close_all()
+
+        context = multiprocessing.get_context('spawn')
+        server = None
+        url = options['url']
+        if not url:
+            if options['db_profile']:
+                os.environ['STUD_DB_PROFILE'] = options['db_profile']
+            if options['async_views']:
+                os.environ['PROFILES_ASYNC_VIEWS'] = '1'
+            ready = context.Queue()
+            server = context.Process(target=serve, args=(ready, options['interface']), daemon=True)
+            server.start()
+            port = ready.get(timeout=60)
+            if isinstance(port, str):
+                raise CommandError(port)
+            url = f'http://127.0.0.1:{port}'
+            self.stdout.write(f'Serving stud.{options["interface"]}.application at {url} '
+                              f'(database profile: {os.environ.get("STUD_DB_PROFILE") or "default"})')
+
+        processes = []
+        try:
+            ready, start, results = context.Queue(), context.Value('d', 0.0), context.Queue()
+            plan = {
+                'url': url, 'mix': mix, 'rate': options['rate'], 'workers': workers, 'seed': options['seed'],
+                'connections': options['connections'], 'session_cookie': settings.SESSION_COOKIE_NAME,
+                'duration': options['duration'], 'students': students, 'skills': skills,
+            }
+            processes = [context.Process(target=work, args=(index, plan, ready, start, results)) for index in range(workers)]
+            for process in processes:
+                process.start()
+            for _ in processes:
+                message = ready.get(timeout=120)
+                if isinstance(message, str):
+                    raise CommandError(message)
+            self.stdout.write(f'{workers} workers x {options["connections"]} connections for {options["duration"]:g}s, '
+                              f'{"%g req/s" % options["rate"] if options["rate"] else "closed loop"}, mix {options["mix"]}')
+            start.value = time.monotonic() + 0.1
+            rows = []
+            for _ in processes:
+                rows += results.get()
+            for process in processes:
+                process.join()
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+            if server is not None:
+                server.terminate()
+                server.join()
+
+        report = self.summarize(rows, options['duration'])
+        self.print_report(report)
+        if options['json_path']:
+            with open(options['json_path'], 'w') as handle:
+                json.dump(report, handle, indent=2)
+
+    def summarize(self, rows, duration):
+        report = {}
+        for endpoint in ENDPOINTS + ('all',):
+            selected = [row for row in rows if endpoint in ('all', row[0])]
+            if not selected:
+                continue
+            latencies = sorted(ms for _, _, ms in selected)
+            kinds = {}
+            for _, kind, _ in selected:
+                kinds[kind] = kinds.get(kind, 0) + 1
+            errors = sum(n for kind, n in kinds.items() if kind in ('server_error', 'locked', 'connection_error', 'client_error', 'redirected'))
+            report[endpoint] = {
+                'requests': len(selected),
+                'throughput': len(selected) / duration,
+                'p50_ms': percentile(latencies, 50),
+                'p95_ms': percentile(latencies, 95),
+                'p99_ms': percentile(latencies, 99),
+                'max_ms': latencies[-1],
+                'error_rate': errors / len(selected),
+                'outcomes': kinds,
+            }
+        return report
+
+    def print_report(self, report):
+        self.stdout.write(
+            f'\n{"endpoint":<12}{"requests":>9}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}'
+            f'{"max ms":>9}{"errors":>8}{"locked":>8}'
+        )
+        for endpoint, row in report.items():
+            self.stdout.write(
+                f'{endpoint:<12}{row["requests"]:>9}{row["throughput"]:>9.1f}{row["p50_ms"]:>9.1f}'
+                f'{row["p95_ms"]:>9.1f}{row["p99_ms"]:>9.1f}{row["max_ms"]:>9.1f}'
+                f'{row["error_rate"]:>8.1%}{row["outcomes"].get("locked", 0):>8}'
+            )
+        locked = report.get('all', {}).get('outcomes', {}).get('locked', 0)
+        if locked:
+            self.stdout.write(self.style.ERROR(f'{locked} requests failed with "database is locked".'))
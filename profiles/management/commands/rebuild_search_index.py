@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from profiles import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the FTS5 profile search index from students, skills, projects and awards.'
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError('Full-text search needs the SQLite database backend.')
+        count = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} students.'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from profiles.models import StudentStats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized StudentStats table from skills, projects, awards and endorsements.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Students per INSERT ... ON CONFLICT batch.')
+        parser.add_argument('--student', type=int, action='append', dest='students', help='Only rebuild this student id (repeatable).')
+
+    def handle(self, *args, **options):
+        written = StudentStats.objects.rebuild(options['students'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt stats for {written} students.'))
@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from profiles import rankings
+from profiles.models import Skill, Endorsement
+from profiles.signals import touch_students
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute Skill.endorsement_count from Endorsement rows. Skills are '
+        'streamed in primary-key chunks with one grouped COUNT per chunk, so '
+        'memory stays bounded by --chunk-size. Increments still buffered by '
+        'write-behind web processes are counted again when they flush, so run '
+        'it when none are pending.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Skills per chunk.')
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without writing corrections.')
+        parser.add_argument('--diff', action='store_true', help='Print one line per corrected skill.')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        dry_run = options['dry_run']
+        show_diff = options['diff'] or dry_run
+
+        scanned = drifted = drift_total = 0
+        last_pk = 0
+        while True:
+            chunk = list(
+                Skill.objects.filter(pk__gt=last_pk).order_by('pk')
+                .values_list('pk', 'student_id', 'tag_id', 'endorsement_count')[:chunk_size]
+            )
+            if not chunk:
+                break
+            last_pk = chunk[-1][0]
+            scanned += len(chunk)
+
+            true_counts = dict(
+                Endorsement.objects.filter(skill_id__gte=chunk[0][0], skill_id__lte=last_pk)
+                .order_by().values('skill_id').annotate(n=Count('pk')).values_list('skill_id', 'n')
+            )
+            corrections = []
+            students, tags = set(), set()
+            now = timezone.now()
+            for pk, student_id, tag_id, stored in chunk:
+                actual = true_counts.get(pk, 0)
+                if actual == stored:
+                    continue
+                drifted += 1
+                drift_total += actual - stored
+                corrections.append(Skill(pk=pk, endorsement_count=actual, updated_at=now))
+                students.add(student_id)
+                tags.add(tag_id)
+                if show_diff:
+                    self.stdout.write(f'skill {pk}: {stored} -> {actual} ({actual - stored:+d})')
+
+            if corrections and not dry_run:
+                with transaction.atomic():
+                    Skill.objects.bulk_update(corrections, ['endorsement_count', 'updated_at'], batch_size=500)
+                    touch_students(students)
+                    rankings.invalidate_top(tags)
+
+        verb = 'would correct' if dry_run else 'corrected'
+        self.stdout.write(self.style.SUCCESS(
+            f'Scanned {scanned} skills; {verb} {drifted} (net drift {drift_total:+d}).'
+        ))
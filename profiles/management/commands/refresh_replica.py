@@ -0,0 +1,53 @@
+import os
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from profiles.routers import REPLICA_ALIAS
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy the primary SQLite database into the read replica file with the '
+        'online backup API. The primary stays writable while it runs. With '
+        '--every, keep refreshing at that interval.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, help='Refresh every this many seconds until interrupted.')
+        parser.add_argument(
+            '--pages', type=int, default=-1,
+            help='Pages copied per backup step; -1 copies everything in one step (default).',
+        )
+
+    def handle(self, *args, **options):
+        if REPLICA_ALIAS not in settings.DATABASES:
+            raise CommandError(f'No "{REPLICA_ALIAS}" database configured (set STUD_REPLICA=1).')
+        primary, replica = settings.DATABASES['default'], settings.DATABASES[REPLICA_ALIAS]
+        for db in (primary, replica):
+            if db['ENGINE'] not in ('django.db.backends.sqlite3', 'stud.sqlite'):
+                raise CommandError('refresh_replica copies SQLite files only.')
+        if os.path.abspath(primary['NAME']) == os.path.abspath(replica['NAME']):
+            raise CommandError('The replica and the primary are the same file.')
+
+        while True:
+            started = time.monotonic()
+            pages = self.refresh(primary['NAME'], replica['NAME'], options['pages'])
+            self.stdout.write(f'Copied {pages} pages to {replica["NAME"]} in {time.monotonic() - started:.2f}s.')
+            if not options['every']:
+                break
+            time.sleep(max(0, options['every'] - (time.monotonic() - started)))
+
+    def refresh(self, source_path, replica_path, pages):
+        source = sqlite3.connect(source_path, timeout=30)
+        replica = sqlite3.connect(replica_path, timeout=30)
+        try:
+            # Readers of the replica see either the old or the new copy; the
+            # final step takes the replica's write lock only briefly.
+            source.backup(replica, pages=pages)
+            return source.execute('PRAGMA page_count').fetchone()[0]
+        finally:
+            replica.close()
+            source.close()
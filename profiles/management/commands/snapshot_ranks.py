@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from profiles.rankings import take_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        'Record every public student\'s leaderboard rank in each mode, storing '
+        'only the ranks that changed since the previous snapshot. With --every, '
+        'keep snapshotting at that interval.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, help='Snapshot every this many seconds until interrupted.')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            snapshot, written = take_snapshot(batch_size=options['batch_size'])
+            self.stdout.write(f'Snapshot {snapshot.pk}: {written} changed ranks in {time.monotonic() - started:.2f}s.')
+            if not options['every']:
+                break
+            time.sleep(max(0, options['every'] - (time.monotonic() - started)))
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_stats(apps, schema_editor):
+    Student = apps.get_model('profiles', 'Student')
+    StudentStats = apps.get_model('profiles', 'StudentStats')
+
+    def count(model_name, field):
+        rows = apps.get_model('profiles', model_name).objects.filter(**{field: OuterRef('pk')})
+        return Coalesce(Subquery(rows.order_by().values(field).annotate(n=Count('pk')).values('n')), 0)
+
+    students = Student.objects.annotate(
+        n_skills=count('Skill', 'student'),
+        n_projects=count('Project', 'student'),
+        n_awards=count('Award', 'student'),
+        n_endorsements=count('Endorsement', 'skill__student'),
+    )
+    StudentStats.objects.bulk_create(
+        [
+            StudentStats(
+                student_id=s.pk,
+                is_public=s.is_public,
+                num_skills=s.n_skills,
+                num_projects=s.n_projects,
+                num_awards=s.n_awards,
+                total_endorsements=s.n_endorsements,
+                overall_score=s.n_projects * 3 + s.n_skills * 2 + s.n_awards + s.n_endorsements,
+            )
+            for s in students.iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentStats',
+            fields=[
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='profiles.student')),
+                ('is_public', models.BooleanField(default=True)),
+                ('num_skills', models.PositiveIntegerField(default=0)),
+                ('num_projects', models.PositiveIntegerField(default=0)),
+                ('num_awards', models.PositiveIntegerField(default=0)),
+                ('total_endorsements', models.PositiveIntegerField(default=0)),
+                ('overall_score', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'student stats',
+                'indexes': [models.Index(fields=['is_public', '-overall_score', '-num_projects', 'student'], name='stats_overall_idx'), models.Index(fields=['is_public', '-num_projects', '-num_skills', '-num_awards', 'student'], name='stats_projects_idx'), models.Index(fields=['is_public', '-num_skills', '-num_projects', '-num_awards', 'student'], name='stats_skills_idx'), models.Index(fields=['is_public', '-num_awards', '-num_projects', '-num_skills', 'student'], name='stats_awards_idx'), models.Index(fields=['is_public', '-total_endorsements', '-num_projects', 'student'], name='stats_endorsements_idx')],
+            },
+        ),
+        migrations.RunPython(populate_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0002_student_stats'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='studentstats',
+            name='stats_overall_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='studentstats',
+            name='stats_projects_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='studentstats',
+            name='stats_skills_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='studentstats',
+            name='stats_awards_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='studentstats',
+            name='stats_endorsements_idx',
+        ),
+        migrations.AddIndex(
+            model_name='studentstats',
+            index=models.Index(condition=models.Q(('is_public', True)), fields=['-overall_score', '-num_projects', 'student'], name='stats_overall_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentstats',
+            index=models.Index(condition=models.Q(('is_public', True)), fields=['-num_projects', '-num_skills', '-num_awards', 'student'], name='stats_projects_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentstats',
+            index=models.Index(condition=models.Q(('is_public', True)), fields=['-num_skills', '-num_projects', '-num_awards', 'student'], name='stats_skills_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentstats',
+            index=models.Index(condition=models.Q(('is_public', True)), fields=['-num_awards', '-num_projects', '-num_skills', 'student'], name='stats_awards_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentstats',
+            index=models.Index(condition=models.Q(('is_public', True)), fields=['-total_endorsements', '-num_projects', 'student'], name='stats_endorsements_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE profiles_search USING fts5("
+        "username, bio, skills, projects, awards, "
+        "tokenize = 'porter unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+    schema_editor.execute(
+        "INSERT INTO profiles_search (rowid, username, bio, skills, projects, awards) "
+        "SELECT s.id, u.username, s.bio, "
+        "(SELECT group_concat(name, ' ') FROM profiles_skill WHERE student_id = s.id), "
+        "(SELECT group_concat(title || ' ' || description, ' ') FROM profiles_project WHERE student_id = s.id), "
+        "(SELECT group_concat(title || ' ' || description, ' ') FROM profiles_award WHERE student_id = s.id) "
+        "FROM profiles_student s JOIN auth_user u ON u.id = s.user_id"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS profiles_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0003_leaderboard_partial_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:44
+
+import profiles.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0005_student_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='portfolioitem',
+            name='file',
+            field=models.FileField(blank=True, db_index=True, null=True, storage=profiles.storage.get_portfolio_storage, upload_to='portfolio/'),
+        ),
+        migrations.AlterField(
+            model_name='portfolioitem',
+            name='screenshot',
+            field=models.ImageField(blank=True, db_index=True, null=True, storage=profiles.storage.get_portfolio_storage, upload_to='portfolio/screens/'),
+        ),
+    ]
@@ -0,0 +1,76 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_tags(apps, schema_editor):
+    """Map every Skill to a SkillTag by its case- and space-folded name, then count students per tag."""
+    SkillTag = apps.get_model('profiles', 'SkillTag')
+    Skill = apps.get_model('profiles', 'Skill')
+    db = schema_editor.connection.alias
+
+    tag_ids = dict(SkillTag.objects.using(db).values_list('key', 'pk'))
+    last_pk = 0
+    while True:
+        chunk = list(Skill.objects.using(db).filter(pk__gt=last_pk).order_by('pk').only('pk', 'name')[:2000])
+        if not chunk:
+            break
+        last_pk = chunk[-1].pk
+        # The first spelling met (lowest skill id) names the tag.
+        new = {}
+        for skill in chunk:
+            display = ' '.join(skill.name.split())
+            key = display.casefold()
+            if key not in tag_ids:
+                new.setdefault(key, display)
+        if new:
+            SkillTag.objects.using(db).bulk_create([SkillTag(key=key, name=name) for key, name in new.items()])
+            tag_ids.update(SkillTag.objects.using(db).filter(key__in=new).values_list('key', 'pk'))
+        for skill in chunk:
+            skill.tag_id = tag_ids[' '.join(skill.name.split()).casefold()]
+        Skill.objects.using(db).bulk_update(chunk, ['tag'], batch_size=500)
+
+    counted = (
+        Skill.objects.using(db).filter(tag=OuterRef('pk'), student__is_public=True)
+        .order_by().values('tag').annotate(n=Count('student', distinct=True)).values('n')
+    )
+    SkillTag.objects.using(db).update(student_count=Coalesce(Subquery(counted), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0007_child_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SkillTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, unique=True)),
+                ('name', models.CharField(max_length=100)),
+                ('student_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ('name',),
+                'indexes': [models.Index(fields=['-student_count', 'name'], name='skilltag_facet_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='skill',
+            name='tag',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='skills', to='profiles.skilltag'),
+        ),
+        migrations.RunPython(backfill_tags, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='skill',
+            name='tag',
+            field=models.ForeignKey(db_index=False, editable=False, on_delete=django.db.models.deletion.PROTECT, related_name='skills', to='profiles.skilltag'),
+        ),
+        migrations.AddIndex(
+            model_name='skill',
+            index=models.Index(fields=['tag', 'student'], name='skill_tag_student_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0008_skill_tags'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='skill',
+            index=models.Index(fields=['tag', '-endorsement_count', 'student'], name='skill_tag_rank_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:17
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0009_skill_rank_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RankSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RankEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mode', models.PositiveSmallIntegerField()),
+                ('rank', models.PositiveIntegerField(null=True)),
+                ('score', models.PositiveIntegerField(null=True)),
+                ('student', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='rank_entries', to='profiles.student')),
+                ('snapshot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='profiles.ranksnapshot')),
+            ],
+            options={
+                'verbose_name_plural': 'rank entries',
+                'indexes': [models.Index(fields=['student', 'mode', 'snapshot'], name='rankentry_history_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StudentRank',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mode', models.PositiveSmallIntegerField()),
+                ('rank', models.PositiveIntegerField()),
+                ('score', models.PositiveIntegerField()),
+                ('snapshot', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='profiles.ranksnapshot')),
+                ('student', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='ranks', to='profiles.student')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['mode', 'snapshot'], name='studentrank_moved_idx')],
+                'constraints': [models.UniqueConstraint(fields=('student', 'mode'), name='unique_rank_per_mode')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0010_rank_history'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='studentstats',
+            index=models.Index(fields=['-num_skills', 'student'], name='stats_all_skills_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentstats',
+            index=models.Index(fields=['-num_projects', 'student'], name='stats_all_projects_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentstats',
+            index=models.Index(fields=['-total_endorsements', 'student'], name='stats_all_endorsements_idx'),
+        ),
+    ]
@@ -0,0 +1,97 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:50
+
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from profiles.models import SCORE_WEIGHTS
+
+
+def merge_duplicate_skills(apps, schema_editor):
+    """
+    Fold each student's skills that share a tag into the oldest one, which
+    takes the tag's spelling. Endorsements move to it, except where the same
+    session endorsed both spellings; then the students' counters, search
+    documents and updated_at are brought up to date.
+    """
+    Skill = apps.get_model('profiles', 'Skill')
+    Endorsement = apps.get_model('profiles', 'Endorsement')
+    Student = apps.get_model('profiles', 'Student')
+    StudentStats = apps.get_model('profiles', 'StudentStats')
+    db = schema_editor.connection.alias
+
+    groups = list(
+        Skill.objects.using(db).order_by().values('student', 'tag')
+        .annotate(n=Count('pk'), keep=Min('pk')).filter(n__gt=1)
+        .values_list('student', 'keep')
+    )
+    for student_id, keep in groups:
+        kept = Skill.objects.using(db).select_related('tag').get(pk=keep)
+        duplicates = list(
+            Skill.objects.using(db).filter(student_id=student_id, tag_id=kept.tag_id)
+            .exclude(pk=keep).values_list('pk', flat=True)
+        )
+        sessions = set(Endorsement.objects.using(db).filter(skill_id=keep).values_list('session_key', flat=True))
+        move = []
+        for pk, session_key in Endorsement.objects.using(db).filter(skill_id__in=duplicates).order_by('pk').values_list('pk', 'session_key'):
+            if session_key not in sessions:
+                sessions.add(session_key)
+                move.append(pk)
+        Endorsement.objects.using(db).filter(pk__in=move).update(skill_id=keep)
+        Skill.objects.using(db).filter(pk__in=duplicates).delete()
+        Skill.objects.using(db).filter(pk=keep).update(name=kept.tag.name, endorsement_count=len(sessions))
+
+    student_ids = sorted({student_id for student_id, _ in groups})
+    if not student_ids:
+        return
+
+    def count(model_name, field):
+        rows = apps.get_model('profiles', model_name).objects.filter(**{field: OuterRef('pk')})
+        return Coalesce(Subquery(rows.order_by().values(field).annotate(n=Count('pk')).values('n')), 0)
+
+    students = Student.objects.using(db).filter(pk__in=student_ids).annotate(
+        n_skills=count('Skill', 'student'),
+        n_endorsements=count('Endorsement', 'skill__student'),
+    )
+    for student in students:
+        stats = StudentStats.objects.using(db).filter(pk=student.pk).first()
+        if stats is None:
+            continue
+        stats.overall_score += (
+            (student.n_skills - stats.num_skills) * SCORE_WEIGHTS['num_skills']
+            + (student.n_endorsements - stats.total_endorsements) * SCORE_WEIGHTS['total_endorsements']
+        )
+        stats.num_skills = student.n_skills
+        stats.total_endorsements = student.n_endorsements
+        stats.save(update_fields=['num_skills', 'total_endorsements', 'overall_score'])
+    Student.objects.using(db).filter(pk__in=student_ids).update(updated_at=timezone.now())
+
+    if schema_editor.connection.vendor == 'sqlite':
+        placeholders = ', '.join(['%s'] * len(student_ids))
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE profiles_search SET skills = "
+                "(SELECT group_concat(name, ' ') FROM profiles_skill WHERE student_id = profiles_search.rowid) "
+                f"WHERE rowid IN ({placeholders})",
+                student_ids,
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0011_admin_list_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_skills, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='skill',
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name='skill',
+            constraint=models.UniqueConstraint(fields=('student', 'tag'), name='unique_skill_tag_per_student'),
+        ),
+    ]
@@ -1,26 +1,135 @@
 from django.db import models
 from django.conf import settings
-from django.db.models import UniqueConstraint
+from django.utils import timezone
+from django.db.models import UniqueConstraint, Case, Count, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+from .storage import get_portfolio_storage
 
 User = settings.AUTH_USER_MODEL
 
+# Weights of each counter in StudentStats.overall_score.
+SCORE_WEIGHTS = {
+    'num_projects': 3,
+    'num_skills': 2,
+    'num_awards': 1,
+    'total_endorsements': 1,
+}
+
+# Sort tuple over StudentStats columns for each leaderboard `by=` mode. The
+# trailing stats_id (the student id) breaks ties so keyset pagination has a
+# total order, and each tuple matches one of the partial indexes below.
+LEADERBOARD_ORDERINGS = {
+    'overall': ('-overall_score', '-num_projects', 'stats_id'),
+    'projects': ('-num_projects', '-num_skills', '-num_awards', 'stats_id'),
+    'skills': ('-num_skills', '-num_projects', '-num_awards', 'stats_id'),
+    'awards': ('-num_awards', '-num_projects', '-num_skills', 'stats_id'),
+    'endorsements': ('-total_endorsements', '-num_projects', 'stats_id'),
+}
+
+# Compact code stored in RankEntry/StudentRank for each leaderboard mode.
+RANK_MODES = {
+    'overall': 1,
+    'projects': 2,
+    'skills': 3,
+    'awards': 4,
+    'endorsements': 5,
+}
+
+
 class Student(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='student_profile')
     bio = models.TextField(blank=True)
     is_public = models.BooleanField(default=True)
+    # Also touched by profiles.signals whenever a skill, project, award,
+    # portfolio item or endorsement of this student changes.
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     # Optional: distinguish in-app admin users
     # is_admin_user = models.BooleanField(default=False)
 
     def __str__(self):
         return self.user.get_username()
 
+def skill_key(name):
+    """Catalog key of a skill name: whitespace collapsed and case folded."""
+    return ' '.join(name.split()).casefold()
+
+
+class SkillTagManager(models.Manager):
+    def for_name(self, name):
+        """The catalog entry for `name`, created with that spelling if it is new."""
+        display = ' '.join(name.split())
+        tag, _ = self.get_or_create(key=skill_key(display), defaults={'name': display})
+        return tag
+
+    def for_names(self, names):
+        """
+        {skill_key: SkillTag} for many names, creating missing entries in one
+        bulk insert. New tags take the first spelling seen; existing ones keep theirs.
+        """
+        wanted = {}
+        for name in names:
+            display = ' '.join(name.split())
+            wanted.setdefault(skill_key(display), display)
+        self.bulk_create([SkillTag(key=key, name=display) for key, display in wanted.items()], ignore_conflicts=True)
+        return self.in_bulk(list(wanted), field_name='key')
+
+    def bump_counts(self, deltas):
+        """Add {tag_id: delta} to student_count in one UPDATE, after bulk inserts that sent no signals."""
+        if not deltas:
+            return 0
+        return self.filter(pk__in=deltas).update(student_count=F('student_count') + Case(
+            *[When(pk=tag_id, then=Value(delta)) for tag_id, delta in deltas.items()],
+            default=Value(0),
+        ))
+
+    def recount(self, tag_ids=None):
+        """Set student_count from the Skill rows, for all tags or the given ones."""
+        counted = (
+            Skill.objects.filter(tag=OuterRef('pk'), student__is_public=True)
+            .order_by().values('tag').annotate(n=Count('student', distinct=True)).values('n')
+        )
+        tags = self.all()
+        if tag_ids is not None:
+            tags = tags.filter(pk__in=tag_ids)
+        return tags.update(student_count=Coalesce(Subquery(counted), 0))
+
+
+class SkillTag(models.Model):
+    """Catalog entry that every Skill spelled the same way up to case and spacing maps to."""
+    key = models.CharField(max_length=100, unique=True)
+    name = models.CharField(max_length=100)
+    # Public students with at least one skill under this tag, kept current by profiles.signals.
+    student_count = models.PositiveIntegerField(default=0)
+
+    objects = SkillTagManager()
+
+    class Meta:
+        ordering = ('name',)
+        indexes = [models.Index(fields=['-student_count', 'name'], name='skilltag_facet_idx')]
+
+    def __str__(self):
+        return self.name
+
+
 class Skill(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='skills')
     name = models.CharField(max_length=100)
+    # Set from `name` by profiles.signals; skill_tag_student_idx covers lookups by tag.
+    tag = models.ForeignKey(SkillTag, on_delete=models.PROTECT, related_name='skills', editable=False, db_index=False)
     endorsement_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
-        unique_together = ('student', 'name')
+        constraints = [
+            # Also what makes (student, name) unique, as `name` is the tag's spelling.
+            UniqueConstraint(fields=['student', 'tag'], name='unique_skill_tag_per_student'),
+        ]
+        indexes = [
+            models.Index(fields=['tag', 'student'], name='skill_tag_student_idx'),
+            # Per-skill leaderboards (profiles.rankings): rows in page order, ties broken by student then rowid.
+            models.Index(fields=['tag', '-endorsement_count', 'student'], name='skill_tag_rank_idx'),
+        ]
 
     def __str__(self):
         return f'{self.name} ({self.student})'
@@ -29,6 +138,7 @@ class Project(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='projects')
     title = models.CharField(max_length=150)
     description = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f'{self.title} - {self.student}'
@@ -37,6 +147,7 @@ class Award(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='awards')
     title = models.CharField(max_length=150)
     description = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f'{self.title} - {self.student}'
@@ -44,13 +155,21 @@ class Award(models.Model):
 class PortfolioItem(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='portfolio')
     title = models.CharField(max_length=150)
-    file = models.FileField(upload_to='portfolio/', blank=True, null=True)
+    # Content-addressed and deduplicated; indexed because references are counted by name.
+    file = models.FileField(upload_to='portfolio/', storage=get_portfolio_storage, blank=True, null=True, db_index=True)
     url = models.URLField(blank=True, null=True)
-    screenshot = models.ImageField(upload_to='portfolio/screens/', blank=True, null=True)
+    screenshot = models.ImageField(upload_to='portfolio/screens/', storage=get_portfolio_storage, blank=True, null=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f'{self.title} - {self.student}'
 
+    @property
+    def screenshot_renditions(self):
+        """URLs of the resized screenshot renditions; {} until they have been generated."""
+        from .renditions import urls_for
+        return urls_for(self.screenshot)
+
 class Endorsement(models.Model):
     skill = models.ForeignKey(Skill, on_delete=models.CASCADE, related_name='endorsements')
     session_key = models.CharField(max_length=40)
@@ -64,3 +183,146 @@ class Endorsement(models.Model):
     def __str__(self):
         who = self.endorser or self.session_key
         return f'{who} -> {self.skill}'
+
+
+def _count_subquery(queryset, field):
+    """Correlated COUNT(*) over `queryset` grouped by `field`, 0 when there are no rows."""
+    counted = queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(n=Count('pk')).values('n')
+    return Coalesce(Subquery(counted), 0)
+
+
+class StudentStatsManager(models.Manager):
+    def bump(self, student_id, **deltas):
+        """Apply counter deltas to one student's row, e.g. bump(5, num_skills=1).
+
+        Returns the number of rows updated (0 when the student has no row yet).
+        """
+        updates = {field: F(field) + delta for field, delta in deltas.items()}
+        score_delta = sum(SCORE_WEIGHTS[field] * delta for field, delta in deltas.items())
+        if score_delta:
+            updates['overall_score'] = F('overall_score') + score_delta
+        return self.filter(pk=student_id).update(**updates)
+
+    def bump_many(self, field, deltas):
+        """Apply one counter's {student_id: delta} to many rows in one UPDATE. Returns rows updated."""
+        def per_row(weight):
+            return Case(*[When(pk=pk, then=Value(delta * weight)) for pk, delta in deltas.items()], default=Value(0))
+
+        updates = {field: F(field) + per_row(1)}
+        if SCORE_WEIGHTS[field]:
+            updates['overall_score'] = F('overall_score') + per_row(SCORE_WEIGHTS[field])
+        return self.filter(pk__in=deltas).update(**updates)
+
+    def rebuild(self, student_ids=None, batch_size=1000):
+        """Recompute rows from the source tables in primary-key batches. Returns rows written."""
+        students = Student.objects.order_by('pk')
+        if student_ids is not None:
+            students = students.filter(pk__in=student_ids)
+        students = students.annotate(
+            n_skills=_count_subquery(Skill.objects.all(), 'student'),
+            n_projects=_count_subquery(Project.objects.all(), 'student'),
+            n_awards=_count_subquery(Award.objects.all(), 'student'),
+            n_endorsements=_count_subquery(Endorsement.objects.all(), 'skill__student'),
+        ).values_list('pk', 'is_public', 'n_skills', 'n_projects', 'n_awards', 'n_endorsements')
+
+        written, last_pk = 0, 0
+        while True:
+            batch = list(students.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                return written
+            rows = []
+            for pk, is_public, n_skills, n_projects, n_awards, n_endorsements in batch:
+                counters = {
+                    'num_skills': n_skills,
+                    'num_projects': n_projects,
+                    'num_awards': n_awards,
+                    'total_endorsements': n_endorsements,
+                }
+                score = sum(SCORE_WEIGHTS[field] * value for field, value in counters.items())
+                rows.append(StudentStats(student_id=pk, is_public=is_public, overall_score=score, **counters))
+            self.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=['student'],
+                update_fields=['is_public', 'overall_score', *SCORE_WEIGHTS],
+            )
+            written += len(rows)
+            last_pk = batch[-1][0]
+
+
+class StudentStats(models.Model):
+    """Denormalized counters per student, kept current by profiles.signals."""
+    student = models.OneToOneField(Student, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    # Copy of Student.is_public so the leaderboard indexes can be partial on it.
+    is_public = models.BooleanField(default=True)
+    num_skills = models.PositiveIntegerField(default=0)
+    num_projects = models.PositiveIntegerField(default=0)
+    num_awards = models.PositiveIntegerField(default=0)
+    total_endorsements = models.PositiveIntegerField(default=0)
+    overall_score = models.PositiveIntegerField(default=0)
+
+    objects = StudentStatsManager()
+
+    class Meta:
+        verbose_name_plural = 'student stats'
+        # Partial indexes over public rows: `WHERE is_public ORDER BY <mode>`
+        # becomes an index range scan, including from a keyset cursor.
+        indexes = [
+            models.Index(fields=['-overall_score', '-num_projects', 'student'], name='stats_overall_idx', condition=Q(is_public=True)),
+            models.Index(fields=['-num_projects', '-num_skills', '-num_awards', 'student'], name='stats_projects_idx', condition=Q(is_public=True)),
+            models.Index(fields=['-num_skills', '-num_projects', '-num_awards', 'student'], name='stats_skills_idx', condition=Q(is_public=True)),
+            models.Index(fields=['-num_awards', '-num_projects', '-num_skills', 'student'], name='stats_awards_idx', condition=Q(is_public=True)),
+            models.Index(fields=['-total_endorsements', '-num_projects', 'student'], name='stats_endorsements_idx', condition=Q(is_public=True)),
+            # Every row, for the staff list's sorts (adminpanel.listing).
+            models.Index(fields=['-num_skills', 'student'], name='stats_all_skills_idx'),
+            models.Index(fields=['-num_projects', 'student'], name='stats_all_projects_idx'),
+            models.Index(fields=['-total_endorsements', 'student'], name='stats_all_endorsements_idx'),
+        ]
+
+    def __str__(self):
+        return f'Stats for {self.student_id}'
+
+
+class RankSnapshot(models.Model):
+    """One run of `manage.py snapshot_ranks`."""
+    taken_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f'Rank snapshot {self.taken_at:%Y-%m-%d %H:%M}'
+
+
+class RankEntry(models.Model):
+    """
+    Append-only rank history: a student's rank and score in one mode,
+    written only by snapshots where they changed. A null rank means the
+    student left the board (turned private or lost their stats row).
+    """
+    snapshot = models.ForeignKey(RankSnapshot, on_delete=models.CASCADE, related_name='entries')
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='rank_entries', db_index=False)
+    mode = models.PositiveSmallIntegerField()  # A RANK_MODES value.
+    rank = models.PositiveIntegerField(null=True)
+    score = models.PositiveIntegerField(null=True)
+
+    class Meta:
+        verbose_name_plural = 'rank entries'
+        indexes = [models.Index(fields=['student', 'mode', 'snapshot'], name='rankentry_history_idx')]
+
+    def __str__(self):
+        return f'{self.student_id} mode {self.mode}: {self.rank}'
+
+
+class StudentRank(models.Model):
+    """Rank per student and mode as of the latest snapshot, which the next one is diffed against."""
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='ranks', db_index=False)
+    mode = models.PositiveSmallIntegerField()
+    rank = models.PositiveIntegerField()
+    score = models.PositiveIntegerField()
+    # Snapshot that last changed this row: "moved since snapshot S" is an index range.
+    snapshot = models.ForeignKey(RankSnapshot, on_delete=models.CASCADE, related_name='+', db_index=False)
+
+    class Meta:
+        constraints = [UniqueConstraint(fields=['student', 'mode'], name='unique_rank_per_mode')]
+        indexes = [models.Index(fields=['mode', 'snapshot'], name='studentrank_moved_idx')]
+
+    def __str__(self):
+        return f'{self.student_id} mode {self.mode}: {self.rank}'
@@ -0,0 +1,128 @@
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import Http404
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, length):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, binascii.Error):
+        raise Http404('Invalid page cursor.')
+    if not isinstance(values, list) or len(values) != length:
+        raise Http404('Invalid page cursor.')
+    return values
+
+
+def keyset_filter(ordering, values):
+    """
+    Q selecting rows strictly after `values` in `ordering`, e.g. for
+    ('-score', 'id') and (10, 7): score < 10 OR (score = 10 AND id > 7).
+    The leading column is also bounded on its own so an index range scan applies.
+    """
+    condition = None
+    for field, value in reversed(list(zip(ordering, values))):
+        name = field.lstrip('-')
+        strict = Q(**{f'{name}__lt' if field.startswith('-') else f'{name}__gt': value})
+        condition = strict if condition is None else strict | (Q(**{name: value}) & condition)
+    first = ordering[0]
+    name = first.lstrip('-')
+    bound = Q(**{f'{name}__lte' if first.startswith('-') else f'{name}__gte': values[0]})
+    return bound & condition
+
+
+def reverse_ordering(ordering):
+    return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in ordering)
+
+
+class KeysetPage:
+    """Page of a keyset-paginated list. Cursors are opaque strings for ?after= / ?before=."""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginationMixin:
+    """
+    Cursor pagination for ListView. The queryset must be ordered by
+    get_ordering(), a total order whose fields are readable as attributes
+    of each object, so page N costs the same index seek as page 1.
+    """
+    page_size_kwarg = 'size'
+
+    def get_paginate_by(self, queryset):
+        default = getattr(settings, 'PROFILES_PAGE_SIZE', 25)
+        maximum = getattr(settings, 'PROFILES_MAX_PAGE_SIZE', 100)
+        try:
+            size = int(self.request.GET.get(self.page_size_kwarg, default))
+        except ValueError:
+            size = default
+        return max(1, min(size, maximum))
+
+    def paginate_queryset(self, queryset, page_size):
+        query, after, before = self._page_query(queryset, page_size)
+        return self._page(list(query), page_size, after, before)
+
+    async def apaginate_queryset(self, queryset, page_size):
+        """paginate_queryset() for async views, fetching the page with async iteration."""
+        query, after, before = self._page_query(queryset, page_size)
+        return self._page([row async for row in query], page_size, after, before)
+
+    def _page_query(self, queryset, page_size):
+        """The unevaluated query for one page plus one row, and the ?after= / ?before= cursors."""
+        ordering = self.get_ordering()
+        after = self.request.GET.get('after')
+        before = self.request.GET.get('before')
+        if before:
+            backwards = reverse_ordering(ordering)
+            queryset = queryset.filter(keyset_filter(backwards, decode_cursor(before, len(ordering))))
+            return queryset.order_by(*backwards)[:page_size + 1], None, before
+        if after:
+            queryset = queryset.filter(keyset_filter(ordering, decode_cursor(after, len(ordering))))
+        return queryset.order_by(*ordering)[:page_size + 1], after, None
+
+    def _page(self, rows, page_size, after, before):
+        ordering = self.get_ordering()
+        has_more = len(rows) > page_size
+        if before:
+            rows = rows[:page_size][::-1]
+            page = KeysetPage(
+                rows,
+                next_cursor=before,
+                previous_cursor=self._cursor_for(rows[0], ordering) if has_more else None,
+            )
+        else:
+            rows = rows[:page_size]
+            page = KeysetPage(
+                rows,
+                next_cursor=self._cursor_for(rows[-1], ordering) if has_more else None,
+                previous_cursor=self._cursor_for(rows[0], ordering) if after and rows else None,
+            )
+        return None, page, page.object_list, page.has_other_pages()
+
+    def _cursor_for(self, obj, ordering):
+        return encode_cursor([getattr(obj, field.lstrip('-')) for field in ordering])
@@ -0,0 +1,238 @@
+"""
+Per-skill leaderboards.
+
+A skill leaderboard lists the public students with a skill under one
+SkillTag, by that skill's endorsement_count. It reads skill_tag_rank_idx
+(tag, endorsement_count DESC, student): the rows come out of the index in
+page order, so no Skill rows are sorted.
+
+The first page of a popular tag (PROFILES_SKILL_TOP_MIN_STUDENTS students
+or more) is cached in the PROFILES_RENDER_CACHE backend. record_endorsement(),
+the write-behind flush and reconcile_endorsements drop it when a count
+under the tag changes. Other changes, such as a student turning private,
+show up within PROFILES_SKILL_TOP_TIMEOUT seconds.
+
+Rank history.
+
+`manage.py snapshot_ranks` ranks the public students in every leaderboard
+mode from the StudentStats indexes and diffs the result against
+StudentRank, the ranks as of the previous snapshot. Only the differences
+are appended to RankEntry, so a student whose rank holds costs nothing
+per snapshot. The rising board and the profile sparklines read those rows
+through rankentry_history_idx and studentrank_moved_idx; neither touches
+the Skill, Project or Award tables.
+
+Current rank.
+
+current_ranks() answers "where am I?" without reading the leaderboard: a
+student's rank in a mode is one plus the number of public StudentStats
+rows ahead of theirs in that mode's ordering, counted over the mode's
+partial index from the student's own key. Nothing is sorted, and all
+modes plus the board size come back in one query.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.db.models import F, Func, IntegerField, OuterRef, Subquery
+from django.utils import timezone
+
+from .pagination import keyset_filter, reverse_ordering
+from .models import LEADERBOARD_ORDERINGS, RANK_MODES, RankEntry, RankSnapshot, StudentRank, StudentStats
+from .signals import invalidate_profile
+
+SKILL_ORDERING = ('-endorsement_count', 'student_id', 'pk')
+
+
+def _cache():
+    return caches[getattr(settings, 'PROFILES_RENDER_CACHE', 'default')]
+
+
+def _top_key(tag_id):
+    return f'skill:{tag_id}:top'
+
+
+def is_popular(tag):
+    return tag.student_count >= getattr(settings, 'PROFILES_SKILL_TOP_MIN_STUDENTS', 20)
+
+
+def top_rows(tag, fetch):
+    """The cached first page of the tag's leaderboard, calling fetch() on a miss."""
+    rows = _cache().get(_top_key(tag.pk))
+    if rows is None:
+        rows = fetch()
+        _cache().set(_top_key(tag.pk), rows, timeout=getattr(settings, 'PROFILES_SKILL_TOP_TIMEOUT', 60))
+    return rows
+
+
+def invalidate_top(tag_ids):
+    """Drop the cached first pages of these tags once the current transaction commits."""
+    keys = [_top_key(tag_id) for tag_id in set(tag_ids)]
+    if keys:
+        transaction.on_commit(lambda: _cache().delete_many(keys))
+
+
+def _stats_ordering(by):
+    # LEADERBOARD_ORDERINGS sorts Student rows; on StudentStats the tie-breaker is the pk.
+    return [field if field != 'stats_id' else 'pk' for field in LEADERBOARD_ORDERINGS[by]]
+
+
+def take_snapshot(batch_size=2000):
+    """Record every rank that changed since the last snapshot. Returns (snapshot, entries written)."""
+    with transaction.atomic():
+        current = {
+            (student_id, mode): (pk, rank, score)
+            for pk, student_id, mode, rank, score in StudentRank.objects.values_list('pk', 'student_id', 'mode', 'rank', 'score')
+        }
+        snapshot = RankSnapshot.objects.create()
+        entries, changed = [], []
+        for by, mode in RANK_MODES.items():
+            ordering = _stats_ordering(by)
+            rows = StudentStats.objects.filter(is_public=True).order_by(*ordering).values_list('pk', ordering[0].lstrip('-'))
+            for rank, (student_id, score) in enumerate(rows.iterator(chunk_size=batch_size), 1):
+                previous = current.pop((student_id, mode), None)
+                if previous is None or previous[1:] != (rank, score):
+                    entries.append(RankEntry(snapshot=snapshot, student_id=student_id, mode=mode, rank=rank, score=score))
+                    changed.append(StudentRank(student_id=student_id, mode=mode, rank=rank, score=score, snapshot=snapshot))
+        # Whatever is left in `current` dropped off the board since the last snapshot.
+        entries.extend(RankEntry(snapshot=snapshot, student_id=student_id, mode=mode) for student_id, mode in current)
+        dropped = [pk for pk, _, _ in current.values()]
+        # In chunks that stay under SQLite's limit on query parameters.
+        chunk = max(connection.ops.bulk_batch_size(['pk'], dropped), 1)
+        for start in range(0, len(dropped), chunk):
+            StudentRank.objects.filter(pk__in=dropped[start:start + chunk]).delete()
+        RankEntry.objects.bulk_create(entries, batch_size=batch_size)
+        StudentRank.objects.bulk_create(
+            changed, batch_size=batch_size, update_conflicts=True,
+            unique_fields=['student', 'mode'], update_fields=['rank', 'score', 'snapshot'],
+        )
+        # The sparklines are part of the cached profile body. updated_at stays put:
+        # the profile's data did not change, and export --since keys on it. Other
+        # processes' cached bodies and browsers' ETags follow latest_snapshot().
+        for student_id in {entry.student_id for entry in entries}:
+            invalidate_profile(student_id)
+    return snapshot, len(entries)
+
+
+def latest_snapshot():
+    """The newest snapshot's pk as a subquery; it versions the profile sparklines."""
+    return Subquery(RankSnapshot.objects.order_by('-pk').values('pk')[:1])
+
+
+def rising_window(days):
+    """(start, latest) snapshots for a rising board over `days`, or (None, None) with fewer than two."""
+    latest = RankSnapshot.objects.order_by('-pk').first()
+    if latest is None:
+        return None, None
+    start = (
+        RankSnapshot.objects.filter(taken_at__lte=timezone.now() - timedelta(days=days)).order_by('-taken_at', '-pk').first()
+        or RankSnapshot.objects.order_by('pk').first()
+    )
+    if start.pk == latest.pk:
+        return None, None
+    return start, latest
+
+
+def rising(mode, start):
+    """Students on the board now, ranked by the places they gained since `start`."""
+    then = RankEntry.objects.filter(student=OuterRef('student'), mode=mode, snapshot__lte=start.pk).order_by('-snapshot')
+    return (
+        StudentRank.objects.filter(mode=mode, snapshot__gt=start.pk, student__is_public=True)
+        .annotate(previous=Subquery(then.values('rank')[:1]))
+        .annotate(gain=F('previous') - F('rank'))
+        .filter(gain__gt=0)
+        .select_related('student__user')
+        .order_by('-gain', 'rank')
+    )
+
+
+def _history_queries(student_id):
+    points = getattr(settings, 'PROFILES_RANK_HISTORY_POINTS', 30)
+    snapshots = RankSnapshot.objects.order_by('-pk').values_list('pk', flat=True)[:points]
+    entries = RankEntry.objects.filter(student_id=student_id).order_by('mode', 'snapshot').values_list('mode', 'snapshot_id', 'rank')
+    return snapshots, entries
+
+
+def _history(snapshot_ids, entries):
+    """Forward-fill each mode's change rows over the snapshot window, oldest first."""
+    snapshot_ids = sorted(snapshot_ids)
+    by_mode = {}
+    for mode, snapshot_id, rank in entries:
+        by_mode.setdefault(mode, []).append((snapshot_id, rank))
+    history = []
+    for by, mode in RANK_MODES.items():
+        changes = by_mode.get(mode, [])
+        ranks, rank, i = [], None, 0
+        for snapshot_id in snapshot_ids:
+            while i < len(changes) and changes[i][0] <= snapshot_id:
+                rank = changes[i][1]
+                i += 1
+            ranks.append(rank)
+        if any(ranks):
+            history.append({'by': by, 'ranks': ranks, 'rank': ranks[-1], 'points': sparkline(ranks)})
+    return history
+
+
+def rank_history(student_id):
+    """Per-mode rank over the last PROFILES_RANK_HISTORY_POINTS snapshots, for the profile sparklines."""
+    snapshots, entries = _history_queries(student_id)
+    return _history(list(snapshots), list(entries))
+
+
+async def arank_history(student_id):
+    snapshots, entries = _history_queries(student_id)
+    return _history([pk async for pk in snapshots], [row async for row in entries])
+
+
+def sparkline(ranks, width=120, height=24):
+    """SVG polyline segments for `ranks` (None where the student was off the board), rank 1 at the top."""
+    known = [rank for rank in ranks if rank]
+    low, high = min(known), max(known)
+    step = width / max(len(ranks) - 1, 1)
+    segments, segment = [], []
+    for i, rank in enumerate(ranks):
+        if not rank:
+            if segment:
+                segments.append(segment)
+            segment = []
+            continue
+        y = (rank - low) / (high - low) * height if high > low else height / 2
+        segment.append(f'{i * step:.1f},{y:.1f}')
+    if segment:
+        segments.append(segment)
+    return [' '.join(segment) for segment in segments]
+
+
+def _count(queryset):
+    return Subquery(queryset.order_by().annotate(n=Func('pk', function='COUNT', output_field=IntegerField())).values('n'))
+
+
+def _ranks_query(student_id):
+    public = StudentStats.objects.filter(is_public=True)
+    counts = {'total': _count(public)}
+    for by in RANK_MODES:
+        # Rows before the student's own key in this mode's ordering.
+        ordering = _stats_ordering(by)
+        ahead = keyset_filter(reverse_ordering(ordering), [OuterRef(field.lstrip('-')) for field in ordering])
+        counts[by] = _count(public.filter(ahead))
+    return public.filter(pk=student_id).values(**counts)
+
+
+def _ranks(row):
+    if row is None:
+        return {}
+    total = row['total']
+    return {
+        by: {'rank': row[by] + 1, 'total': total, 'percentile': 100 * (total - row[by] - 1) // total}
+        for by in RANK_MODES
+    }
+
+
+def current_ranks(student_id):
+    """{mode: {'rank', 'total', 'percentile'}} for a public student, {} for a private one."""
+    return _ranks(_ranks_query(student_id).first())
+
+
+async def acurrent_ranks(student_id):
+    return _ranks(await _ranks_query(student_id).afirst())
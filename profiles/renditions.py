@@ -0,0 +1,163 @@
+"""
+Resized renditions of PortfolioItem.screenshot.
+
+Every screenshot gets a thumbnail and a medium rendition, each in the
+original's format and as WebP, saved next to the original as
+"<name>__<rendition>.<ext>". They are generated in a bounded process pool
+when a screenshot is uploaded, or lazily the first time a page asks for a
+screenshot whose renditions are missing; manage.py generate_renditions
+backfills existing uploads.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Rendition name -> maximum width in pixels.
+RENDITION_WIDTHS = {
+    'thumb': 200,
+    'medium': 800,
+}
+
+# Pillow format and file extension for each source extension; anything else becomes JPEG.
+SOURCE_FORMATS = {
+    '.jpg': ('JPEG', '.jpg'),
+    '.jpeg': ('JPEG', '.jpg'),
+    '.png': ('PNG', '.png'),
+    '.gif': ('PNG', '.png'),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+_in_flight = set()
+
+
+def rendition_names(name):
+    """Storage names of every rendition of the screenshot stored as `name`."""
+    root, ext = os.path.splitext(name)
+    _, out_ext = SOURCE_FORMATS.get(ext.lower(), ('JPEG', '.jpg'))
+    names = {}
+    for rendition in RENDITION_WIDTHS:
+        names[rendition] = f'{root}__{rendition}{out_ext}'
+        names[f'{rendition}_webp'] = f'{root}__{rendition}.webp'
+    return names
+
+
+def render_file(source_path, targets):
+    """
+    Write resized copies of the image at `source_path`. `targets` is a list
+    of (dest_path, max_width, pillow_format). Runs in pool workers, so it only
+    touches the filesystem.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image)
+        for dest_path, width, fmt in targets:
+            copy = image.copy()
+            copy.thumbnail((width, width * 10), Image.Resampling.LANCZOS)
+            if fmt == 'JPEG' and copy.mode not in ('RGB', 'L'):
+                copy = copy.convert('RGB')
+            elif fmt == 'WEBP' and copy.mode not in ('RGB', 'RGBA'):
+                copy = copy.convert('RGBA' if 'A' in copy.getbands() else 'RGB')
+            tmp_path = f'{dest_path}.tmp'
+            options = {'quality': 82} if fmt in ('JPEG', 'WEBP') else {'optimize': True}
+            copy.save(tmp_path, fmt, **options)
+            os.replace(tmp_path, dest_path)
+    return len(targets)
+
+
+def missing_targets(name, storage, force=False):
+    """(dest_path, width, format) for each rendition of `name` not on disk yet (all with force)."""
+    ext = os.path.splitext(name)[1]
+    fmt, _ = SOURCE_FORMATS.get(ext.lower(), ('JPEG', '.jpg'))
+    names = rendition_names(name)
+    targets = []
+    for rendition, width in RENDITION_WIDTHS.items():
+        for key, target_fmt in ((rendition, fmt), (f'{rendition}_webp', 'WEBP')):
+            if force or not storage.exists(names[key]):
+                targets.append((storage.path(names[key]), width, target_fmt))
+    return targets
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'PROFILES_RENDITION_WORKERS', 2),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _executor
+
+
+def schedule(name, student_id=None, storage=default_storage):
+    """
+    Queue generation of any missing renditions of `name`. Returns False when
+    nothing was queued: already queued, nothing missing, or the queue is full
+    (the next page view or the backfill command will retry).
+    """
+    max_queued = getattr(settings, 'PROFILES_RENDITION_QUEUE', 32)
+    # Check and reserve in one step, so two requests can't both queue the same name.
+    with _executor_lock:
+        if name in _in_flight or len(_in_flight) >= max_queued:
+            return False
+        _in_flight.add(name)
+    submitted = False
+    try:
+        targets = missing_targets(name, storage)
+        if targets:
+            future = get_executor().submit(render_file, storage.path(name), targets)
+            submitted = True
+    except NotImplementedError:
+        pass  # Storage without local paths.
+    finally:
+        if not submitted:
+            with _executor_lock:
+                _in_flight.discard(name)
+    if not submitted:
+        return False
+    scheduler = threading.get_ident()
+    future.add_done_callback(lambda f: _finished(f, name, student_id, scheduler))
+    return True
+
+
+def _finished(future, name, student_id, scheduler):
+    with _executor_lock:
+        _in_flight.discard(name)
+    if future.exception() is not None:
+        logger.warning('Rendering %s failed: %s', name, future.exception())
+        return
+    if student_id is not None:
+        from .signals import touch_students
+        try:
+            touch_students([student_id])
+        except Exception:
+            logger.exception('Could not mark student %s as updated after rendering %s.', student_id, name)
+        finally:
+            # Usually on the pool's callback thread, whose connection nothing else closes;
+            # a future that was already done calls back on the scheduling thread instead.
+            if threading.get_ident() != scheduler:
+                connections.close_all()
+
+
+def urls_for(field_file, storage=None):
+    """
+    URLs of the renditions of a screenshot, or {} while they are missing (in
+    which case generation is queued and the caller should use the original).
+    """
+    if not field_file:
+        return {}
+    storage = storage or field_file.storage
+    names = rendition_names(field_file.name)
+    if not all(storage.exists(n) for n in names.values()):
+        schedule(field_file.name, getattr(field_file.instance, 'student_id', None), storage)
+        return {}
+    return {key: storage.url(n) for key, n in names.items()}
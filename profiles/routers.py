@@ -0,0 +1,108 @@
+"""
+Read/write splitting between the primary database and a read replica.
+
+Views marked with @replica_reads, or with `replica_reads = True` on the
+class, read this app's models from the "replica" database alias. Every
+write, and every read anywhere else, goes to "default". Sessions and users
+are always read from the primary, because a replica can lag behind a login.
+
+The replica is a copy of the primary refreshed by
+`manage.py refresh_replica`, so it can be up to one refresh interval
+stale. To keep read-your-writes, a request that wrote to the primary sets
+a cookie. For REPLICA_STICKY_SECONDS after that, the same browser reads
+from the primary as well. "Wrote" means the router was asked for a write
+database, so reads Django routes that way, like get_or_create's lookup,
+count too. Without a "replica" alias in DATABASES, everything
+uses "default".
+"""
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+REPLICA_ALIAS = 'replica'
+STICKY_COOKIE = 'stud_primary'
+REPLICA_APPS = {'profiles'}
+
+_use_replica = ContextVar('profiles_use_replica', default=False)
+_wrote = ContextVar('profiles_wrote', default=None)
+
+
+def replica_reads(view_func):
+    """Mark a function view as safe to serve from the replica."""
+    view_func.replica_reads = True
+    return view_func
+
+
+def replica_configured():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _use_replica.get() and model._meta.app_label in REPLICA_APPS:
+            return REPLICA_ALIAS
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        wrote = _wrote.get()
+        if wrote is not None:
+            wrote.append(model._meta.label)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data.
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # The replica is overwritten wholesale by refresh_replica.
+        return db != REPLICA_ALIAS
+
+
+class ReplicaMiddleware:
+    """Routes @replica_reads views to the replica unless this browser wrote recently."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sticky_seconds = getattr(settings, 'REPLICA_STICKY_SECONDS', 30)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        wrote = []
+        tokens = _wrote.set(wrote), _use_replica.set(False)
+        try:
+            response = self.get_response(request)
+        finally:
+            self._reset(tokens)
+        return self._stick(response, wrote)
+
+    async def __acall__(self, request):
+        wrote = []
+        tokens = _wrote.set(wrote), _use_replica.set(False)
+        try:
+            response = await self.get_response(request)
+        finally:
+            self._reset(tokens)
+        return self._stick(response, wrote)
+
+    def _reset(self, tokens):
+        wrote_token, replica_token = tokens
+        _use_replica.reset(replica_token)
+        _wrote.reset(wrote_token)
+
+    def _stick(self, response, wrote):
+        if wrote and replica_configured():
+            response.set_cookie(STICKY_COOKIE, '1', max_age=self.sticky_seconds, httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'view_class', None)
+        marked = getattr(view_func, 'replica_reads', False) or getattr(view_class, 'replica_reads', False)
+        if marked and replica_configured() and STICKY_COOKIE not in request.COOKIES:
+            _use_replica.set(True)
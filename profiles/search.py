@@ -0,0 +1,135 @@
+"""
+Full-text search over public profiles, backed by an SQLite FTS5 table.
+
+profiles_search holds one document per student (rowid = student id) with
+the username, bio, skill names, and project/award titles and descriptions
+in separate columns. Documents are rebuilt per student by profiles.signals,
+and visibility is applied at query time, so toggling is_public needs no
+reindex. A username change reindexes the user's student.
+"""
+import re
+
+from django.contrib.auth import get_user_model
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.utils.html import escape
+
+from .models import Student
+
+SEARCH_TABLE = 'profiles_search'
+
+# bm25() weight per column, in table order: username, bio, skills, projects, awards.
+COLUMN_WEIGHTS = (4.0, 1.0, 3.0, 2.0, 2.0)
+
+
+def _document_sql():
+    return f"""
+        INSERT INTO {SEARCH_TABLE} (rowid, username, bio, skills, projects, awards)
+        SELECT s.id, u.username, s.bio,
+            (SELECT group_concat(name, ' ') FROM profiles_skill WHERE student_id = s.id),
+            (SELECT group_concat(title || ' ' || description, ' ') FROM profiles_project WHERE student_id = s.id),
+            (SELECT group_concat(title || ' ' || description, ' ') FROM profiles_award WHERE student_id = s.id)
+        FROM profiles_student s
+        JOIN {get_user_model()._meta.db_table} u ON u.id = s.user_id
+    """
+
+# Private-use sentinels around matches so snippets can be HTML-escaped before <mark> goes in.
+_MARK_OPEN, _MARK_CLOSE = '\ue000', '\ue001'
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _write_connection():
+    return connections[router.db_for_write(Student)]
+
+
+def _read_connection():
+    return connections[router.db_for_read(Student)]
+
+
+def is_available(connection=None):
+    return (connection or _read_connection()).vendor == 'sqlite'
+
+
+def index_students(student_ids):
+    """(Re)build the documents for the given students; missing students are dropped."""
+    connection = _write_connection()
+    if not is_available(connection):
+        return
+    student_ids = list(student_ids)
+    if not student_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(student_ids))
+    # Atomic, or two concurrent reindexes of one student can both insert its rowid.
+    with transaction.atomic(using=connection.alias, savepoint=False), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})', student_ids)
+        cursor.execute(f'{_document_sql()} WHERE s.id IN ({placeholders})', student_ids)
+
+
+def remove_students(student_ids):
+    connection = _write_connection()
+    student_ids = list(student_ids)
+    if not is_available(connection) or not student_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(student_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})', student_ids)
+
+
+def rebuild():
+    """Re-create every document in one INSERT ... SELECT, then optimize the index."""
+    connection = _write_connection()
+    if not is_available(connection):
+        return 0
+    # One transaction: searches never see an empty index, and a failure keeps the old one.
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        cursor.execute(_document_sql())
+        count = cursor.rowcount
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+    return count
+
+
+def build_match(query):
+    """Turn free text into an FTS5 query: every word must match, as a prefix."""
+    tokens = _TOKEN_RE.findall(query)
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def search(query, limit=50):
+    """
+    Best-matching public students for `query`, as a list of
+    (student_id, snippet_html) in bm25 order.
+    """
+    match = build_match(query)
+    if not match:
+        return []
+    connection = _read_connection()
+    if not is_available(connection):
+        return _fallback_search(query, limit)
+
+    weights = ', '.join(str(w) for w in COLUMN_WEIGHTS)
+    sql = f"""
+        SELECT {SEARCH_TABLE}.rowid, snippet({SEARCH_TABLE}, -1, %s, %s, '…', 12)
+        FROM {SEARCH_TABLE}
+        JOIN profiles_student s ON s.id = {SEARCH_TABLE}.rowid
+        WHERE {SEARCH_TABLE} MATCH %s AND s.is_public
+        ORDER BY bm25({SEARCH_TABLE}, {weights})
+        LIMIT %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [_MARK_OPEN, _MARK_CLOSE, match, limit])
+        rows = cursor.fetchall()
+    return [(student_id, _snippet_html(snippet)) for student_id, snippet in rows]
+
+
+def _snippet_html(snippet):
+    return escape(snippet or '').replace(_MARK_OPEN, '<mark>').replace(_MARK_CLOSE, '</mark>')
+
+
+def _fallback_search(query, limit):
+    """Non-SQLite databases have no FTS5 table: plain bio/username match, no ranking."""
+    students = Student.objects.filter(is_public=True)
+    for token in _TOKEN_RE.findall(query):
+        students = students.filter(Q(bio__icontains=token) | Q(user__username__icontains=token))
+    return [(pk, escape(bio[:160])) for pk, bio in students.values_list('pk', 'bio')[:limit]]
@@ -0,0 +1,218 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import renditions, search, storage
+from .cache import render_cache
+from .models import Student, Skill, SkillTag, Project, Award, PortfolioItem, Endorsement, StudentStats
+
+# Counter on StudentStats that each child model feeds.
+COUNTED_MODELS = {
+    Skill: 'num_skills',
+    Project: 'num_projects',
+    Award: 'num_awards',
+}
+
+_batch_edit = ContextVar('profiles_batch_edit', default=False)
+
+
+@contextmanager
+def batch_edit():
+    """
+    Skip the receivers below that query per row, for bulk edits that
+    reconcile the derived state once themselves (profiles.batch, profiles.bulk).
+    """
+    token = _batch_edit.set(True)
+    try:
+        yield
+    finally:
+        _batch_edit.reset(token)
+
+
+def invalidate_profile(student_id):
+    """Drop the cached profile body once the current transaction commits."""
+    transaction.on_commit(lambda: render_cache.bump(student_id))
+
+
+def touch_student(student_id):
+    """Record a change to one of the student's child rows."""
+    touch_students([student_id])
+
+
+def touch_students(student_ids):
+    """
+    Move updated_at, which versions the profile for ETags (profiles.conditional)
+    and the render cache, for changes that bypass the signals (bulk updates,
+    write-behind counters, renditions).
+    """
+    Student.objects.filter(pk__in=student_ids).update(updated_at=timezone.now())
+    for student_id in student_ids:
+        invalidate_profile(student_id)
+
+
+@receiver(post_save, sender=Student)
+def student_saved(sender, instance, created, **kwargs):
+    if created:
+        StudentStats.objects.get_or_create(student=instance, defaults={'is_public': instance.is_public})
+    elif StudentStats.objects.filter(pk=instance.pk).exclude(is_public=instance.is_public).update(is_public=instance.is_public):
+        # Visibility changed: the student enters or leaves every facet count it has a skill in.
+        tags = SkillTag.objects.filter(pk__in=Skill.objects.filter(student=instance).values('tag'))
+        if instance.is_public:
+            tags.update(student_count=F('student_count') + 1)
+        else:
+            tags.filter(student_count__gt=0).update(student_count=F('student_count') - 1)
+    search.index_students([instance.pk])
+    invalidate_profile(instance.pk)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    # Only a username change reaches the search document; logins save last_login alone.
+    if created or (update_fields is not None and 'username' not in update_fields):
+        return
+    student_ids = list(Student.objects.filter(user=instance).values_list('pk', flat=True))
+    if student_ids:
+        search.index_students(student_ids)
+        touch_students(student_ids)
+
+
+@receiver(post_delete, sender=Student)
+def student_deleted(sender, instance, **kwargs):
+    if _batch_edit.get():
+        return
+    search.remove_students([instance.pk])
+    invalidate_profile(instance.pk)
+
+
+def child_saved(sender, instance, created, **kwargs):
+    if created and not StudentStats.objects.bump(instance.student_id, **{COUNTED_MODELS[sender]: 1}):
+        # No stats row yet (student created with bulk_create): compute it from scratch.
+        StudentStats.objects.rebuild([instance.student_id])
+    search.index_students([instance.student_id])
+    touch_student(instance.student_id)
+
+
+def child_deleted(sender, instance, **kwargs):
+    if _batch_edit.get():
+        return
+    # Deletes never rebuild: during a cascade from Student the row may already be gone.
+    StudentStats.objects.bump(instance.student_id, **{COUNTED_MODELS[sender]: -1})
+    search.index_students([instance.student_id])
+    touch_student(instance.student_id)
+
+
+for model in COUNTED_MODELS:
+    post_save.connect(child_saved, sender=model, dispatch_uid=f'stats_saved_{model.__name__}')
+    post_delete.connect(child_deleted, sender=model, dispatch_uid=f'stats_deleted_{model.__name__}')
+
+
+def adjust_tag_count(tag_id, student_id, delta, exclude_skill=None):
+    """
+    Move a SkillTag's student_count when a public student gains its first
+    (delta=1) or loses its last (delta=-1) skill under the tag. One UPDATE.
+    """
+    others = Skill.objects.filter(student_id=student_id, tag_id=tag_id)
+    if exclude_skill is not None:
+        others = others.exclude(pk=exclude_skill)
+    tags = SkillTag.objects.filter(pk=tag_id).filter(Exists(Student.objects.filter(pk=student_id, is_public=True)), ~Exists(others))
+    if delta < 0:
+        tags = tags.filter(student_count__gt=0)
+    tags.update(student_count=F('student_count') + delta)
+
+
+@receiver(pre_save, sender=Skill)
+def skill_saving(sender, instance, **kwargs):
+    # Map the name to its catalog tag and spelling; on an update, remember the old tag to move the counts.
+    instance._previous_tag_id = None
+    if instance.pk:
+        instance._previous_tag_id = Skill.objects.filter(pk=instance.pk).values_list('tag_id', flat=True).first()
+    if instance.pk or instance.tag_id is None:
+        instance.tag = SkillTag.objects.for_name(instance.name)
+        instance.name = instance.tag.name
+
+
+@receiver(post_save, sender=Skill)
+def skill_tag_saved(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_tag_id', None)
+    if created:
+        adjust_tag_count(instance.tag_id, instance.student_id, 1, exclude_skill=instance.pk)
+    elif previous != instance.tag_id:
+        if previous is not None:
+            adjust_tag_count(previous, instance.student_id, -1)
+        adjust_tag_count(instance.tag_id, instance.student_id, 1, exclude_skill=instance.pk)
+
+
+@receiver(post_delete, sender=Skill)
+def skill_tag_deleted(sender, instance, **kwargs):
+    if _batch_edit.get():
+        return
+    # During a cascade from Student the student row is deleted after its skills, so it still counts as public here.
+    adjust_tag_count(instance.tag_id, instance.student_id, -1)
+
+
+@receiver(post_save, sender=PortfolioItem)
+@receiver(post_delete, sender=PortfolioItem)
+def portfolio_changed(sender, instance, **kwargs):
+    if _batch_edit.get():
+        return
+    touch_student(instance.student_id)
+
+
+def _portfolio_blobs(item):
+    return {f.name for f in (item.file, item.screenshot) if f}
+
+
+def collect_blobs_on_commit(names):
+    for name in names:
+        transaction.on_commit(lambda name=name: storage.collect_blob(name))
+
+
+@receiver(pre_save, sender=PortfolioItem)
+def portfolio_saving(sender, instance, **kwargs):
+    # Remember the blobs the row pointed to, to collect any it stops referencing.
+    instance._previous_blobs = set()
+    if instance.pk:
+        previous = PortfolioItem.objects.filter(pk=instance.pk).values_list('file', 'screenshot').first()
+        instance._previous_blobs = {name for name in previous or () if name}
+
+
+@receiver(post_delete, sender=PortfolioItem)
+def portfolio_deleted(sender, instance, **kwargs):
+    if _batch_edit.get():
+        return
+    collect_blobs_on_commit(_portfolio_blobs(instance))
+
+
+@receiver(post_save, sender=PortfolioItem)
+def portfolio_saved(sender, instance, **kwargs):
+    collect_blobs_on_commit(getattr(instance, '_previous_blobs', set()) - _portfolio_blobs(instance))
+    if instance.screenshot:
+        name, storage, student_id = instance.screenshot.name, instance.screenshot.storage, instance.student_id
+        transaction.on_commit(lambda: renditions.schedule(name, student_id, storage))
+
+
+@receiver(post_save, sender=Endorsement)
+def endorsement_saved(sender, instance, created, **kwargs):
+    # Write-behind endorsements move the counter and the version at flush time (profiles.endorsements).
+    if created and not getattr(instance, '_write_behind', False):
+        student_id = instance.skill.student_id
+        if not StudentStats.objects.bump(student_id, total_endorsements=1):
+            StudentStats.objects.rebuild([student_id])
+        touch_student(student_id)
+
+
+@receiver(post_delete, sender=Endorsement)
+def endorsement_deleted(sender, instance, **kwargs):
+    if _batch_edit.get():
+        return
+    # Cascades delete endorsements before their skill, so the skill row is still there.
+    student_id = Skill.objects.filter(pk=instance.skill_id).values_list('student_id', flat=True).first()
+    if student_id is not None:
+        StudentStats.objects.bump(student_id, total_endorsements=-1)
+        touch_student(student_id)
@@ -18,6 +18,10 @@ async function postJSON(url, data) {
   return res.json().then(j => ({ok: res.ok, status: res.status, json: j}));
 }
 
+function setEndorseCount(skillId, count) {
+  document.querySelectorAll(`.endorse-count[data-skill-id="${skillId}"]`).forEach(el => el.textContent = count);
+}
+
 document.addEventListener('click', async (e) => {
   const btn = e.target.closest('.endorse-btn');
   if (!btn) return;
@@ -27,11 +31,9 @@ document.addEventListener('click', async (e) => {
   btn.disabled = true;
 
   try {
-    const {ok, json} = await postJSON(`/achievements/endorse/${skillId}/`, {});
+    const {ok, json} = await postJSON(btn.dataset.url, {});
     if (ok && json.ok) {
-      // update count
-      const countEls = document.querySelectorAll(`.endorse-count[data-skill-id="${skillId}"]`);
-      countEls.forEach(el => el.textContent = json.count);
+      setEndorseCount(skillId, json.count);
       btn.classList.add('endorsed');
     } else {
       alert(json.error || 'Unable to endorse.');
@@ -42,3 +44,34 @@ document.addEventListener('click', async (e) => {
     btn.disabled = false;
   }
 });
+
+// Live endorsement counts on profile pages (Server-Sent Events)
+const liveRoot = document.querySelector('[data-live-url]');
+if (liveRoot && window.EventSource) {
+  const source = new EventSource(liveRoot.dataset.liveUrl);
+  source.addEventListener('counts', (e) => {
+    const counts = JSON.parse(e.data);
+    for (const [skillId, count] of Object.entries(counts)) setEndorseCount(skillId, count);
+  });
+  window.addEventListener('pagehide', () => source.close());
+}
+
+// Profile editor: "Add row" appends a copy of the formset's empty form
+document.addEventListener('click', (e) => {
+  const btn = e.target.closest('.add-row');
+  if (!btn) return;
+  e.preventDefault();
+
+  const prefix = btn.dataset.prefix;
+  const total = document.getElementById(`id_${prefix}-TOTAL_FORMS`);
+  const template = document.getElementById(`${prefix}-empty-form`);
+  const html = template.innerHTML.replace(/__prefix__/g, total.value);
+  document.getElementById(`${prefix}-rows`).insertAdjacentHTML('beforeend', html);
+  total.value = parseInt(total.value, 10) + 1;
+});
+
+// Staff student list: the header checkbox ticks every row
+document.addEventListener('change', (e) => {
+  if (!e.target.matches('.select-all')) return;
+  e.target.closest('form').querySelectorAll('input[name="students"]').forEach(box => box.checked = e.target.checked);
+});
@@ -0,0 +1,161 @@
+"""
+Content-addressed, deduplicated storage for portfolio uploads.
+
+Uploads are hashed while they are streamed to disk and stored once as
+cas/<aa>/<bb>/<sha256><ext>; saving the same bytes again returns the
+existing name. A blob's references are the PortfolioItem rows whose file or
+screenshot holds its name (both columns are indexed), and profiles.signals
+deletes a blob, with its renditions, once the last reference goes away.
+
+A save that reuses a blob refreshes its mtime, and collect_blob() leaves
+blobs younger than PROFILES_BLOB_GRACE_SECONDS alone: the row that will
+reference a reused blob may not have committed yet when another
+transaction's collection runs. Both steps hold the same file lock, and
+`manage.py gc_portfolio_blobs` deletes such blobs once the grace passed.
+"""
+import fcntl
+import hashlib
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.template.defaultfilters import filesizeformat
+
+CAS_PREFIX = 'cas'
+
+
+def max_upload_size():
+    return getattr(settings, 'PROFILES_MAX_UPLOAD_SIZE', 10 * 1024 * 1024)
+
+
+def grace_seconds():
+    return getattr(settings, 'PROFILES_BLOB_GRACE_SECONDS', 3600)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    @contextmanager
+    def blob_lock(self):
+        """Exclusive across threads and processes: reuse and deletion of a blob never interleave."""
+        root = self.path(CAS_PREFIX)
+        os.makedirs(root, exist_ok=True)
+        with open(os.path.join(root, '.lock'), 'a') as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is derived from the content in _save(), so it never collides.
+        return name
+
+    def _save(self, name, content):
+        limit = max_upload_size()
+        incoming = self.path(os.path.join(CAS_PREFIX, '.incoming'))
+        os.makedirs(incoming, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=incoming)
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in content.chunks():
+                    size += len(chunk)
+                    if limit and size > limit:
+                        raise ValidationError(f'Uploads are limited to {filesizeformat(limit)}.')
+                    digest.update(chunk)
+                    out.write(chunk)
+
+            hexdigest = digest.hexdigest()
+            ext = os.path.splitext(name)[1].lower()
+            final_name = f'{CAS_PREFIX}/{hexdigest[:2]}/{hexdigest[2:4]}/{hexdigest}{ext}'
+            final_path = self.path(final_name)
+            with self.blob_lock():
+                if os.path.exists(final_path):
+                    # Reused: restart the grace period so a pending collection keeps it.
+                    os.utime(final_path)
+                    os.remove(tmp_path)
+                else:
+                    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                    if self.file_permissions_mode is not None:
+                        os.chmod(tmp_path, self.file_permissions_mode)
+                    os.replace(tmp_path, final_path)
+            return final_name
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+portfolio_storage = ContentAddressedStorage()
+
+
+def get_portfolio_storage():
+    return portfolio_storage
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(f'{CAS_PREFIX}/')
+
+
+def is_referenced(name):
+    from django.db.models import Q
+    from .models import PortfolioItem
+    return PortfolioItem.objects.filter(Q(file=name) | Q(screenshot=name)).exists()
+
+
+def collect_blob(name, unused_since=None):
+    """
+    Delete the blob `name` and its renditions if no PortfolioItem references
+    it and it is older than the grace period. Returns True if deleted.
+
+    A caller that deleted the blob's last references itself passes the time
+    it read them as `unused_since`: the blob then goes unless an upload
+    reused it after that, however recent it is.
+    """
+    from .renditions import rendition_names
+    if not is_blob(name) or is_referenced(name):
+        return False
+    with portfolio_storage.blob_lock():
+        try:
+            modified = os.path.getmtime(portfolio_storage.path(name))
+        except FileNotFoundError:
+            return False
+        if unused_since is not None:
+            if modified >= unused_since:
+                return False
+        elif time.time() - modified < grace_seconds():
+            return False
+        for derived in rendition_names(name).values():
+            portfolio_storage.delete(derived)
+        portfolio_storage.delete(name)
+    return True
+
+
+class UploadSizeLimitHandler(FileUploadHandler):
+    """
+    Drops any uploaded file larger than PROFILES_MAX_UPLOAD_SIZE as soon as
+    its bytes pass the limit, instead of after the whole body was received.
+    Names of dropped fields are listed in request.rejected_uploads.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        limit = max_upload_size()
+        if limit and self.received > limit:
+            rejected = getattr(self.request, 'rejected_uploads', [])
+            rejected.append(self.field_name)
+            self.request.rejected_uploads = rejected
+            raise SkipFile()
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
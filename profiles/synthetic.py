@@ -0,0 +1,132 @@
+"""
+Seeded synthetic students for benchmarks, query-budget tests and load tests.
+
+generate() bulk-creates students with skills, projects, awards, portfolio
+links and endorsements, the way import_profiles does. How many of each a
+student gets comes from a Spread: counts lie between `low` and `high`, and a
+`skew` above 1 pushes most students toward `low` so a few have long profiles,
+like real data. The same seed always produces the same dataset.
+"""
+import random
+from dataclasses import dataclass, field
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from . import search
+from .models import Student, Skill, SkillTag, Project, Award, PortfolioItem, Endorsement, StudentStats, skill_key
+
+SKILL_NAMES = [
+    'Python', 'Django', 'JavaScript', 'TypeScript', 'React', 'Vue', 'SQL', 'PostgreSQL',
+    'Data Analysis', 'Machine Learning', 'Statistics', 'Java', 'Kotlin', 'Swift', 'C', 'C++',
+    'Rust', 'Go', 'Linux', 'Docker', 'Git', 'HTML', 'CSS', 'UX Design', 'Figma',
+    'Public Speaking', 'Technical Writing', 'Project Management', 'Networking', 'Security',
+]
+WORDS = [
+    'adaptive', 'campus', 'cloud', 'community', 'dashboard', 'data', 'energy', 'garden',
+    'health', 'library', 'map', 'mobile', 'music', 'open', 'portal', 'robot', 'smart',
+    'solar', 'student', 'tracker', 'transit', 'tutor', 'vision', 'water', 'weather',
+]
+
+
+@dataclass(frozen=True)
+class Spread:
+    low: int = 0
+    high: int = 5
+    skew: float = 2.0
+
+    def draw(self, rng):
+        return self.low + int((self.high - self.low + 1) * rng.random() ** self.skew)
+
+    @classmethod
+    def parse(cls, value):
+        """"LOW:HIGH" or "LOW:HIGH:SKEW", as given on the command line."""
+        parts = value.split(':')
+        if len(parts) not in (2, 3):
+            raise ValueError(f'Expected LOW:HIGH[:SKEW], got {value!r}.')
+        low, high = int(parts[0]), int(parts[1])
+        if low < 0 or high < low:
+            raise ValueError(f'Invalid range {value!r}.')
+        return cls(low, high, float(parts[2]) if len(parts) == 3 else cls.skew)
+
+
+@dataclass(frozen=True)
+class Profile:
+    """Per-student distribution of the generated rows."""
+    skills: Spread = field(default_factory=lambda: Spread(1, 8))
+    projects: Spread = field(default_factory=lambda: Spread(0, 5))
+    awards: Spread = field(default_factory=lambda: Spread(0, 3))
+    portfolio: Spread = field(default_factory=lambda: Spread(0, 2))
+    endorsements: Spread = field(default_factory=lambda: Spread(0, 20, 3.0))  # Per skill.
+    public_ratio: float = 0.9
+
+
+def _phrase(rng, words=3):
+    return ' '.join(rng.sample(WORDS, words)).capitalize()
+
+
+def generate(count, seed=0, profile=None, prefix='synthetic', batch_size=1000):
+    """Create `count` students; returns their ids. Usernames continue after existing ones with `prefix`."""
+    profile = profile or Profile()
+    rng = random.Random(seed)
+    User = get_user_model()
+    start = User.objects.filter(username__startswith=f'{prefix}_').count()
+    unusable = make_password(None)
+    student_ids = []
+    for offset in range(0, count, batch_size):
+        size = min(batch_size, count - offset)
+        with transaction.atomic():
+            student_ids += _generate_batch(rng, profile, prefix, start + offset, size, unusable)
+    return student_ids
+
+
+def _generate_batch(rng, profile, prefix, first, size, password):
+    User = get_user_model()
+    users = User.objects.bulk_create([
+        User(username=f'{prefix}_{first + i}', email=f'{prefix}_{first + i}@example.com', password=password)
+        for i in range(size)
+    ])
+    students = Student.objects.bulk_create([
+        Student(user=user, bio=f'{_phrase(rng, 4)}.', is_public=rng.random() < profile.public_ratio)
+        for user in users
+    ])
+
+    tags = SkillTag.objects.for_names(SKILL_NAMES)
+    tag_counts = {}
+    skills, projects, awards, portfolio = [], [], [], []
+    for student in students:
+        names = rng.sample(SKILL_NAMES, min(profile.skills.draw(rng), len(SKILL_NAMES)))
+        skills += [
+            Skill(student=student, name=name, tag=tags[skill_key(name)], endorsement_count=profile.endorsements.draw(rng))
+            for name in names
+        ]
+        if student.is_public:
+            for name in names:
+                tag_id = tags[skill_key(name)].pk
+                tag_counts[tag_id] = tag_counts.get(tag_id, 0) + 1
+        projects += [
+            Project(student=student, title=_phrase(rng), description=f'{_phrase(rng, 6)}.')
+            for _ in range(profile.projects.draw(rng))
+        ]
+        awards += [Award(student=student, title=f'{_phrase(rng, 2)} award') for _ in range(profile.awards.draw(rng))]
+        portfolio += [
+            PortfolioItem(student=student, title=_phrase(rng), url=f'https://example.com/{student.user.username}/{n}')
+            for n in range(profile.portfolio.draw(rng))
+        ]
+    skills = Skill.objects.bulk_create(skills, batch_size=500)
+    Project.objects.bulk_create(projects, batch_size=500)
+    Award.objects.bulk_create(awards, batch_size=500)
+    PortfolioItem.objects.bulk_create(portfolio, batch_size=500)
+    # One Endorsement row per counted endorsement, so recounts agree with the counters.
+    Endorsement.objects.bulk_create([
+        Endorsement(skill=skill, session_key=f'{prefix}-{n}')
+        for skill in skills for n in range(skill.endorsement_count)
+    ], batch_size=1000)
+
+    # bulk_create sends no signals: refresh the derived tables for the batch.
+    student_ids = [student.pk for student in students]
+    StudentStats.objects.rebuild(student_ids)
+    SkillTag.objects.bump_counts(tag_counts)
+    search.index_students(student_ids)
+    return student_ids
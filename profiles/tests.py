@@ -1,3 +1,932 @@
-from django.test import TestCase
+"""
+Query budgets and benchmarks for the public views, over synthetic data.
 
-# Create your tests here.
+QueryBudgetTests runs every scenario below at each of BUDGET_SIZES students
+and fails when a scenario runs more queries than its budget, or when its
+query count grows with the dataset (an N+1). They run with the normal suite.
+
+BenchmarkTests times the same scenarios at BENCHMARK_SIZES and compares the
+median wall time with benchmark_baseline.json. It only runs when asked:
+
+    PROFILES_BENCHMARK=1 python manage.py test profiles
+    PROFILES_BENCHMARK=update python manage.py test profiles   # rewrite the baseline
+
+Any change to QUERY_BUDGETS or to the scenarios must rewrite the baseline
+in the same commit.
+
+The remaining classes check behaviour: the derived state (StudentStats,
+the search index, caches, counters) following the rows it is built from,
+and the pagination, conditional requests and staff operations built on it.
+"""
+import json
+import os
+import tempfile
+import statistics
+import sys
+import time
+from pathlib import Path
+from io import StringIO
+from unittest import mock, skipUnless
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.http import HttpResponse
+from django.template.backends.django import Template as DjangoTemplate
+from django.test import AsyncClient, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.http import http_date
+
+from . import endorsements, instrumentation, live, renditions, routers, search, storage, views
+from .cache import render_cache
+from .models import (
+    LEADERBOARD_ORDERINGS, RANK_MODES, SCORE_WEIGHTS, Award, Endorsement, PortfolioItem, Project,
+    RankEntry, RankSnapshot, Skill, SkillTag, Student, StudentRank, StudentStats,
+)
+from .rankings import acurrent_ranks, current_ranks, take_snapshot
+from .synthetic import generate
+from .views import public_students_with_stats
+
+BUDGET_SIZES = (20, 200)
+BENCHMARK_SIZES = tuple(int(n) for n in os.environ.get('PROFILES_BENCHMARK_SIZES', '100,1000,5000').split(','))
+BENCHMARK_RUNS = 5
+BASELINE_PATH = Path(__file__).with_name('benchmark_baseline.json')
+# A benchmark fails when its median exceeds the baseline by this factor plus slack.
+BENCHMARK_TOLERANCE = 1.5
+BENCHMARK_SLACK_MS = 5.0
+
+# Most queries each scenario may run, including session and user lookups
+# and on_commit work. Lower a budget when a change saves queries.
+QUERY_BUDGETS = {
+    'leaderboard': 4,
+    'leaderboard_next_page': 4,
+    'leaderboard_by_skills': 4,
+    'leaderboard_not_modified': 3,
+    'skill_leaderboard': 5,
+    'rising': 7,
+    'student_list': 5,
+    'student_list_by_skills': 5,
+    'student_detail': 9,
+    'student_detail_cached': 3,
+    'student_detail_not_modified': 3,
+    'profile_edit': 8,
+    'my_rank': 4,
+    'profile_edit_add_skill': 20,
+    'endorse_skill': 10,
+}
+
+
+class ScenarioMixin:
+    """Runs the scenarios in QUERY_BUDGETS against whatever students exist."""
+    added = 0
+
+    def prepare_scenarios(self):
+        self.viewer = Student.objects.filter(is_public=True).select_related('user').order_by('pk').first()
+        self.target = Student.objects.filter(is_public=True, skills__isnull=False).order_by('-pk').first()
+        self.skills = list(Skill.objects.filter(student__is_public=True).order_by('-pk').values_list('pk', flat=True)[:200])
+        self.tags = list(SkillTag.objects.order_by('-student_count').values_list('pk', flat=True)[:2])
+        self.tag_name = SkillTag.objects.get(pk=self.tags[0]).name
+        self.client.force_login(self.viewer.user)
+        first = self.client.get(reverse('leaderboard'))
+        self.next_cursor = first.context['page_obj'].next_cursor
+
+    def run_scenario(self, name):
+        """Run one scenario; returns (milliseconds, queries)."""
+        setup = getattr(self, f'setup_{name}', None)
+        if setup:
+            setup()
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            started = time.perf_counter()
+            response = getattr(self, f'scenario_{name}')()
+            elapsed = (time.perf_counter() - started) * 1000
+        self.assertLess(response.status_code, 400, f'{name} returned {response.status_code}')
+        return elapsed, len(queries)
+
+    def scenario_leaderboard(self):
+        return self.client.get(reverse('leaderboard'))
+
+    def scenario_leaderboard_next_page(self):
+        return self.client.get(reverse('leaderboard'), {'after': self.next_cursor} if self.next_cursor else {})
+
+    def scenario_leaderboard_by_skills(self):
+        return self.client.get(reverse('leaderboard'), {'by': 'skills'})
+
+    def setup_leaderboard_not_modified(self):
+        self.etag = self.client.get(reverse('leaderboard'))['ETag']
+
+    def scenario_leaderboard_not_modified(self):
+        response = self.client.get(reverse('leaderboard'), headers={'If-None-Match': self.etag})
+        self.assertEqual(response.status_code, 304)
+        return response
+
+    def scenario_skill_leaderboard(self):
+        caches[settings.PROFILES_RENDER_CACHE].clear()
+        return self.client.get(reverse('skill_leaderboard', args=[self.tag_name]))
+
+    def setup_rising(self):
+        # Two snapshots at least, so the board has a window to compare.
+        take_snapshot()
+        take_snapshot()
+
+    def scenario_rising(self):
+        return self.client.get(reverse('rising'))
+
+    def scenario_student_list(self):
+        return self.client.get(reverse('student_list'))
+
+    def scenario_student_list_by_skills(self):
+        return self.client.get(reverse('student_list'), {'skill': self.tags[:2]})
+
+    def scenario_student_detail(self):
+        caches[settings.PROFILES_RENDER_CACHE].clear()
+        return self.client.get(reverse('student_detail', args=[self.target.pk]))
+
+    def setup_student_detail_cached(self):
+        self.client.get(reverse('student_detail', args=[self.target.pk]))
+
+    def scenario_student_detail_cached(self):
+        return self.client.get(reverse('student_detail', args=[self.target.pk]))
+
+    def setup_student_detail_not_modified(self):
+        self.etag = self.client.get(reverse('student_detail', args=[self.target.pk]))['ETag']
+
+    def scenario_student_detail_not_modified(self):
+        response = self.client.get(reverse('student_detail', args=[self.target.pk]), headers={'If-None-Match': self.etag})
+        self.assertEqual(response.status_code, 304)
+        return response
+
+    def scenario_profile_edit(self):
+        return self.client.get(reverse('profile_edit'))
+
+    def scenario_my_rank(self):
+        return self.client.get(reverse('my_rank'))
+
+    def scenario_profile_edit_add_skill(self):
+        self.added += 1
+        return self.client.post(reverse('profile_edit'), {
+            'skills-TOTAL_FORMS': 1, 'skills-INITIAL_FORMS': 0, 'skills-0-name': f'Skill {self.added}',
+        })
+
+    def scenario_endorse_skill(self):
+        return self.client.post(reverse('endorse_skill', args=[self.skills.pop()]))
+
+
+class QueryBudgetTests(ScenarioMixin, TestCase):
+    def test_query_budgets(self):
+        counts = {}
+        created = 0
+        for size in BUDGET_SIZES:
+            generate(size - created, seed=size)
+            created = size
+            self.prepare_scenarios()
+            for name, budget in QUERY_BUDGETS.items():
+                _, queries = self.run_scenario(name)
+                with self.subTest(scenario=name, students=size):
+                    self.assertLessEqual(queries, budget, f'{name} ran {queries} queries (budget {budget}).')
+                counts.setdefault(name, []).append(queries)
+        for name, per_size in counts.items():
+            with self.subTest(scenario=name):
+                self.assertEqual(len(set(per_size)), 1, f'{name} query count grows with the dataset: {per_size}')
+
+
+@skipUnless(os.environ.get('PROFILES_BENCHMARK'), 'Set PROFILES_BENCHMARK=1 to run the benchmarks.')
+class BenchmarkTests(ScenarioMixin, TestCase):
+    def test_benchmarks(self):
+        results = {}
+        created = 0
+        for size in BENCHMARK_SIZES:
+            generate(size - created, seed=size)
+            created = size
+            self.prepare_scenarios()
+            for name in QUERY_BUDGETS:
+                runs = [self.run_scenario(name) for _ in range(BENCHMARK_RUNS)]
+                results.setdefault(name, {})[str(size)] = {
+                    'ms': round(statistics.median(ms for ms, _ in runs), 2),
+                    'queries': max(queries for _, queries in runs),
+                }
+        self.report(results)
+
+        baseline = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {}
+        if os.environ['PROFILES_BENCHMARK'] == 'update' or not baseline:
+            # Sizes not run this time keep their recorded numbers; retired scenarios go.
+            updated = {name: {**baseline.get(name, {}), **per_size} for name, per_size in results.items()}
+            BASELINE_PATH.write_text(json.dumps(updated, indent=2, sort_keys=True) + '\n')
+            return
+        for name, per_size in results.items():
+            for size, result in per_size.items():
+                expected = baseline.get(name, {}).get(size)
+                with self.subTest(scenario=name, students=size):
+                    self.assertIsNotNone(expected, f'{name} at {size} students has no baseline; run with PROFILES_BENCHMARK=update.')
+                    limit = expected['ms'] * BENCHMARK_TOLERANCE + BENCHMARK_SLACK_MS
+                    self.assertLessEqual(result['ms'], limit, f'{name} at {size} students: {result["ms"]} ms, baseline {expected["ms"]} ms.')
+                    self.assertLessEqual(result['queries'], expected['queries'])
+
+    def report(self, results):
+        sizes = [str(size) for size in BENCHMARK_SIZES]
+        lines = ['', f'{"scenario":<26}' + ''.join(f'{size + " students":>22}' for size in sizes)]
+        for name, per_size in results.items():
+            cells = ''.join(f'{per_size[size]["ms"]:>11.1f} ms {per_size[size]["queries"]:>3} q  ' for size in sizes)
+            lines.append(f'{name:<26}{cells}')
+        # The runner's stream, so the table lands next to the test results.
+        sys.stderr.write('\n'.join(lines) + '\n')
+
+
+def make_student(username, **fields):
+    user = get_user_model().objects.create_user(username, email=f'{username}@example.com', password='x')
+    return Student.objects.create(user=user, **fields)
+
+
+class SearchIndexTests(TestCase):
+    """The FTS documents follow the rows they are built from."""
+
+    def hits(self, query):
+        return [student_id for student_id, _ in search.search(query)]
+
+    def test_child_save_and_delete_reindex(self):
+        student = make_student('ada')
+        skill = Skill.objects.create(student=student, name='Haskell')
+        self.assertEqual(self.hits('haskell'), [student.pk])
+        skill.delete()
+        self.assertEqual(self.hits('haskell'), [])
+
+    def test_visibility_applies_at_query_time(self):
+        student = make_student('ada', bio='compilers')
+        self.assertEqual(self.hits('compilers'), [student.pk])
+        student.is_public = False
+        student.save()
+        self.assertEqual(self.hits('compilers'), [])
+        student.is_public = True
+        student.save()
+        self.assertEqual(self.hits('compilers'), [student.pk])
+
+    def test_student_delete_removes_document(self):
+        student = make_student('ada', bio='compilers')
+        student.user.delete()
+        self.assertEqual(self.hits('compilers'), [])
+
+    def test_username_change_reindexes(self):
+        student = make_student('ada')
+        student.user.username = 'lovelace'
+        student.user.save()
+        self.assertEqual(self.hits('lovelace'), [student.pk])
+        self.assertEqual(self.hits('ada'), [])
+
+    def test_rebuild(self):
+        student = make_student('ada', bio='compilers')
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {search.SEARCH_TABLE}')
+        self.assertEqual(search.rebuild(), 1)
+        self.assertEqual(self.hits('compilers'), [student.pk])
+
+
+class StudentStatsTests(TestCase):
+    """StudentStats counters move with the child rows and match a rebuild."""
+
+    def counters(self, student):
+        return StudentStats.objects.values('num_skills', 'num_projects', 'num_awards', 'total_endorsements', 'overall_score').get(pk=student.pk)
+
+    def assertMatchesRebuild(self, student):
+        counters = self.counters(student)
+        StudentStats.objects.rebuild([student.pk])
+        self.assertEqual(counters, self.counters(student))
+
+    def test_add_and_delete_children(self):
+        student = make_student('ada')
+        skill = Skill.objects.create(student=student, name='Python')
+        Skill.objects.create(student=student, name='Go')
+        project = Project.objects.create(student=student, title='Compiler')
+        Award.objects.create(student=student, title='Prize')
+        Endorsement.objects.create(skill=skill, session_key='a')
+        counters = self.counters(student)
+        self.assertEqual(
+            {field: counters[field] for field in SCORE_WEIGHTS},
+            {'num_skills': 2, 'num_projects': 1, 'num_awards': 1, 'total_endorsements': 1},
+        )
+        self.assertEqual(counters['overall_score'], sum(SCORE_WEIGHTS[field] * counters[field] for field in SCORE_WEIGHTS))
+        self.assertMatchesRebuild(student)
+
+        project.delete()
+        skill.delete()  # Takes its endorsement along.
+        counters = self.counters(student)
+        self.assertEqual((counters['num_skills'], counters['num_projects'], counters['total_endorsements']), (1, 0, 0))
+        self.assertMatchesRebuild(student)
+
+    def test_visibility_copied(self):
+        student = make_student('ada')
+        student.is_public = False
+        student.save()
+        self.assertFalse(StudentStats.objects.get(pk=student.pk).is_public)
+
+
+class KeysetPaginationTests(TestCase):
+    """Walking the leaderboard by cursors visits every row once, in order, both ways."""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Small profiles, so many students tie on every counter.
+        generate(40, seed=2)
+
+    def page(self, by, **cursor):
+        page = self.client.get(reverse('leaderboard'), {'by': by, 'size': 6, **cursor}).context['page_obj']
+        return [student.pk for student in page], page
+
+    def test_pages_cover_the_board(self):
+        for by in LEADERBOARD_ORDERINGS:
+            with self.subTest(by=by):
+                expected = [student.pk for student in public_students_with_stats().order_by(*LEADERBOARD_ORDERINGS[by])]
+                rows, page = self.page(by)
+                forward = [rows]
+                while page.has_next():
+                    rows, page = self.page(by, after=page.next_cursor)
+                    forward.append(rows)
+                self.assertGreater(len(forward), 2)
+                self.assertEqual([pk for rows in forward for pk in rows], expected)
+                self.assertTrue(all(len(rows) == 6 for rows in forward[:-1]))
+
+                # Back from the last page by previous cursors: the same pages, reversed.
+                backward = [forward[-1]]
+                while page.has_previous():
+                    rows, page = self.page(by, before=page.previous_cursor)
+                    backward.append(rows)
+                self.assertEqual(backward[::-1], forward)
+
+    def test_bad_cursor_is_404(self):
+        self.assertEqual(self.client.get(reverse('leaderboard'), {'after': 'not-a-cursor'}).status_code, 404)
+
+
+class RenderCacheTests(TestCase):
+    """A cached profile body is replaced once a child row is written."""
+
+    def setUp(self):
+        caches[settings.PROFILES_RENDER_CACHE].clear()
+        self.student = make_student('ada')
+        self.url = reverse('student_detail', args=[self.student.pk])
+
+    def test_child_write_invalidates(self):
+        self.client.get(self.url)
+        hits = render_cache.hits
+        self.assertNotContains(self.client.get(self.url), 'Compiler')
+        self.assertEqual(render_cache.hits, hits + 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            project = Project.objects.create(student=self.student, title='Compiler')
+        self.assertContains(self.client.get(self.url), 'Compiler')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            project.delete()
+        self.assertNotContains(self.client.get(self.url), 'Compiler')
+
+    def test_invalidation_waits_for_commit(self):
+        version = render_cache.version(self.student.pk)
+        with self.captureOnCommitCallbacks() as callbacks:
+            Project.objects.create(student=self.student, title='Compiler')
+        self.assertEqual(render_cache.version(self.student.pk), version)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(render_cache.version(self.student.pk), version)
+
+
+@override_settings(PROFILES_ENDORSEMENT_WRITE_BEHIND=True)
+class WriteBehindTests(TestCase):
+    """Buffered endorsements reach every counter at flush time, and not before."""
+
+    def setUp(self):
+        self.buffer = endorsements.EndorsementBuffer(interval=3600, max_pending=1000)
+        patcher = mock.patch.object(endorsements, 'endorsement_buffer', self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Also cancels the flush timer.
+        self.addCleanup(self.buffer.flush)
+        self.student = make_student('ada')
+        self.skill = Skill.objects.create(student=self.student, name='Python')
+
+    def endorse(self, session_key):
+        return endorsements.record_endorsement(self.skill, session_key)
+
+    def totals(self):
+        self.skill.refresh_from_db()
+        stats = StudentStats.objects.get(pk=self.student.pk)
+        return self.skill.endorsement_count, stats.total_endorsements, stats.overall_score
+
+    def skill_score(self):
+        return SCORE_WEIGHTS['num_skills']
+
+    def test_click_defers_every_counter(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.endorse('a'), 1)
+        statements = ' '.join(query['sql'] for query in queries)
+        self.assertNotIn('profiles_studentstats', statements)
+        self.assertNotIn('UPDATE "profiles_student"', statements)
+        self.assertEqual(self.endorse('b'), 2)
+        self.assertEqual(self.totals(), (0, 0, self.skill_score()))
+
+    def test_flush(self):
+        self.endorse('a')
+        self.endorse('b')
+        before = Student.objects.get(pk=self.student.pk).updated_at
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(self.totals(), (2, 2, self.skill_score() + 2 * SCORE_WEIGHTS['total_endorsements']))
+        self.assertGreater(Student.objects.get(pk=self.student.pk).updated_at, before)
+        self.assertEqual(self.buffer.pending(self.skill.pk), 0)
+        self.assertEqual(self.buffer.current_count(self.skill.pk), 2)
+
+    def test_current_count_adds_pending_to_committed(self):
+        self.endorse('a')
+        self.buffer.flush()
+        self.endorse('b')
+        self.assertEqual(self.buffer.pending(self.skill.pk), 1)
+        self.assertEqual(self.buffer.current_count(self.skill.pk), 2)
+
+    def test_recount_does_not_double_count_pending(self):
+        self.endorse('a')
+        endorsements.recount_endorsements([self.skill.pk])
+        self.buffer.flush()
+        self.assertEqual(self.totals()[:2], (1, 1))
+
+    def test_poller_counts_pending(self):
+        broadcaster = live.Broadcaster(poll_interval=0, max_subscribers=10)
+        subscriber = live.ThreadSubscriber()
+        broadcaster.subscribe(self.student.pk, subscriber)
+        self.endorse('a')
+        broadcaster.publish(self.student.pk, {self.skill.pk: self.buffer.current_count(self.skill.pk)})
+        self.assertEqual(subscriber.take(), {self.skill.pk: 1})
+        # The committed count is still 0; the poller must not send it.
+        broadcaster.poll([self.student.pk])
+        self.assertEqual(subscriber.take(), {})
+        self.buffer.flush()
+        broadcaster.poll([self.student.pk])
+        self.assertEqual(subscriber.take(), {})
+        self.endorse('b')
+        broadcaster.poll([self.student.pk])
+        self.assertEqual(subscriber.take(), {self.skill.pk: 2})
+
+
+class ReconcileEndorsementsTests(TestCase):
+    """reconcile_endorsements puts drifted counters back to the Endorsement row counts."""
+
+    def setUp(self):
+        student = make_student('ada')
+        self.skill = Skill.objects.create(student=student, name='Python')
+        self.other = Skill.objects.create(student=student, name='Go')
+        Endorsement.objects.create(skill=self.skill, session_key='a')
+        Endorsement.objects.create(skill=self.skill, session_key='b')
+        Skill.objects.filter(pk=self.skill.pk).update(endorsement_count=7)
+        Skill.objects.filter(pk=self.other.pk).update(endorsement_count=3)
+
+    def counts(self):
+        return list(Skill.objects.filter(pk__in=[self.skill.pk, self.other.pk]).order_by('pk').values_list('endorsement_count', flat=True))
+
+    def reconcile(self, *args):
+        out = StringIO()
+        call_command('reconcile_endorsements', *args, '--chunk-size=1', stdout=out)
+        return out.getvalue()
+
+    def test_corrects_drift(self):
+        output = self.reconcile()
+        self.assertEqual(self.counts(), [2, 0])
+        self.assertIn('corrected 2 (net drift -8)', output)
+
+    def test_dry_run_writes_nothing(self):
+        output = self.reconcile('--dry-run')
+        self.assertEqual(self.counts(), [7, 3])
+        self.assertIn(f'skill {self.skill.pk}: 7 -> 2 (-5)', output)
+
+
+class ImportProfilesTests(TestCase):
+    """import_profiles: records in, duplicates out, resumable."""
+
+    def write(self, lines, suffix='.jsonl'):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, f'students{suffix}')
+        with open(path, 'w', encoding='utf-8') as handle:
+            handle.write('\n'.join(lines) + '\n')
+        return path
+
+    def run_import(self, path, *args):
+        call_command('import_profiles', path, *args, stdout=StringIO())
+
+    def test_import_and_skip_duplicates(self):
+        make_student('taken')
+        path = self.write([
+            json.dumps({'username': 'ada', 'email': 'ada@example.com', 'skills': ['Python', 'python ', 'Go'],
+                        'projects': [{'title': 'Engine', 'description': 'Analytical'}], 'awards': ['Medal::Gold']}),
+            json.dumps({'username': 'ada', 'bio': 'second copy'}),
+            json.dumps({'username': 'taken'}),
+            '',
+            json.dumps({'username': 'grace', 'is_public': False}),
+        ])
+        self.run_import(path)
+        ada = Student.objects.get(user__username='ada')
+        self.assertEqual(ada.bio, '')
+        self.assertEqual(sorted(ada.skills.values_list('name', flat=True)), ['Go', 'Python'])
+        self.assertEqual(list(ada.projects.values_list('title', 'description')), [('Engine', 'Analytical')])
+        self.assertEqual(list(ada.awards.values_list('title', 'description')), [('Medal', 'Gold')])
+        self.assertEqual(StudentStats.objects.get(pk=ada.pk).num_skills, 2)
+        self.assertFalse(Student.objects.get(user__username='grace').is_public)
+        self.assertEqual(Student.objects.count(), 3)
+        self.assertEqual(SkillTag.objects.get(key='python').student_count, 1)
+
+    def test_first_spelling_wins(self):
+        self.run_import(self.write([json.dumps({'username': 'ada', 'skills': ['Python', 'python ']})]))
+        self.assertEqual(SkillTag.objects.get(key='python').name, 'Python')
+        self.assertEqual(list(Skill.objects.values_list('name', flat=True)), ['Python'])
+
+    def test_csv(self):
+        path = self.write(['username,email,skills,projects', 'ada,ada@example.com,Python|SQL,Engine::Analytical'], suffix='.csv')
+        self.run_import(path)
+        ada = Student.objects.get(user__username='ada')
+        self.assertEqual(sorted(ada.skills.values_list('name', flat=True)), ['Python', 'SQL'])
+        self.assertEqual(list(ada.projects.values_list('description', flat=True)), ['Analytical'])
+
+    def test_resume_skips_committed_records(self):
+        path = self.write([json.dumps({'username': name}) for name in ('a', 'b', 'c', 'd')])
+        with open(f'{path}.checkpoint', 'w') as handle:
+            json.dump({'source': os.path.abspath(path), 'records': 2}, handle)
+        self.run_import(path, '--resume', '--batch-size=1')
+        self.assertEqual(sorted(Student.objects.values_list('user__username', flat=True)), ['c', 'd'])
+        self.assertFalse(os.path.exists(f'{path}.checkpoint'))
+
+    def test_checkpoint_of_another_file(self):
+        path = self.write([json.dumps({'username': 'a'})])
+        with open(f'{path}.checkpoint', 'w') as handle:
+            json.dump({'source': '/elsewhere.jsonl', 'records': 1}, handle)
+        with self.assertRaises(CommandError):
+            self.run_import(path, '--resume')
+
+    def test_rejects_non_objects(self):
+        for line in ('[1, 2]', '"x"', '{bad json'):
+            with self.subTest(line=line), self.assertRaisesMessage(CommandError, 'Line 2:'):
+                self.run_import(self.write([json.dumps({'username': 'a'}), line]))
+
+
+class RenditionScheduleTests(TestCase):
+    """A screenshot is queued once, and released when nothing was queued."""
+
+    def setUp(self):
+        self.executor = mock.Mock()
+        self.storage = mock.Mock(path=lambda name: f'/media/{name}')
+        for patcher in (
+            mock.patch.object(renditions, 'get_executor', return_value=self.executor),
+            mock.patch.object(renditions, '_in_flight', set()),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_queued_once(self):
+        with mock.patch.object(renditions, 'missing_targets', return_value=[('/media/a__thumb.png', 200, 'PNG')]):
+            self.assertTrue(renditions.schedule('a.png', storage=self.storage))
+            self.assertFalse(renditions.schedule('a.png', storage=self.storage))
+        self.assertEqual(self.executor.submit.call_count, 1)
+        self.assertEqual(renditions._in_flight, {'a.png'})
+
+    def test_released_when_nothing_missing(self):
+        with mock.patch.object(renditions, 'missing_targets', return_value=[]):
+            self.assertFalse(renditions.schedule('a.png', storage=self.storage))
+        self.assertEqual(renditions._in_flight, set())
+        self.executor.submit.assert_not_called()
+
+
+class ContentAddressedStorageTests(TestCase):
+    """Identical uploads share one blob, which goes once nothing references it."""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = override_settings(MEDIA_ROOT=media.name, PROFILES_BLOB_GRACE_SECONDS=0)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.student = make_student('ada')
+
+    def upload(self, content=b'%PDF-1.4 report'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return PortfolioItem.objects.create(student=self.student, title='Report', file=ContentFile(content, name='report.PDF'))
+
+    def exists(self, name):
+        return storage.portfolio_storage.exists(name)
+
+    def test_dedup_and_collect(self):
+        first, second = self.upload(), self.upload()
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertRegex(first.file.name, r'^cas/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.pdf$')
+        self.assertNotEqual(self.upload(b'other').file.name, first.file.name)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(self.exists(second.file.name))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(self.exists(second.file.name))
+
+    def test_grace_period_keeps_a_reused_blob(self):
+        item = self.upload()
+        name = item.file.name
+        PortfolioItem.objects.filter(pk=item.pk).delete()
+        with override_settings(PROFILES_BLOB_GRACE_SECONDS=3600):
+            # As if a new row reusing the blob had not committed yet.
+            self.assertFalse(storage.collect_blob(name))
+        self.assertTrue(self.exists(name))
+        self.assertTrue(storage.collect_blob(name))
+        self.assertFalse(self.exists(name))
+
+    def test_gc_command(self):
+        name = self.upload().file.name
+        PortfolioItem.objects.all().delete()  # Its on-commit collection never runs here: the blob is orphaned.
+        out = StringIO()
+        call_command('gc_portfolio_blobs', '--dry-run', stdout=out)
+        self.assertIn(f'Would delete {name}', out.getvalue())
+        self.assertTrue(self.exists(name))
+        call_command('gc_portfolio_blobs', stdout=StringIO())
+        self.assertFalse(self.exists(name))
+
+
+@override_settings(PROFILES_INSTRUMENTATION=True)
+class InstrumentationTests(TestCase):
+    """RequestTimingMiddleware counts the queries of sync and async requests alike."""
+
+    def setUp(self):
+        generate(5, seed=1)
+        instrumentation.timings.reset()
+
+    def query_count(self, response):
+        db = response['Server-Timing'].split(',')[0]
+        return int(db.split('(')[1].split()[0])
+
+    def assertUnwrapped(self):
+        self.assertEqual(connection.execute_wrappers, [])
+        self.assertIsNot(DjangoTemplate.render, instrumentation._timed_render)
+
+    def test_sync_request(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('leaderboard'))
+        self.assertEqual(self.query_count(response), len(queries))
+        self.assertEqual([row['name'] for row in instrumentation.timings.summary()], ['leaderboard'])
+        self.assertUnwrapped()
+
+    async def test_async_request(self):
+        response = await AsyncClient().get(reverse('leaderboard'))
+        self.assertGreater(self.query_count(response), 0)
+        # The same queries as through the sync handler, which instruments the calling thread.
+        sync_response = await sync_to_async(self.client.get)(reverse('leaderboard'))
+        self.assertEqual(self.query_count(response), self.query_count(sync_response))
+        self.assertUnwrapped()
+
+
+@mock.patch('profiles.routers.replica_configured', return_value=True)
+class ReplicaRoutingTests(TestCase):
+    """Marked views read the replica until the browser writes, then the primary for a while."""
+
+    def setUp(self):
+        self.student = make_student('ada', bio='Old')
+        self.client.login(username='ada', password='x')
+
+    def read_alias(self, cookies=None):
+        view = views.LeaderboardView.as_view()
+        request = RequestFactory().get('/')
+        request.COOKIES.update(cookies or {})
+        seen = []
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            seen.append(routers.ReplicaRouter().db_for_read(Student))
+            return HttpResponse()
+
+        middleware = routers.ReplicaMiddleware(get_response)
+        middleware(request)
+        return seen[0]
+
+    def test_marked_view_reads_replica(self, _):
+        self.assertEqual(self.read_alias(), routers.REPLICA_ALIAS)
+
+    def test_sticky_cookie_reads_primary(self, _):
+        self.assertEqual(self.read_alias({routers.STICKY_COOKIE: '1'}), 'default')
+
+    def test_write_sets_sticky_cookie(self, _):
+        response = self.client.post(reverse('profile_edit'), {'bio': 'New', 'is_public': 'on'})
+        self.assertEqual(response.status_code, 302)
+        cookie = response.cookies[routers.STICKY_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.REPLICA_STICKY_SECONDS)
+
+    def test_read_sets_no_cookie(self, _):
+        response = self.client.get(reverse('my_rank'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(routers.STICKY_COOKIE, response.cookies)
+
+
+class ConditionalGetTests(TestCase):
+    """A matching ETag gets a 304 until something on the page changes."""
+
+    def setUp(self):
+        self.student = make_student('ada', is_public=True)
+
+    def assertRevalidates(self, url, edit):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        edit()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_detail(self):
+        url = reverse('student_detail', args=[self.student.pk])
+        self.assertRevalidates(url, lambda: Skill.objects.create(student=self.student, name='Python'))
+
+    def test_leaderboard(self):
+        self.assertRevalidates(reverse('leaderboard'), lambda: make_student('bob', is_public=True))
+
+    def test_list(self):
+        self.assertRevalidates(reverse('student_list'), lambda: Project.objects.create(student=self.student, title='Compiler'))
+
+    def test_list_after_delete(self):
+        bob = make_student('bob', is_public=True)
+        url = reverse('leaderboard')
+        response = self.client.get(url)
+        # A deletion leaves the latest updated_at alone, so the lists are validated by ETag only.
+        self.assertNotIn('Last-Modified', response)
+        etag = response['ETag']
+        bob.user.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag, HTTP_IF_MODIFIED_SINCE=http_date(time.time()))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'bob')
+
+    def test_detail_last_modified(self):
+        url = reverse('student_detail', args=[self.student.pk])
+        self.assertIn('Last-Modified', self.client.get(url))
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60)).status_code, 304)
+
+
+class SkillTagTests(TestCase):
+    """Skills map to one catalog tag per spelling, once per student, and the facets follow visibility."""
+
+    def setUp(self):
+        self.ada = make_student('ada', is_public=True)
+        self.bob = make_student('bob', is_public=True)
+        Skill.objects.create(student=self.ada, name='Python')
+        Skill.objects.create(student=self.bob, name='  python ')
+
+    def facet_counts(self):
+        response = self.client.get(reverse('student_list'))
+        return {facet['tag'].name: facet['count'] for facet in response.context['facets']}
+
+    def test_name_takes_tag_spelling(self):
+        self.assertEqual(list(self.bob.skills.values_list('name', flat=True)), ['Python'])
+        self.assertEqual(SkillTag.objects.get().student_count, 2)
+
+    def test_one_skill_per_tag(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Skill.objects.create(student=self.ada, name='PYTHON')
+
+    def test_filtered_counts_are_labelled_totals(self):
+        tag = SkillTag.objects.get()
+        response = self.client.get(reverse('student_list'), {'skill': tag.pk})
+        self.assertContains(response, 'Counts are totals over all public profiles')
+        self.assertNotContains(self.client.get(reverse('student_list')), 'Counts are totals')
+
+    def test_visibility_toggle(self):
+        self.assertEqual(self.facet_counts(), {'Python': 2})
+        self.ada.is_public = False
+        self.ada.save()
+        self.assertEqual(self.facet_counts(), {'Python': 1})
+        self.bob.is_public = False
+        self.bob.save()
+        self.assertEqual(self.facet_counts(), {})
+        self.ada.is_public = True
+        self.ada.save()
+        self.assertEqual(self.facet_counts(), {'Python': 1})
+
+
+class RankSnapshotTests(TestCase):
+    """Snapshots refresh the cached profiles of students whose rank moved, and nothing else."""
+
+    def setUp(self):
+        caches[settings.PROFILES_RENDER_CACHE].clear()
+        self.students = [make_student(f'student{i}', is_public=True) for i in range(4)]
+        take_snapshot()
+
+    def test_keeps_updated_at(self):
+        student = self.students[0]
+        Project.objects.create(student=student, title='Compiler')
+        before = dict(Student.objects.values_list('pk', 'updated_at'))
+        versions = {pk: render_cache.version(pk) for pk in before}
+        with self.captureOnCommitCallbacks(execute=True):
+            _, written = take_snapshot()
+        self.assertGreater(written, 0)
+        self.assertEqual(dict(Student.objects.values_list('pk', 'updated_at')), before)
+        moved = set(RankEntry.objects.filter(snapshot=RankSnapshot.objects.latest('pk')).values_list('student_id', flat=True))
+        self.assertIn(student.pk, moved)
+        for pk, version in versions.items():
+            if pk in moved:
+                self.assertNotEqual(render_cache.version(pk), version)
+            else:
+                self.assertEqual(render_cache.version(pk), version)
+
+    @mock.patch('profiles.rankings.invalidate_profile')
+    def test_detail_page_follows_snapshot(self, _):
+        # invalidate_profile is off, as for a snapshot taken by another process.
+        student = self.students[3]
+        url = reverse('student_detail', args=[student.pk])
+        response = self.client.get(url)
+        self.assertContains(response, '<strong>#4</strong>')
+        etag = response['ETag']
+        # Only the ranks move: updated_at, and so the old validators, stay as they were.
+        StudentStats.objects.filter(pk=student.pk).update(num_projects=1, num_skills=1, num_awards=1, total_endorsements=1, overall_score=7)
+        take_snapshot()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertContains(response, '<strong>#1</strong>')
+
+    def test_drops_private_students_in_chunks(self):
+        for student in self.students[:3]:
+            student.is_public = False
+            student.save()
+        with mock.patch.object(connection.ops, 'bulk_batch_size', return_value=2):
+            take_snapshot()
+        self.assertEqual(set(StudentRank.objects.values_list('student_id', flat=True)), {self.students[3].pk})
+        dropped = RankEntry.objects.filter(snapshot=RankSnapshot.objects.latest('pk'), rank=None)
+        self.assertEqual(dropped.count(), 3 * len(RANK_MODES))
+
+
+class CurrentRanksTests(TestCase):
+    """current_ranks() agrees with the position on the sorted leaderboard, in one query."""
+
+    def setUp(self):
+        generate(40, seed=3)
+
+    def test_matches_sorted_board(self):
+        for by, ordering in LEADERBOARD_ORDERINGS.items():
+            board = list(public_students_with_stats().order_by(*ordering).values_list('pk', flat=True))
+            for position, pk in enumerate(board, 1):
+                with self.assertNumQueries(1):
+                    ranks = current_ranks(pk)
+                self.assertEqual((ranks[by]['rank'], ranks[by]['total']), (position, len(board)), (by, pk))
+
+    def test_private_student(self):
+        private = Student.objects.filter(is_public=False).first() or make_student('hidden', is_public=False)
+        self.assertEqual(current_ranks(private.pk), {})
+
+    async def test_async(self):
+        pk = await public_students_with_stats().order_by(*LEADERBOARD_ORDERINGS['overall']).values_list('pk', flat=True).afirst()
+        ranks = await acurrent_ranks(pk)
+        self.assertEqual(ranks['overall']['rank'], 1)
+
+
+class BatchEditTests(TestCase):
+    """profile_edit saves a whole skills formset at once and keeps every counter in step."""
+
+    def setUp(self):
+        self.student = make_student('ada', is_public=True)
+        self.skills = {name: Skill.objects.create(student=self.student, name=name) for name in ('Python', 'Go', 'Rust')}
+        self.client.login(username='ada', password='x')
+
+    def post(self, rows, new=()):
+        """rows: [(skill, name, delete)] for the existing skills, then the `new` names."""
+        data = {'skills-TOTAL_FORMS': len(rows) + len(new), 'skills-INITIAL_FORMS': len(rows)}
+        for i, (skill, name, delete) in enumerate(rows):
+            data[f'skills-{i}-id'] = skill.pk
+            data[f'skills-{i}-name'] = name
+            if delete:
+                data[f'skills-{i}-DELETE'] = 'on'
+        for i, name in enumerate(new, len(rows)):
+            data[f'skills-{i}-name'] = name
+        return self.client.post(reverse('profile_edit'), data)
+
+    def names(self):
+        return set(self.student.skills.values_list('name', flat=True))
+
+    def tag_counts(self):
+        return dict(SkillTag.objects.filter(student_count__gt=0).values_list('name', 'student_count'))
+
+    def test_rename_delete_and_add(self):
+        python, go, rust = self.skills.values()
+        response = self.post([(python, 'Haskell', False), (go, 'Go', True), (rust, 'Rust', False)], new=['elm'])
+        self.assertRedirects(response, reverse('profile_edit'))
+        self.assertEqual(self.names(), {'Haskell', 'Rust', 'elm'})
+        self.assertEqual(self.tag_counts(), {'Haskell': 1, 'Rust': 1, 'elm': 1})
+        self.assertEqual(StudentStats.objects.get(pk=self.student.pk).num_skills, 3)
+        self.assertEqual([pk for pk, _ in search.search('haskell')], [self.student.pk])
+        self.assertEqual(search.search('python'), [])
+
+    def test_swap_names(self):
+        python, go, rust = self.skills.values()
+        response = self.post([(python, 'Go', False), (go, 'Python', False), (rust, 'Rust', False)])
+        self.assertRedirects(response, reverse('profile_edit'))
+        self.assertEqual(Skill.objects.get(pk=python.pk).name, 'Go')
+        self.assertEqual(Skill.objects.get(pk=go.pk).name, 'Python')
+
+    def test_conflict_saves_nothing(self):
+        python, go, rust = self.skills.values()
+        response = self.post([(python, 'Python', False), (go, ' python', False), (rust, 'Rust', True)], new=['Elm'])
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'You already have this skill.')
+        self.assertEqual(self.names(), {'Python', 'Go', 'Rust'})
+        self.assertEqual(self.tag_counts(), {'Python': 1, 'Go': 1, 'Rust': 1})
@@ -1,17 +1,28 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 from django.contrib.auth import views as auth_views
 
+# Native async read and endorsement views for ASGI deployments (stud/asgi.py).
+if getattr(settings, 'PROFILES_ASYNC_VIEWS', False):
+    from . import async_views as read_views
+else:
+    read_views = views
 
 
 urlpatterns = [
     path('', views.landing, name='landing'),
-    path('students/', views.PublicStudentListView.as_view(), name='student_list'),
-    path('leaderboard/', views.LeaderboardView.as_view(), name='leaderboard'),
-    path('profile/<int:pk>/', views.StudentDetailView.as_view(), name='student_detail'),
+    path('students/', read_views.PublicStudentListView.as_view(), name='student_list'),
+    path('leaderboard/', read_views.LeaderboardView.as_view(), name='leaderboard'),
+    path('leaderboard/rising/', views.RisingView.as_view(), name='rising'),
+    path('leaderboard/skill/<path:name>/', views.SkillLeaderboardView.as_view(), name='skill_leaderboard'),
+    path('search/', views.search, name='search'),
+    path('profile/<int:pk>/', read_views.StudentDetailView.as_view(), name='student_detail'),
     path('profile/edit/', views.profile_edit, name='profile_edit'),
+    path('profile/rank/', views.my_rank, name='my_rank'),
+    path('profile/<int:pk>/live/', views.endorsement_stream, name='endorsement_stream'),
 
-    path('endorse/<int:skill_id>/', views.endorse_skill, name='endorse_skill'),
+    path('endorse/<int:skill_id>/', read_views.endorse_skill, name='endorse_skill'),
 
     # Admin actions
     path('admin/delete_student/<int:student_id>/', views.delete_student, name='delete_student'),
@@ -1,15 +1,25 @@
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login
-from django.db.models import Count, F
-from django.db.models.functions import Coalesce
-from django.http import JsonResponse, Http404
+from django.core.handlers.asgi import ASGIRequest
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, prefetch_related_objects
+from django.http import HttpResponse, JsonResponse, Http404, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
 from django.views.generic import TemplateView, ListView, DetailView
-from .models import Student, Skill, Project, Award, PortfolioItem, Endorsement
-from .forms import StudentForm, SkillForm, ProjectForm, AwardForm, PortfolioItemForm
+from .models import Student, Skill, SkillTag, PortfolioItem, StudentRank, LEADERBOARD_ORDERINGS, RANK_MODES, skill_key
+from .forms import StudentForm
 from django.contrib.auth.forms import UserCreationForm
+from .cache import render_cache
+from .conditional import ConditionalGet, ConditionalListMixin, leaderboard_version
 from .decorators import admin_required
+from .endorsements import record_endorsement
+from .pagination import KeysetPaginationMixin
+from . import batch, bulk, live, rankings
+from . import search as profile_search
 
 # ------------------- Landing & Home -------------------
 def landing(request):
@@ -26,24 +36,108 @@ class HomeView(TemplateView):
 
 
 # ------------------- Public Profiles -------------------
-class PublicStudentListView(ListView):
+def public_students_with_stats():
+    """Public students annotated with their counters from the StudentStats table."""
+    return Student.objects.filter(stats__is_public=True).select_related('user').annotate(
+        num_skills=F('stats__num_skills'),
+        num_projects=F('stats__num_projects'),
+        num_awards=F('stats__num_awards'),
+        total_endorsements=F('stats__total_endorsements'),
+        overall_score=F('stats__overall_score'),
+        stats_id=F('stats__pk'),
+    )
+
+
+class PublicStudentListView(ConditionalListMixin, KeysetPaginationMixin, ListView):
+    """
+    Public students, optionally filtered by skill tags: ?skill=<tag id> (repeatable)
+    with ?match=all (the default) or ?match=any. Facet counts are the number
+    of public students per tag, read from SkillTag.student_count. They are
+    totals, not counts within the filtered results, and the page says so.
+    """
     model = Student
     template_name = 'pages/student_list.html'
     context_object_name = 'students'
+    ordering = ('stats_id',)
+    replica_reads = True
+
+    def selected_tags(self):
+        ids = {int(value) for value in self.request.GET.getlist('skill') if value.isdigit()}
+        return sorted(ids)[:getattr(settings, 'PROFILES_MAX_SKILL_FILTERS', 10)]
+
+    def match_any(self):
+        return self.request.GET.get('match') == 'any'
 
     def get_queryset(self):
-        return Student.objects.filter(is_public=True).annotate(
-            num_skills=Count('skills'),
-            num_projects=Count('projects'),
-            num_awards=Count('awards'),
-            total_endorsements=Coalesce(Count('skills__endorsements'), 0)
-        )
+        queryset = public_students_with_stats().order_by(*self.get_ordering())
+        tags = self.selected_tags()
+        if tags:
+            # Both forms read only skill_tag_student_idx.
+            students = Skill.objects.filter(tag_id__in=tags).values('student_id')
+            if not self.match_any() and len(tags) > 1:
+                students = students.annotate(n=Count('tag_id', distinct=True)).filter(n=len(tags)).values('student_id')
+            queryset = queryset.filter(pk__in=students)
+        return queryset
+
+    def facet_queryset(self):
+        limit = getattr(settings, 'PROFILES_FACET_LIMIT', 20)
+        return SkillTag.objects.filter(student_count__gt=0).order_by('-student_count', 'name')[:limit]
+
+    def missing_facet_queryset(self, shown):
+        """Selected tags outside the top facets, so they can still be unselected."""
+        missing = set(self.selected_tags()) - {tag.pk for tag in shown}
+        return SkillTag.objects.filter(pk__in=missing) if missing else SkillTag.objects.none()
+
+    def facet_context(self, tags):
+        selected = self.selected_tags()
+        facets = [
+            {'tag': tag, 'count': tag.student_count, 'selected': tag.pk in selected, 'query': self._filter_query(selected, tag.pk)}
+            for tag in tags
+        ]
+        return {
+            'facets': facets,
+            'selected_tags': selected,
+            'match_any': self.match_any(),
+            'match_all_query': self._filter_query(match='all'),
+            'match_any_query': self._filter_query(match='any'),
+        }
+
+    def _filter_query(self, selected=None, toggled=None, match=None):
+        """Query string for page one with `toggled` added to or removed from the filter, or another `match`."""
+        params = self.request.GET.copy()
+        params.pop('after', None)
+        params.pop('before', None)
+        if toggled is not None:
+            tags = [tag for tag in selected if tag != toggled] if toggled in selected else [*selected, toggled]
+            params.setlist('skill', [str(tag) for tag in tags])
+        if match is not None:
+            params['match'] = match
+        return params.urlencode()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        tags = list(self.facet_queryset())
+        tags += self.missing_facet_queryset(tags)
+        context.update(self.facet_context(tags))
+        return context
 
 
 class StudentDetailView(DetailView):
     model = Student
     template_name = 'pages/student_detail.html'
     context_object_name = 'student_obj'
+    body_template_name = 'pages/includes/student_body.html'
+    replica_reads = True
+
+    def get_queryset(self):
+        # The snapshot that drew the sparklines, read in the same query.
+        return Student.objects.select_related('user').annotate(rank_snapshot=rankings.latest_snapshot())
+
+    def conditional(self, user, student):
+        return ConditionalGet(user, student.updated_at, student.pk, student.rank_snapshot)
+
+    def body_stamp(self, student):
+        return f'{student.updated_at.timestamp()}:{student.rank_snapshot}'
 
     def get_object(self, queryset=None):
         obj = super().get_object(queryset)
@@ -52,85 +146,177 @@ class StudentDetailView(DetailView):
             raise Http404("This profile is private.")
         return obj
 
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        conditional = self.conditional(request.user, self.object)
+        response = conditional.response(request)
+        if response is None:
+            response = self.render_to_response(self.get_context_data(object=self.object))
+        return conditional.apply(response)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        student = self.object
+        if student.is_public:
+            body = render_cache.get_or_render(
+                student.pk, lambda: self.render_body(student), stamp=self.body_stamp(student),
+            )
+        else:
+            body = self.render_body(student)
+        context['profile_body'] = mark_safe(body)
+        return context
+
+    def render_body(self, student):
+        prefetch_related_objects([student], 'skills', 'projects', 'awards', 'portfolio')
+        history = rankings.rank_history(student.pk) if student.is_public else []
+        return render_to_string(self.body_template_name, {'student_obj': student, 'rank_history': history})
+
+
+# ------------------- Search -------------------
+def search(request):
+    query = request.GET.get('q', '').strip()
+    results = []
+    if query:
+        hits = profile_search.search(query, limit=getattr(settings, 'PROFILES_SEARCH_LIMIT', 50))
+        students = public_students_with_stats().in_bulk([student_id for student_id, _ in hits])
+        for student_id, snippet in hits:
+            if student_id in students:
+                results.append({'student': students[student_id], 'snippet': snippet})
+    return render(request, 'pages/search.html', {'query': query, 'results': results})
+
 
 # ------------------- Leaderboard -------------------
-class LeaderboardView(ListView):
+class LeaderboardView(ConditionalListMixin, KeysetPaginationMixin, ListView):
     model = Student
     template_name = 'pages/leader_board.html'
     context_object_name = 'students'
+    replica_reads = True
 
-    def get_queryset(self):
+    def get_ordering(self):
         by = self.request.GET.get('by', 'overall')
-        qs = Student.objects.filter(is_public=True).annotate(
-            num_skills=Count('skills', distinct=True),
-            num_projects=Count('projects', distinct=True),
-            num_awards=Count('awards', distinct=True),
-            total_endorsements=Coalesce(Count('skills__endorsements', distinct=True), 0),
-        )
+        return LEADERBOARD_ORDERINGS.get(by, LEADERBOARD_ORDERINGS['overall'])
 
-        if by == 'projects':
-            return qs.order_by('-num_projects', '-num_skills', '-num_awards')
-        elif by == 'skills':
-            return qs.order_by('-num_skills', '-num_projects', '-num_awards')
-        elif by == 'awards':
-            return qs.order_by('-num_awards', '-num_projects', '-num_skills')
-        elif by == 'endorsements':
-            return qs.order_by('-total_endorsements', '-num_projects')
-        else:
-            qs = qs.annotate(
-                overall_score=F('num_projects')*3 + F('num_skills')*2 + F('num_awards') + F('total_endorsements')
-            )
-            return qs.order_by('-overall_score', '-num_projects')
+    def get_queryset(self):
+        return public_students_with_stats().order_by(*self.get_ordering())
 
 
-# ------------------- Profile Edit -------------------
-@login_required
-def profile_edit(request):
-    student, _ = Student.objects.get_or_create(user=request.user)
-    if request.method == 'POST':
-        sform = StudentForm(request.POST, instance=student)
-        skform = SkillForm(request.POST, prefix='skill')
-        prform = ProjectForm(request.POST, prefix='project')
-        awform = AwardForm(request.POST, prefix='award')
-        pform = PortfolioItemForm(request.POST, request.FILES, prefix='portfolio')
+class SkillLeaderboardView(ConditionalListMixin, KeysetPaginationMixin, ListView):
+    """Public students with one skill, most endorsed first (profiles.rankings)."""
+    model = Skill
+    template_name = 'pages/skill_leader_board.html'
+    context_object_name = 'skills'
+    ordering = rankings.SKILL_ORDERING
+    replica_reads = True
 
-        if sform.is_valid():
-            sform.save()
-            messages.success(request, 'Profile updated.')
+    def get(self, request, *args, **kwargs):
+        self.tag = SkillTag.objects.filter(key=skill_key(kwargs['name'])).first()
+        if self.tag is None:
+            raise Http404('No such skill.')
+        return super().get(request, *args, **kwargs)
 
-        if skform.is_valid() and skform.cleaned_data.get('name'):
-            Skill.objects.get_or_create(student=student, name=skform.cleaned_data['name'])
-            messages.success(request, 'Skill added.')
+    def get_queryset(self):
+        return (
+            Skill.objects.filter(tag=self.tag, student__is_public=True)
+            .select_related('student__user').order_by(*self.get_ordering())
+        )
+
+    def paginate_queryset(self, queryset, page_size):
+        first_page = not (self.request.GET.get('after') or self.request.GET.get('before'))
+        if not (first_page and page_size == getattr(settings, 'PROFILES_PAGE_SIZE', 25) and rankings.is_popular(self.tag)):
+            return super().paginate_queryset(queryset, page_size)
+        rows = rankings.top_rows(self.tag, lambda: list(self._page_query(queryset, page_size)[0]))
+        return self._page(rows, page_size, None, None)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['tag'] = self.tag
+        return context
+
+
+class RisingView(ListView):
+    """Students who climbed the most places in one leaderboard mode over ?days= (profiles.rankings)."""
+    template_name = 'pages/rising.html'
+    context_object_name = 'ranks'
+    replica_reads = True
+
+    def get(self, request, *args, **kwargs):
+        self.by = request.GET.get('by', 'overall')
+        if self.by not in RANK_MODES:
+            self.by = 'overall'
+        try:
+            self.days = min(max(int(request.GET.get('days', '')), 1), 365)
+        except ValueError:
+            self.days = getattr(settings, 'PROFILES_RISING_DAYS', 7)
+        self.start, self.latest = rankings.rising_window(self.days)
+        # The window moves with the clock, so the snapshots it spans are part of the version.
+        conditional = ConditionalGet(
+            request.user, *leaderboard_version(),
+            self.start and self.start.pk, self.latest and self.latest.pk, self.by, self.days, dated=False,
+        )
+        response = conditional.response(request) or super().get(request, *args, **kwargs)
+        return conditional.apply(response)
 
-        if prform.is_valid() and prform.cleaned_data.get('title'):
-            Project.objects.create(student=student, **prform.cleaned_data)
-            messages.success(request, 'Project added.')
+    def get_queryset(self):
+        if self.start is None:
+            return StudentRank.objects.none()
+        return rankings.rising(RANK_MODES[self.by], self.start)[:getattr(settings, 'PROFILES_RISING_LIMIT', 50)]
 
-        if awform.is_valid() and awform.cleaned_data.get('title'):
-            Award.objects.create(student=student, **awform.cleaned_data)
-            messages.success(request, 'Award added.')
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update({'by': self.by, 'days': self.days, 'start': self.start, 'latest': self.latest})
+        return context
 
-        if pform.is_valid() and pform.cleaned_data.get('title'):
-            PortfolioItem.objects.create(student=student, **pform.cleaned_data)
-            messages.success(request, 'Portfolio item added.')
 
-        return redirect('profile_edit')
+# ------------------- Profile Edit -------------------
+@login_required
+def profile_edit(request):
+    student, _ = Student.objects.get_or_create(user=request.user)
+    if request.method == 'POST':
+        sform = StudentForm(request.POST, instance=student) if 'bio' in request.POST else None
+        formsets = batch.formsets(student, request.POST, request.FILES)
+        bound = [formset for formset in formsets.values() if formset.is_bound]
+        rejected = getattr(request, 'rejected_uploads', None)
+        if rejected:
+            # The handler dropped the files, so the portfolio rows would save without them.
+            bound = [formset for formset in bound if formset.model is not PortfolioItem]
+            messages.error(request, f'Upload too large, portfolio changes not saved: {", ".join(rejected)}.')
+        # Evaluate every form so all errors show, not just the first invalid one.
+        valid = [form.is_valid() for form in ([sform] if sform else []) + bound]
+        if all(valid):
+            try:
+                with transaction.atomic():
+                    if sform and sform.has_changed():
+                        sform.save()
+                    batch.save_formsets(student, bound)
+            except IntegrityError:
+                # Another window saved the same skill between validation and the insert.
+                messages.error(request, 'Those skills were changed elsewhere; nothing was saved. Please try again.')
+            else:
+                messages.success(request, 'Profile saved.')
+                return redirect('profile_edit')
+        sform = sform or StudentForm(instance=student)
     else:
         sform = StudentForm(instance=student)
-        skform = SkillForm(prefix='skill')
-        prform = ProjectForm(prefix='project')
-        awform = AwardForm(prefix='award')
-        pform = PortfolioItemForm(prefix='portfolio')
+        formsets = batch.formsets(student)
 
     context = {
         'student': student,
-        'sform': sform, 'skform': skform,
-        'prform': prform, 'awform': awform,
-        'pform': pform
+        'sform': sform,
+        'formsets': formsets,
+        'ranks': rankings.current_ranks(student.pk),
     }
     return render(request, 'pages/profile_edit.html', context)
 
 
+@login_required
+def my_rank(request):
+    """The logged-in student's rank and percentile in every leaderboard mode, without loading the board."""
+    student = Student.objects.filter(user=request.user).only('pk', 'is_public').first()
+    if student is None:
+        return JsonResponse({'ok': False, 'error': 'No student profile.'}, status=404)
+    return JsonResponse({'ok': True, 'public': student.is_public, 'ranks': rankings.current_ranks(student.pk)})
+
+
 # ------------------- Endorse Skills -------------------
 @login_required
 def endorse_skill(request, skill_id):
@@ -141,7 +327,7 @@ def endorse_skill(request, skill_id):
         request.session.create()
     session_key = request.session.session_key
 
-    skill = get_object_or_404(Skill, id=skill_id)
+    skill = get_object_or_404(Skill.objects.select_related('student'), id=skill_id)
 
     # Private profile restriction
     if not skill.student.is_public:
@@ -149,24 +335,44 @@ def endorse_skill(request, skill_id):
             return JsonResponse({'ok': False, 'error': 'Profile is private.'}, status=403)
 
     try:
-        Endorsement.objects.create(
-            skill=skill,
-            session_key=session_key,
+        count = record_endorsement(
+            skill,
+            session_key,
             endorser=request.user if request.user.is_authenticated else None
         )
-        Skill.objects.filter(pk=skill.pk).update(endorsement_count=F('endorsement_count') + 1)
-        skill.refresh_from_db()
-        return JsonResponse({'ok': True, 'count': skill.endorsement_count})
-    except Exception:
+        return JsonResponse({'ok': True, 'count': count})
+    except IntegrityError:
         return JsonResponse({'ok': False, 'error': 'Already endorsed from this browser.'}, status=400)
 
 
+async def endorsement_stream(request, pk):
+    """Server-Sent Events: the student's current skill counts, then each change (profiles.live)."""
+    try:
+        student = await Student.objects.aget(pk=pk)
+    except Student.DoesNotExist:
+        raise Http404('No student found matching the query.')
+    if not student.is_public:
+        user = await request.auser()
+        if not user.is_authenticated or student.user_id != user.pk:
+            raise Http404("This profile is private.")
+    if live.broadcaster.subscriber_count() >= live.broadcaster.max_subscribers:
+        return HttpResponse('Too many live connections.', status=503, headers={'Retry-After': '30'})
+
+    snapshot = {skill_id: count async for skill_id, count in student.skills.values_list('pk', 'endorsement_count')}
+    # Only an ASGI server can consume an async generator without a thread.
+    events = live.astream(student.pk, snapshot) if isinstance(request, ASGIRequest) else live.stream(student.pk, snapshot)
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 # ------------------- Admin Actions for Profiles -------------------
 @login_required
 @admin_required
 def delete_student(request, student_id):
-    student = get_object_or_404(Student, id=student_id)
-    student.user.delete()
+    student = get_object_or_404(Student.objects.select_related('user'), id=student_id)
+    bulk.delete_students([student.pk])
     messages.success(request, f'{student.user.username} deleted successfully.')
     return redirect('student_list')
 
@@ -175,10 +381,14 @@ def delete_student(request, student_id):
 @admin_required
 def endorse_any_student(request, skill_id):
     skill = get_object_or_404(Skill, id=skill_id)
-    skill.endorsement_count += 1
-    skill.save()
-    messages.success(request, f'{skill.name} endorsed successfully.')
-    return redirect('student_detail', pk=skill.student.id)
+    if not request.session.session_key:
+        request.session.create()
+    try:
+        record_endorsement(skill, request.session.session_key, endorser=request.user)
+        messages.success(request, f'{skill.name} endorsed successfully.')
+    except IntegrityError:
+        messages.info(request, f'{skill.name} was already endorsed from this browser.')
+    return redirect('student_detail', pk=skill.student_id)
 
 
 # ------------------- Signup -------------------
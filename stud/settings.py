@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,6 +43,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Outermost so its timings cover the whole stack; inactive unless
+    # PROFILES_INSTRUMENTATION is on.
+    "profiles.instrumentation.RequestTimingMiddleware",
+    "profiles.routers.ReplicaMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -82,6 +87,73 @@ DATABASES = {
     }
 }
 
+# Production SQLite profile, enabled with STUD_DB_PROFILE=production:
+# - WAL, so readers don't block the writer and the writer doesn't block readers
+# - synchronous=NORMAL, which is safe with WAL
+# - a 64 MB page cache and 256 MB of mmap
+# - connections kept for 10 minutes instead of reopened per request
+# - BEGIN IMMEDIATE for atomic blocks, so writers queue on the busy timeout
+#   instead of failing when a read transaction upgrades to a write
+# - stud.sqlite retries statements still refused after the timeout
+if os.environ.get("STUD_DB_PROFILE") == "production":
+    DATABASES["default"].update({
+        "ENGINE": "stud.sqlite",
+        "CONN_MAX_AGE": 600,
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "init_command": (
+                "PRAGMA journal_mode=WAL;"
+                "PRAGMA synchronous=NORMAL;"
+                "PRAGMA cache_size=-65536;"
+                "PRAGMA mmap_size=268435456;"
+                "PRAGMA temp_store=MEMORY"
+            ),
+            "transaction_mode": "IMMEDIATE",
+            "timeout": 5,
+            "busy_retries": 3,
+            "busy_backoff": 0.05,
+        },
+    })
+
+# Read replica for the read-only profile views (profiles.routers), enabled
+# with STUD_REPLICA=1. It is a copy of the primary refreshed by
+# `manage.py refresh_replica --every N`. A browser that wrote reads from the
+# primary for REPLICA_STICKY_SECONDS, so keep that above the refresh interval.
+if os.environ.get("STUD_REPLICA") == "1":
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "NAME": BASE_DIR / "db.replica.sqlite3",
+        "TEST": {"MIRROR": "default"},
+    }
+
+DATABASE_ROUTERS = ["profiles.routers.ReplicaRouter"]
+REPLICA_STICKY_SECONDS = 30
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+#
+# "render" holds rendered public profile bodies (profiles.cache). LocMemCache
+# evicts least recently used entries once MAX_ENTRIES is reached but is
+# per-process; with several workers on one host use the filesystem backend
+# so edits invalidate every worker:
+#     "BACKEND": "profiles.cache.LRUFileBasedCache",
+#     "LOCATION": BASE_DIR / ".cache" / "render",
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "render": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "profile-render",
+        "TIMEOUT": 60 * 60,
+        "OPTIONS": {"MAX_ENTRIES": 5000},
+    },
+}
+
+PROFILES_RENDER_CACHE = "render"
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -121,11 +193,110 @@ STATIC_URL = "static/"
 STATICFILES_DIRS = [BASE_DIR / 'profiles' / 'static']
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+MEDIA_URL = "media/"
+MEDIA_ROOT = BASE_DIR / "media"
+
+# Screenshot renditions (profiles.renditions): worker processes in the
+# resize pool, and how many screenshots may be queued before new ones wait
+# for the next page view or `manage.py generate_renditions`.
+PROFILES_RENDITION_WORKERS = 2
+PROFILES_RENDITION_QUEUE = 32
+
+# Portfolio blobs (profiles.storage) no row references are kept this many
+# seconds after their last save, in case a new row reusing them has not
+# committed yet; `manage.py gc_portfolio_blobs` removes them afterwards.
+PROFILES_BLOB_GRACE_SECONDS = 3600
+
+# Per-file upload limit, enforced while the request body streams in
+# (profiles.storage.UploadSizeLimitHandler) and again by the storage.
+PROFILES_MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+
+FILE_UPLOAD_HANDLERS = [
+    "profiles.storage.UploadSizeLimitHandler",
+    "django.core.files.uploadhandler.MemoryFileUploadHandler",
+    "django.core.files.uploadhandler.TemporaryFileUploadHandler",
+]
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 
+# Default and maximum ?size= for the keyset-paginated leaderboard and public list.
+PROFILES_PAGE_SIZE = 25
+PROFILES_MAX_PAGE_SIZE = 100
+
+# Skill facets on the public list: how many tags to show (most students
+# first) and how many ?skill= filters one request may combine.
+PROFILES_FACET_LIMIT = 20
+PROFILES_MAX_SKILL_FILTERS = 10
+
+# Per-skill leaderboards (profiles.rankings): the first page of tags with at
+# least TOP_MIN_STUDENTS public students is cached for up to TOP_TIMEOUT
+# seconds, and dropped sooner when one of its endorsement counts changes.
+PROFILES_SKILL_TOP_MIN_STUDENTS = 20
+PROFILES_SKILL_TOP_TIMEOUT = 60
+
+# Rank history (profiles.rankings), recorded by `manage.py snapshot_ranks
+# --every N`. The rising board compares ranks over ?days= (RISING_DAYS by
+# default) and lists at most RISING_LIMIT students; profile sparklines span
+# the last RANK_HISTORY_POINTS snapshots.
+PROFILES_RISING_DAYS = 7
+PROFILES_RISING_LIMIT = 50
+PROFILES_RANK_HISTORY_POINTS = 30
+
+# Maximum number of hits returned by the profile search page.
+PROFILES_SEARCH_LIMIT = 50
+
+# Write-behind endorsement counters (profiles.endorsements): insert the
+# Endorsement row per click, batch the Skill.endorsement_count increments
+# into one UPDATE every FLUSH_INTERVAL seconds or FLUSH_SIZE increments.
+PROFILES_ENDORSEMENT_WRITE_BEHIND = False
+PROFILES_ENDORSEMENT_FLUSH_INTERVAL = 2.0
+PROFILES_ENDORSEMENT_FLUSH_SIZE = 100
+
+# Serve the leaderboard, public list, student detail and endorse endpoints
+# with the native async views in profiles.async_views. Turn on for ASGI
+# deployments (e.g. `uvicorn stud.asgi:application`); under WSGI the sync
+# views are faster.
+PROFILES_ASYNC_VIEWS = os.environ.get("PROFILES_ASYNC_VIEWS") == "1"
+
+# Live endorsement counts on profile pages (profiles.live), streamed as
+# Server-Sent Events. Counts changed by other workers are polled every
+# POLL_INTERVAL seconds (0 turns polling off). Under WSGI each stream holds
+# a thread and is closed after WSGI_MAX_AGE seconds; serve through
+# stud/asgi.py to keep them open without threads.
+PROFILES_LIVE_KEEPALIVE = 15
+PROFILES_LIVE_POLL_INTERVAL = 2.0
+PROFILES_LIVE_MAX_SUBSCRIBERS = 1000
+PROFILES_LIVE_WSGI_MAX_AGE = 60
+
+# Profile, public list and leaderboard pages carry ETag and Last-Modified
+# (profiles.conditional) and answer revalidations with 304. Anonymous copies
+# are public and fresh for this many seconds; logged-in copies are private
+# and always revalidated.
+PROFILES_PUBLIC_MAX_AGE = 0
+
+# Bulk student deletions from the staff list (adminpanel.jobs) run on a
+# background thread, CHUNK students per transaction. Jobs interrupted by a
+# restart are resumed by `manage.py run_delete_jobs`.
+PROFILES_BULK_DELETE_WORKER = True
+PROFILES_BULK_DELETE_CHUNK = 100
+
+# The staff student list (adminpanel.listing) counts at most this many
+# matching students; past it the total is ANALYZE's estimate or "more than".
+PROFILES_ADMIN_COUNT_LIMIT = 10000
+
+# Per-request SQL/template timing (profiles.instrumentation): Server-Timing
+# headers, slow-request and N+1 logging, per-URL percentiles at
+# /adminpanel/metrics/. Adds a little overhead to every query when on.
+PROFILES_INSTRUMENTATION = False
+PROFILES_SLOW_REQUEST_MS = 500
+PROFILES_SLOW_REQUEST_QUERIES = 20
+PROFILES_REPEATED_QUERY_THRESHOLD = 5
+PROFILES_INSTRUMENTATION_SAMPLES = 1000
+
+
 LOGIN_REDIRECT_URL = 'profile_edit'  # redirect after login
 LOGOUT_REDIRECT_URL = 'home'     
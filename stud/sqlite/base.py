@@ -0,0 +1,60 @@
+"""
+SQLite backend that retries statements refused with "database is locked".
+
+It behaves like django.db.backends.sqlite3 with one addition. When SQLite
+gives up on a lock after OPTIONS["timeout"] seconds, the statement is tried
+again, up to OPTIONS["busy_retries"] times, with jittered exponential
+backoff starting at OPTIONS["busy_backoff"] seconds. This only happens
+when no transaction is open. That covers autocommit statements, and the
+BEGIN IMMEDIATE that opens every atomic block when
+OPTIONS["transaction_mode"] is "IMMEDIATE". Inside a transaction the error
+is raised as usual: part of the transaction may already have run, so
+only the caller can retry it.
+"""
+import random
+import time
+
+from django.db.backends.sqlite3 import base
+
+BUSY_ERRORS = ('database is locked', 'database is busy')
+
+
+class SQLiteCursorWrapper(base.SQLiteCursorWrapper):
+    retries = 0
+    backoff = 0.05
+
+    def _retrying(self, call):
+        attempt = 0
+        while True:
+            try:
+                return call()
+            except base.Database.OperationalError as exc:
+                if (
+                    attempt >= self.retries
+                    or self.connection.in_transaction
+                    or not any(message in str(exc) for message in BUSY_ERRORS)
+                ):
+                    raise
+            time.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+            attempt += 1
+
+    def execute(self, query, params=None):
+        return self._retrying(lambda: super(SQLiteCursorWrapper, self).execute(query, params))
+
+    def executemany(self, query, param_list):
+        param_list = list(param_list)
+        return self._retrying(lambda: super(SQLiteCursorWrapper, self).executemany(query, param_list))
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        self.busy_retries = kwargs.pop('busy_retries', 3)
+        self.busy_backoff = kwargs.pop('busy_backoff', 0.05)
+        return kwargs
+
+    def create_cursor(self, name=None):
+        cursor = self.connection.cursor(factory=SQLiteCursorWrapper)
+        cursor.retries = self.busy_retries
+        cursor.backoff = self.busy_backoff
+        return cursor